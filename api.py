@@ -0,0 +1,167 @@
+"""JSON API for Blogly, mounted at /api/v1.
+
+    GET /api/v1/users, /posts, /tags          keyset-paginated listings
+    GET /api/v1/users/<id>, /posts/<id>, /tags/<id>
+    GET /api/v1/posts/export                  every post as NDJSON
+
+Every endpoint takes ?fields=a,b,c to choose the fields returned and only
+selects those columns; listings take the same after/before/limit arguments
+as the HTML pages. Rows are read as tuples, never as ORM objects.
+
+The export streams from a server-side cursor a batch at a time, so memory
+stays flat however many posts there are and the first bytes go out as soon
+as the first batch is read. Pass ?after=<post id> to resume an export.
+"""
+
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, jsonify, request, stream_with_context
+from werkzeug.exceptions import HTTPException
+
+from models import db, User, Post, Tag, PostTag
+from queries import paginate
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+EXPORT_BATCH_SIZE = 1000
+
+USER_FIELDS = {'id': User.id, 'first_name': User.first_name, 'last_name': User.last_name,
+               'image_url': User.image_url, 'post_count': User.post_count, 'updated_at': User.updated_at}
+POST_FIELDS = {'id': Post.id, 'title': Post.title, 'content': Post.content, 'user_id': Post.user_id,
+               'created_at': Post.created_at, 'updated_at': Post.updated_at}
+TAG_FIELDS = {'id': Tag.id, 'name': Tag.name, 'post_count': Tag.post_count, 'updated_at': Tag.updated_at}
+
+# fields of posts that are not columns of the posts table
+POST_EXTRA_FIELDS = ('tags',)
+
+
+# the 404 handler is named as well, as it would otherwise lose to the HTML one
+@api.errorhandler(404)
+@api.errorhandler(HTTPException)
+def json_error(e):
+    return jsonify({'error': e.name, 'status': e.code}), e.code
+
+
+def encode(value):
+    """json.dumps default= hook for the column types that JSON lacks"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def requested_fields(fields, extra=()):
+    """the ?fields= names, in order, or every field; 400 for unknown names"""
+    if 'fields' not in request.args:
+        return [*fields, *extra]
+    names = [name.strip() for name in request.args['fields'].split(',') if name.strip()]
+    if not names or any(name not in fields and name not in extra for name in names):
+        abort(400)
+    return list(dict.fromkeys(names))
+
+
+def column_select(fields, names, required=()):
+    """select the columns for names plus any required ones, as Row tuples"""
+    selected = list(dict.fromkeys([n for n in names if n in fields] + list(required)))
+    return db.select(*(fields[n].label(n) for n in selected))
+
+
+def tag_names_for_posts(post_ids):
+    """{post id: [tag names]} for the given posts, in one query"""
+    tags = {post_id: [] for post_id in post_ids}
+    if post_ids:
+        rows = db.session.execute(
+            db.select(PostTag.post_id, Tag.name)
+            .join(Tag, Tag.id == PostTag.tag_id)
+            .where(PostTag.post_id.in_(post_ids))
+            .order_by(Tag.name))
+        for post_id, name in rows:
+            tags[post_id].append(name)
+    return tags
+
+
+def records(rows, names):
+    """turn Row tuples into dicts of the requested fields"""
+    tags = tag_names_for_posts([row.id for row in rows]) if 'tags' in names else None
+    return [{name: tags[row.id] if name == 'tags' else getattr(row, name) for name in names}
+            for row in rows]
+
+
+def listing(fields, keys, descending=False, extra=()):
+    """a page of the columns asked for, ordered and paginated by keys"""
+    names = requested_fields(fields, extra)
+    required = [k.key for k in keys] + (['id'] if 'tags' in names else [])
+    try:
+        page = paginate(column_select(fields, names, required), keys,
+                        after=request.args.get('after'),
+                        before=request.args.get('before'),
+                        limit=request.args.get('limit', type=int),
+                        descending=descending, rows=True)
+    except ValueError:
+        abort(400)
+    return json_response({'data': records(page.items, names),
+                          'next_cursor': page.next_cursor,
+                          'prev_cursor': page.prev_cursor})
+
+
+def detail(fields, row_id, extra=()):
+    names = requested_fields(fields, extra)
+    required = ['id'] if 'tags' in names else []
+    row = db.session.execute(column_select(fields, names, required).where(fields['id'] == row_id)).first()
+    if row is None:
+        abort(404)
+    return json_response({'data': records([row], names)[0]})
+
+
+def json_response(payload):
+    return Response(json.dumps(payload, default=encode), mimetype='application/json')
+
+
+@api.route('/users')
+def list_users():
+    return listing(USER_FIELDS, (User.id,))
+
+
+@api.route('/users/<int:user_id>')
+def get_user(user_id):
+    return detail(USER_FIELDS, user_id)
+
+
+@api.route('/posts')
+def list_posts():
+    return listing(POST_FIELDS, (Post.created_at, Post.id), descending=True, extra=POST_EXTRA_FIELDS)
+
+
+@api.route('/posts/<int:post_id>')
+def get_post(post_id):
+    return detail(POST_FIELDS, post_id, extra=POST_EXTRA_FIELDS)
+
+
+@api.route('/tags')
+def list_tags():
+    return listing(TAG_FIELDS, (Tag.id,))
+
+
+@api.route('/tags/<int:tag_id>')
+def get_tag(tag_id):
+    return detail(TAG_FIELDS, tag_id)
+
+
+@api.route('/posts/export')
+def export_posts():
+    """every post, oldest first, as one JSON object per line"""
+    names = requested_fields(POST_FIELDS, POST_EXTRA_FIELDS)
+    stmt = column_select(POST_FIELDS, names, ['id']).order_by(Post.id)
+    after = request.args.get('after', type=int)
+    if after is not None:
+        stmt = stmt.where(Post.id > after)
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+    def generate():
+        try:
+            for rows in result.partitions():
+                yield ''.join(json.dumps(record, default=encode) + '\n' for record in records(rows, names))
+        finally:
+            result.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
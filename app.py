@@ -1,48 +1,205 @@
 """Blogly application."""
 
-from flask import Flask, request, render_template, redirect, flash
+import click
+from flask import Blueprint, Flask, current_app, request, render_template, redirect, flash, abort
 from models import db, connect_db, User, Post, Tag, PostTag
+from config import Config
+from queries import (paginate, tag_ids_for_names, existing_post_ids, sync_links,
+                     post_ids_for_tag, touch, adjust_post_counts,
+                     tag_counts_for_posts, recount_posts, delete_users, delete_tags,
+                     post_version, user_version, tag_version, feed_version, users_version,
+                     tags_version)
+from conditional import conditional
+from pages import cached_page, purge_pages
+from display import page_views, post_view
+from search import search_posts
+from api import api, json_error
+import avatars
+import compression
+import fragments
+import instrumentation
+import metrics
+import migrations
+import pages
+import read_models
+import replicas
+import tasks
+import templating
+from seed import seed_command
 from flask_debugtoolbar import DebugToolbarExtension
 from datetime import datetime
+import time
+import unicodedata
+
+bp = Blueprint('blogly', __name__, cli_group=None)
+
+def create_app(config=Config):
+    """create a Blogly app configured from config
+
+    Nothing here talks to the database: engines connect on first use, so
+    worker processes can be forked safely after the app is built. Create
+    the schema with `flask init-db` or bring it up to date with
+    `flask migrate`. The debug toolbar is only loaded in debug mode."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if app.debug:
+        DebugToolbarExtension(app)
+    connect_db(app)
+    templating.init_app(app)
+    replicas.init_app(app)
+    tasks.init_app(app)
+    instrumentation.init_app(app)
+    fragments.init_app(app)
+    pages.init_app(app)
+    metrics.init_app(app)
+    avatars.init_app(app)
+    compression.init_app(app)
+    app.register_blueprint(bp)
+    app.register_blueprint(api)
+    app.cli.add_command(seed_command)
+    return app
+
+@bp.cli.command('init-db')
+@click.option('--drop', is_flag=True, help='Drop existing tables first.')
+def init_db(drop):
+    """create the Blogly tables"""
+    if drop:
+        db.drop_all()
+    db.create_all()
+    migrations.stamp(db.engine)
+    click.echo('Created tables')
+
+@bp.cli.command('migrate')
+def migrate():
+    """apply pending schema migrations"""
+    applied = migrations.upgrade(db.engine)
+    click.echo(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+
+@bp.cli.command('compile-templates')
+@click.argument('target', default='compiled_templates')
+def compile_templates(target):
+    """precompile every template for TEMPLATE_PRECOMPILED_DIR"""
+    names = templating.compile_templates(current_app, target)
+    click.echo(f"Compiled {len(names)} templates into {target}")
+
+@bp.cli.command('build-assets')
+def build_assets():
+    """fingerprint and precompress the files in static/"""
+    manifest = compression.build_assets(current_app.static_folder)
+    click.echo(f"Built {len(manifest)} assets into static/{compression.BUILD_DIR}")
+
+def read_ids(ids, ids_file):
+    """the ids given as arguments and, one per line, in ids_file"""
+    ids = set(ids)
+    if ids_file is not None:
+        ids.update(int(line) for line in ids_file if line.strip())
+    if not ids:
+        raise click.UsageError('No ids given')
+    return ids
+
+@bp.cli.command('delete-users')
+@click.argument('ids', nargs=-1, type=int)
+@click.option('--ids-file', type=click.File(), help='File of user ids, one per line (- for stdin).')
+def delete_users_command(ids, ids_file):
+    """delete users, with all their posts, by id"""
+    started = time.perf_counter()
+    deleted, post_ids = delete_users(read_ids(ids, ids_file))
+    db.session.commit()
+    purge_pages('feed', 'tags')
+    click.echo(f"Deleted {deleted} users and {len(post_ids)} posts in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+@bp.cli.command('delete-tags')
+@click.argument('ids', nargs=-1, type=int)
+@click.option('--ids-file', type=click.File(), help='File of tag ids, one per line (- for stdin).')
+def delete_tags_command(ids, ids_file):
+    """delete tags by id, untagging their posts"""
+    started = time.perf_counter()
+    deleted, post_ids = delete_tags(read_ids(ids, ids_file))
+    db.session.commit()
+    purge_pages('feed', 'tags')
+    click.echo(f"Deleted {deleted} tags from {len(post_ids)} posts in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+@bp.cli.command('worker')
+@click.option('--burst', is_flag=True, help='Exit once no job is runnable.')
+@click.option('--poll-interval', type=float, default=1.0, show_default=True, help='Seconds between polls when idle.')
+def worker(burst, poll_interval):
+    """run background tasks from the jobs table (TASK_QUEUE=database)"""
+    queue = current_app.extensions['tasks']
+    if not isinstance(queue, tasks.TableQueue):
+        raise click.UsageError('The worker runs jobs from the database queue; set TASK_QUEUE=database')
+    done, failed = queue.work(burst=burst, poll_interval=poll_interval)
+    click.echo(f"Ran {done + failed} jobs: {done} succeeded, {failed} failed")
+
+@bp.cli.command('reconcile-counts')
+def reconcile_counts():
+    """recompute the post counts of every user and tag"""
+    fixed = recount_posts(db.session)
+    db.session.commit()
+    purge_pages('tags')
+    click.echo(f"Fixed {fixed} post counts")
 
-app = Flask(__name__)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///blogly'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
-app.config['SECRET_KEY'] = "secret"
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-
-debug=DebugToolbarExtension(app)
-
-app.app_context().push()
+@tasks.task
+def reconcile_post_counts():
+    """recount every post_count, in the background after a delete
 
-connect_db(app)
-db.create_all()
+    A post tagged by a concurrent request while its author or tag is
+    deleted can leave a count off by one; this puts it right."""
+    recount_posts(db.session)
+    db.session.commit()
 
-@app.route('/')
+@bp.route('/')
+@cached_page('feed', feed_version)
+@conditional(feed_version)
 def home_page():
     """home page displays 5 most recent posts"""
-    posts = db.session.execute(db.select(Post).order_by(Post.created_at.desc()).limit(5)).scalars()
+    posts = read_models.post_views(db.session.execute(read_models.feed_select().limit(5)))
     return render_template("home.html", posts=posts)
 
-@app.errorhandler(404)
-def page_not_found():
+def paginate_request(stmt, keys, descending=False, rows=False):
+    """paginate stmt using the after/before/limit query string arguments"""
+    try:
+        return paginate(stmt, keys,
+                        after=request.args.get('after'),
+                        before=request.args.get('before'),
+                        limit=request.args.get('limit', type=int),
+                        descending=descending, rows=rows)
+    except ValueError:
+        abort(400)
+
+USER_SORTS = {'name': ((User.last_name, User.first_name, User.id), False),
+              'popular': ((User.post_count, User.id), True)}
+TAG_SORTS = {'name': ((Tag.name,), False),
+             'popular': ((Tag.post_count, Tag.id), True)}
+
+def listing_sort(sorts):
+    """(keys, descending) for the ?sort= argument, 400 if it is unknown"""
+    sort = request.args.get('sort', 'name')
+    if sort not in sorts:
+        abort(400)
+    return sorts[sort]
+
+@bp.app_errorhandler(404)
+def page_not_found(e):
+    # unmatched URLs never reach the api blueprint's own handlers
+    if request.path.startswith(f"{api.url_prefix}/"):
+        return json_error(e)
     return render_template('404.html'), 404
 
 #USER ROUTES
-@app.route('/users')
+@bp.route('/users')
+@conditional(users_version)
 def show_user_list():
-    """shows a list of all site users"""
-    users = db.session.execute(db.select(User).order_by(User.last_name, User.first_name)).scalars()
-    return render_template("users.html", users=users)
+    """shows a list of all site users, by name or by number of posts"""
+    keys, descending = listing_sort(USER_SORTS)
+    users = paginate_request(read_models.user_select(), keys, descending=descending, rows=True)
+    return render_template("users.html", users=page_views(users, read_models.user_views))
 
-@app.route('/users/new')
+@bp.route('/users/new')
 def show_add_form():
     """shows a form for adding new users"""
     return render_template("newuser.html")
 
-@app.route('/users/new', methods=["POST"])
+@bp.route('/users/new', methods=["POST"])
 def add_user():
     """adds user to the database"""
     first_name = request.form["first-name"]
@@ -63,20 +220,21 @@ def add_user():
     flash('New user created', 'success')
     return redirect('/users')
 
-@app.route('/users/<user_id>')
+@bp.route('/users/<user_id>')
+@conditional(user_version)
 def show_user(user_id):
     """shows details of a user"""
     user = User.query.get_or_404(user_id)
-    posts = db.session.execute(db.select(Post).where(Post.user_id == user_id)).scalars()
+    posts = read_models.post_views(db.session.execute(read_models.feed_select().where(Post.user_id == user_id)))
     return render_template('userdetail.html', user=user, posts=posts)
 
-@app.route('/users/<user_id>/edit')
+@bp.route('/users/<user_id>/edit')
 def show_edit_form(user_id):
     """shows a form for editing user information"""
     user=User.query.get_or_404(user_id)
     return render_template("useredit.html", user=user)
 
-@app.route('/users/<user_id>/edit', methods=["POST"])
+@bp.route('/users/<user_id>/edit', methods=["POST"])
 def edit_user(user_id):
     """edits user information in the database"""
     first_name = request.form["first-name"]
@@ -91,39 +249,48 @@ def edit_user(user_id):
     if image_url == '':
         image_url = 'https://static.vecteezy.com/system/resources/previews/002/318/271/original/user-profile-icon-free-vector.jpg'
     user = User.query.get_or_404(user_id)
+    renamed = (user.first_name, user.last_name) != (first_name, last_name)
     user.first_name = first_name
     user.last_name = last_name
     user.image_url = image_url
     db.session.add(user)
+    if renamed:
+        # the author's name is on each of their post cards
+        db.session.execute(db.update(Post).where(Post.user_id == user.id).values(updated_at=datetime.now())
+                           .execution_options(synchronize_session=False))
     db.session.commit()
+    purge_pages('feed')
     flash('User profile saved', 'success')
     return redirect('/users')
 
-@app.route('/users/<user_id>/delete', methods=["POST"])
+@bp.route('/users/<user_id>/delete', methods=["POST"])
 def delete_user(user_id):
     """deletes user from the database"""
-    u=User.query.get(user_id)
-    db.session.delete(u)
+    u = User.query.get_or_404(user_id)
+    delete_users([u.id])
     db.session.commit()
+    purge_pages('feed', 'tags')
+    tasks.enqueue(reconcile_post_counts, key=f"reconcile-counts:user:{u.id}")
     flash('User profile deleted', 'success')
     return redirect('/users')
 
 #POST ROUTES
 
-@app.route('/posts')
+@bp.route('/posts')
+@conditional(feed_version)
 def show_posts():
-    """shows all posts"""
-    posts = db.session.execute(db.select(Post).order_by(Post.created_at.desc())).scalars()
-    return render_template('posts.html', posts=posts)
+    """shows all posts, a page at a time"""
+    posts = paginate_request(read_models.feed_select(), (Post.created_at, Post.id), descending=True, rows=True)
+    return render_template('posts.html', posts=page_views(posts, read_models.post_views))
 
-@app.route('/users/<user_id>/posts/new')
+@bp.route('/users/<user_id>/posts/new')
 def show_new_post_form(user_id):
     """shows a form for adding a new post"""
     user = User.query.get_or_404(user_id)
     tags = db.session.execute(db.select(Tag).order_by(Tag.name)).scalars()
     return render_template("newpost.html", user=user, tags=tags)
 
-@app.route('/users/<user_id>/posts/new', methods=["POST"])
+@bp.route('/users/<user_id>/posts/new', methods=["POST"])
 def add_post(user_id):
     """adds new post to appropriate user"""
     title = request.form['title']
@@ -136,34 +303,30 @@ def add_post(user_id):
         return redirect(f'/users/{user_id}/posts/new')
     new_post = Post(title = title, content = content, created_at = datetime.now(), user_id = user_id)
     db.session.add(new_post)
+    db.session.flush()
+    tag_ids = tag_ids_for_names(request.form.getlist('tag'))
+    sync_links(PostTag.post_id, new_post.id, PostTag.tag_id, tag_ids, existing=())
+    adjust_post_counts(User, {user_id: 1})
     db.session.commit()
-    tags = request.form.getlist('tag')
-    for tag in tags: 
-        print('************')
-        print(tag)
-        print('**************')
-        current_tag = db.session.query(Tag).filter(Tag.name == tag).first()
-        new_post.tags.append(current_tag)
-        db.session.add(new_post)
-        db.session.commit()
+    purge_pages('feed', 'tags')
     flash('New post added', 'success')
     return redirect(f'/users/{user_id}')
 
-@app.route('/posts/<post_id>')
+@bp.route('/posts/<post_id>')
+@conditional(post_version)
 def show_post(post_id):
     """shows an individual post"""
-    post = Post.query.get_or_404(post_id)
-    user = post.user
-    return render_template('postdetail.html', post=post, user=user)
+    post = post_view(Post.query.get_or_404(post_id))
+    return render_template('postdetail.html', post=post, user=post.user)
 
-@app.route('/posts/<post_id>/edit')
+@bp.route('/posts/<post_id>/edit')
 def show_post_edit_form(post_id):
     "shows the form for editing a post"
     post = Post.query.get_or_404(post_id)
     tags = db.session.execute(db.select(Tag).order_by(Tag.name)).scalars()
     return render_template('postedit.html', post=post, tags=tags)
 
-@app.route('/posts/<post_id>/edit', methods=["POST"])
+@bp.route('/posts/<post_id>/edit', methods=["POST"])
 def edit_post(post_id):
     title = request.form['title']
     if title == '':
@@ -176,103 +339,132 @@ def edit_post(post_id):
     post = Post.query.get_or_404(post_id)
     post.title = title
     post.content = content
-    db.session.add(post)
-    db.session.commit()
-    PostTag.query.filter_by(post_id=post_id).delete()
+    tag_ids = tag_ids_for_names(request.form.getlist('tag'))
+    changed = sync_links(PostTag.post_id, post.id, PostTag.tag_id, tag_ids)
+    if changed:
+        post.updated_at = datetime.now()
     db.session.commit()
-    tags = request.form.getlist('tag')
-    for tag in tags:
-        current_tag = db.session.query(Tag).filter(Tag.name == tag).first()
-        post.tags.append(current_tag)
-        db.session.add(post)
-        db.session.commit()
+    purge_pages('feed', 'tags')
     flash('Post changes saved', 'success')
     return redirect(f'/posts/{post_id}')
 
-@app.route('/posts/<post_id>/delete', methods=["POST"])
+@bp.route('/posts/<post_id>/delete', methods=["POST"])
 def delete_post(post_id):
     """deletes post"""
     post = Post.query.get_or_404(post_id)
     user = post.user
     p = Post.query.get(post_id)
+    adjust_post_counts(Tag, {tag_id: -n for tag_id, n in tag_counts_for_posts([p.id]).items()})
+    adjust_post_counts(User, {user.id: -1})
     db.session.delete(p)
     db.session.commit()
+    purge_pages('feed', 'tags')
     flash('Post deleted', 'success')
     return redirect(f'/users/{user.id}')
 
+@bp.route('/search')
+def search():
+    """searches post titles and content"""
+    q = request.args.get('q', '')
+    try:
+        results = search_posts(q,
+                               after=request.args.get('after'),
+                               before=request.args.get('before'),
+                               limit=request.args.get('limit', type=int))
+    except ValueError:
+        abort(400)
+    return render_template('search.html', q=q, results=results)
+
 #TAG ROUTES
 
-@app.route('/tags')
+def has_control_characters(text):
+    """does text contain a control character, such as the separators of read_models?"""
+    return any(unicodedata.category(char) == 'Cc' for char in text)
+
+@bp.route('/tags')
+@cached_page('tags', tags_version)
+@conditional(tags_version)
 def show_tags():
-    """shows all tags"""
-    tags = db.session.execute(db.select(Tag).order_by(Tag.name)).scalars()
-    return render_template('tags.html', tags=tags)
+    """shows all tags, by name or by number of posts"""
+    keys, descending = listing_sort(TAG_SORTS)
+    tags = db.session.execute(read_models.tag_select().order_by(*(k.desc() if descending else k for k in keys)))
+    return render_template('tags.html', tags=read_models.tag_views(tags))
 
-@app.route('/tags/<tag_id>')
+@bp.route('/tags/<tag_id>')
+@conditional(tag_version)
 def show_tag(tag_id):
     """shows an individual tag and the associated posts"""
     tag = Tag.query.get_or_404(tag_id)
-    return render_template('tagdetail.html', tag=tag)
+    posts = paginate_request(read_models.feed_select().join(PostTag, PostTag.post_id == Post.id).where(PostTag.tag_id == tag.id),
+                             (Post.created_at, Post.id), descending=True, rows=True)
+    return render_template('tagdetail.html', tag=tag, posts=page_views(posts, read_models.post_views))
 
-@app.route('/tags/new')
+@bp.route('/tags/new')
 def show_new_tag_form():
     """shows a form for adding a new tag"""
     posts = db.session.execute(db.select(Post).order_by(Post.created_at)).scalars()
     return render_template("newtag.html", posts=posts)
 
-@app.route('/tags/new', methods=["POST"])
+@bp.route('/tags/new', methods=["POST"])
 def add_tag():
     """adds new tag to database"""
     name = request.form['name']
     if name == '':
         flash('No name added', 'error')
         return redirect('/tags/new')
+    if has_control_characters(name):
+        flash('Tag names cannot contain control characters', 'error')
+        return redirect('/tags/new')
     new_tag = Tag(name= name)
     db.session.add(new_tag)
+    db.session.flush()
+    post_ids = existing_post_ids(request.form.getlist('post', type=int))
+    sync_links(PostTag.tag_id, new_tag.id, PostTag.post_id, post_ids, existing=())
+    touch(Post, post_ids)
     db.session.commit()
-    posts = request.form.getlist('post')
-    for post in posts:
-        current_post = db.session.query(Post).filter(Post.title == post).first()
-        new_tag.posts.append(current_post)
-        db.session.add(new_tag)
-        db.session.commit()
+    purge_pages('feed', 'tags')
     flash('New tag added', 'success')
     return redirect('/tags')
 
-@app.route('/tags/<tag_id>/edit')
+@bp.route('/tags/<tag_id>/edit')
 def show_tag_edit_form(tag_id):
     "shows the form for editing a tag"
     tag = Tag.query.get_or_404(tag_id)
     posts = db.session.execute(db.select(Post).order_by(Post.created_at)).scalars()
     return render_template('tagedit.html', tag=tag, posts=posts)
 
-@app.route('/tags/<tag_id>/edit', methods=["POST"])
+@bp.route('/tags/<tag_id>/edit', methods=["POST"])
 def edit_tag(tag_id):
     name = request.form['name']
     if name == '':
         flash('No name added', 'error')
         return redirect(f'/tags/{tag_id}/edit')
+    if has_control_characters(name):
+        flash('Tag names cannot contain control characters', 'error')
+        return redirect(f'/tags/{tag_id}/edit')
     tag = Tag.query.get_or_404(tag_id)
+    renamed = tag.name != name
     tag.name = name
-    db.session.add(tag)
-    db.session.commit()
-    PostTag.query.filter_by(tag_id=tag_id).delete()
+    post_ids = existing_post_ids(request.form.getlist('post', type=int))
+    affected = post_ids_for_tag(tag.id) | post_ids if renamed else set()
+    changed = sync_links(PostTag.tag_id, tag.id, PostTag.post_id, post_ids)
+    if changed:
+        tag.updated_at = datetime.now()
+    affected |= changed
+    touch(Post, affected)
     db.session.commit()
-    posts = request.form.getlist('post')
-    for post in posts:
-        current_post = db.session.query(Post).filter(Post.title == post).first()
-        tag.posts.append(current_post)
-        db.session.add(tag)
-        db.session.commit()
+    purge_pages('feed', 'tags')
     flash('Tag changes saved', 'success')
     return redirect(f'/tags/{tag_id}')
 
-@app.route('/tags/<tag_id>/delete', methods=["POST"])
+@bp.route('/tags/<tag_id>/delete', methods=["POST"])
 def delete_tag(tag_id):
     """deletes tag"""
-    t = Tag.query.get(tag_id)
-    db.session.delete(t)
+    t = Tag.query.get_or_404(tag_id)
+    delete_tags([t.id])
     db.session.commit()
+    purge_pages('feed', 'tags')
+    tasks.enqueue(reconcile_post_counts, key=f"reconcile-counts:tag:{t.id}")
     flash('Tag deleted', 'success')
     return redirect('/tags')
 
@@ -0,0 +1,149 @@
+"""Async Blogly read routes.
+
+The sync app ties up a worker thread for every database round trip, so it
+serves at most as many requests at once as it has threads. This Quart app
+serves the read-heavy routes (home, posts, post, user and tag pages) on one
+event loop instead. It uses SQLAlchemy's AsyncSession over asyncpg, or
+aiosqlite for a local SQLite database, with the models, queries and
+templates of the sync app. Post fragments use the sync app's cache keys and
+FRAGMENT_CACHE_URL: with a redis:// URL both apps share one cache. The keys
+carry each post's updated_at, so a private memory:// cache never serves a
+card older than the sync app's last write either.
+
+Writes, forms, search and the API stay on the sync app. A deployment routes
+GETs of these paths here and everything else to app.py. Run it with:
+
+    hypercorn 'async_app:create_async_app()'
+"""
+
+from functools import partial
+
+from quart import Blueprint, Quart, abort, current_app, g, render_template, request
+from markupsafe import Markup
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload, selectinload
+
+from avatars import avatar_url
+from compression import asset_url, load_manifest
+from config import Config, async_database_url, async_engine_options
+from display import page_views, post_view
+from fragments import fragment_key, make_fragment_cache
+from models import User, Post, Tag, PostTag
+from queries import make_page, page_statement
+import read_models
+
+bp = Blueprint('blogly', __name__)
+
+
+def create_async_app(config=Config):
+    """create the async Blogly app configured from config
+
+    Like create_app(), nothing connects to the database until the first
+    request."""
+    app = Quart(__name__)
+    app.config.from_object(config)
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    engine = create_async_engine(async_database_url(uri), **async_engine_options(uri))
+    app.extensions['async_engine'] = engine
+    app.extensions['async_session'] = async_sessionmaker(engine, expire_on_commit=False)
+    app.extensions['fragment_cache'] = make_fragment_cache(app.config)
+    app.jinja_env.globals['post_fragment'] = post_fragment
+    app.jinja_env.globals['avatar_url'] = avatar_url
+    app.extensions['asset_manifest'] = load_manifest(app.static_folder)
+    app.jinja_env.globals['asset_url'] = partial(asset_url, app.extensions['asset_manifest'])
+    app.register_blueprint(bp)
+
+    @app.after_serving
+    async def dispose_engine():
+        await engine.dispose()
+
+    return app
+
+
+@bp.before_app_request
+async def open_session():
+    g.session = current_app.extensions['async_session']()
+
+
+@bp.teardown_app_request
+async def close_session(exc):
+    session = g.pop('session', None)
+    if session is not None:
+        await session.close()
+
+
+async def post_fragment(post, variant='card'):
+    """async post_fragment() from fragments.py, sharing its cache keys
+
+    The templates' async Jinja environment awaits the call."""
+    cache = current_app.extensions['fragment_cache']
+    key = fragment_key(post, variant, current_app.config['FRAGMENT_CACHE_VERSION'])
+    html = cache.get(key)
+    if html is None:
+        html = await render_template(f'post_{variant}.html', post=post)
+        cache.set(key, html)
+    return Markup(html)
+
+
+async def paginate_request(stmt, keys, descending=False):
+    """paginate_request() from app.py for column selects, awaiting the page query"""
+    after, before = request.args.get('after'), request.args.get('before')
+    try:
+        stmt, limit = page_statement(stmt, keys, after, before,
+                                     limit=request.args.get('limit', type=int), descending=descending)
+    except ValueError:
+        abort(400)
+    rows = (await g.session.execute(stmt)).all()
+    return make_page(rows, keys, limit, after, before)
+
+
+async def get_or_404(model, row_id, *options):
+    row = await g.session.get(model, row_id, options=options)
+    if row is None:
+        abort(404)
+    return row
+
+
+@bp.route('/')
+async def home_page():
+    """home page displays 5 most recent posts"""
+    posts = read_models.post_views(await g.session.execute(read_models.feed_select().limit(5)))
+    return await render_template("home.html", posts=posts)
+
+
+@bp.route('/posts')
+async def show_posts():
+    """shows all posts, a page at a time"""
+    posts = await paginate_request(read_models.feed_select(), (Post.created_at, Post.id), descending=True)
+    return await render_template('posts.html', posts=page_views(posts, read_models.post_views))
+
+
+@bp.route('/posts/<int:post_id>')
+async def show_post(post_id):
+    """shows an individual post"""
+    post = post_view(await get_or_404(Post, post_id, joinedload(Post.user), selectinload(Post.tags)))
+    return await render_template('postdetail.html', post=post, user=post.user)
+
+
+@bp.route('/users/<int:user_id>')
+async def show_user(user_id):
+    """shows details of a user"""
+    user = await get_or_404(User, user_id)
+    posts = read_models.post_views(
+        await g.session.execute(read_models.feed_select().where(Post.user_id == user_id)))
+    return await render_template('userdetail.html', user=user, posts=posts)
+
+
+@bp.route('/tags/<int:tag_id>')
+async def show_tag(tag_id):
+    """shows an individual tag and the associated posts"""
+    tag = await get_or_404(Tag, tag_id)
+    posts = await paginate_request(
+        read_models.feed_select().join(PostTag, PostTag.post_id == Post.id).where(PostTag.tag_id == tag.id),
+        (Post.created_at, Post.id), descending=True)
+    return await render_template('tagdetail.html', tag=tag, posts=page_views(posts, read_models.post_views))
+
+
+@bp.app_errorhandler(404)
+async def page_not_found(e):
+    return await render_template('404.html'), 404
@@ -0,0 +1,330 @@
+"""Avatar thumbnails for Blogly, served at /avatars/<user_id>.
+
+User.image_url points at full-size images on other hosts. The first request
+for a user's avatar fetches the image once, and a process pool resizes it to
+the requested size, one of AVATAR_SIZES. Both are kept in AVATAR_CACHE_DIR:
+
+    urls/<sha256 of url>        sha256 of the image fetched from that url
+    <ab>/<sha256>               the image, by content
+    <ab>/<sha256>-<size>.jpg    its square JPEG thumbnails
+
+Users sharing an image, such as the default avatar, share its files. Each
+process keeps a running total of the cache's size, recounted from the
+directory every RESCAN_INTERVAL seconds to pick up other workers' files.
+Once it passes AVATAR_CACHE_MAX_BYTES, the least recently used files are
+removed.
+
+Templates link to avatar_url(user), which carries a hash of the image URL,
+so the response can be cached for a year: a new image_url means a new link.
+Images are only fetched over http(s), from public addresses unless
+AVATAR_ALLOW_PRIVATE_HOSTS is set. Each host is resolved once, and the
+connection goes to the address that was checked. Redirects are followed
+by hand, up to MAX_REDIRECTS, and each hop is checked the same way.
+Avatars that cannot be fetched or decoded redirect to the original URL.
+"""
+
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import multiprocessing
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+from flask import abort, current_app, redirect, request, send_file
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from models import db, User
+
+log = logging.getLogger('blogly.avatars')
+
+ONE_YEAR = 365 * 24 * 3600
+MAX_REDIRECTS = 3
+RESCAN_INTERVAL = 300
+LOCK_STRIPES = 64
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class AvatarError(Exception):
+    """An avatar image could not be fetched or resized"""
+
+
+def make_thumbnail(data, size):
+    """square JPEG thumbnail, size pixels wide, of the image in data
+
+    Runs in the process pool, so it only takes and returns bytes."""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    thumbnail.save(out, 'JPEG', quality=85, optimize=True)
+    return out.getvalue()
+
+
+def url_version(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:12]
+
+
+def check_host(url, allow_private=False):
+    """the address to fetch url from; raise AvatarError unless url is http(s) on a public address
+
+    The host is resolved once here, so the caller must connect to the
+    returned address rather than resolve the host again."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise AvatarError(f"not an http(s) url: {url}")
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port, type=socket.SOCK_STREAM)]
+    except (OSError, ValueError) as e:
+        raise AvatarError(f"cannot resolve {parts.hostname}") from e
+    if not allow_private:
+        for address in addresses:
+            if not ipaddress.ip_address(address.split('%')[0]).is_global:
+                raise AvatarError(f"{parts.hostname} is not a public address")
+    return addresses[0]
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection to host that goes to address, without resolving host again"""
+
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(PinnedHTTPConnection):
+    """A PinnedHTTPConnection over TLS, verifying the certificate of host"""
+
+    default_port = http.client.HTTPS_PORT
+
+    def connect(self):
+        super().connect()
+        self.sock = ssl.create_default_context().wrap_socket(self.sock, server_hostname=self.host)
+
+
+def fetch(url, timeout, max_bytes, allow_private=False):
+    """the body of url, refusing anything over max_bytes
+
+    Every hop, redirects included, is checked with check_host()."""
+    for _ in range(MAX_REDIRECTS + 1):
+        address = check_host(url, allow_private)
+        parts = urlsplit(url)
+        connection_class = PinnedHTTPSConnection if parts.scheme == 'https' else PinnedHTTPConnection
+        conn = connection_class(parts.hostname, parts.port, address, timeout)
+        target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        try:
+            conn.request('GET', target, headers={'User-Agent': 'Blogly avatar proxy'})
+            resp = conn.getresponse()
+            if resp.status in REDIRECT_STATUSES and resp.getheader('Location'):
+                url = urljoin(url, resp.getheader('Location'))
+                continue
+            if resp.status != 200:
+                raise AvatarError(f"fetching {url} failed: {resp.status} {resp.reason}")
+            data = resp.read(max_bytes + 1)
+        except (OSError, http.client.HTTPException) as e:
+            raise AvatarError(f"fetching {url} failed: {e}") from e
+        finally:
+            conn.close()
+        if len(data) > max_bytes:
+            raise AvatarError(f"{url} is larger than {max_bytes} bytes")
+        return data
+    raise AvatarError(f"too many redirects fetching {url}")
+
+
+class AvatarCache:
+    """Content-addressed files under directory, bounded to max_bytes"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None
+        self.scanned_at = None
+        self._lock = threading.Lock()
+
+    def url_path(self, url):
+        return os.path.join(self.directory, 'urls', hashlib.sha256(url.encode()).hexdigest())
+
+    def path(self, digest, size=None):
+        name = digest if size is None else f"{digest}-{size}.jpg"
+        return os.path.join(self.directory, digest[:2], name)
+
+    def digest_for(self, url):
+        """sha256 of the image last fetched from url, if its file is still cached"""
+        try:
+            with open(self.url_path(url)) as f:
+                digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return digest if os.path.exists(self.path(digest)) else None
+
+    def get(self, path):
+        """path if it is cached, marking it as recently used"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, path, data):
+        """write data to path atomically, then evict if the cache is too big"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp, path)
+        with self._lock:
+            if self.size is not None:
+                self.size += len(data) - replaced
+            due = self.scanned_at is None or time.monotonic() - self.scanned_at >= RESCAN_INTERVAL
+            if not due and self.size <= self.max_bytes:
+                return path
+        self.evict()
+        return path
+
+    def store_image(self, url, data):
+        """keep data as the image of url; return its digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.get(self.path(digest)) is None:
+            self.put(self.path(digest), data)
+        self.put(self.url_path(url), digest.encode())
+        return digest
+
+    def files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def evict(self):
+        """recount the cache, removing least recently used files until it is back under 90% of max_bytes"""
+        with self._lock:
+            files = sorted(self.files())
+            total = sum(size for _, size, _ in files)
+            if total > self.max_bytes:
+                target = self.max_bytes * 0.9
+                for _, size, path in files:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+            self.size = total
+            self.scanned_at = time.monotonic()
+
+
+class Avatars:
+    """Fetches, resizes and caches the avatars of one app"""
+
+    def __init__(self, config):
+        self.sizes = tuple(config['AVATAR_SIZES'])
+        self.cache = AvatarCache(config['AVATAR_CACHE_DIR'], config['AVATAR_CACHE_MAX_BYTES'])
+        self.processes = config['AVATAR_PROCESSES']
+        self.timeout = config['AVATAR_FETCH_TIMEOUT']
+        self.max_source_bytes = config['AVATAR_MAX_SOURCE_BYTES']
+        self.allow_private = config['AVATAR_ALLOW_PRIVATE_HOSTS']
+        self._executor = None
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._lock = threading.Lock()
+
+    def executor(self):
+        """the resizing process pool, started on first use so the app can be built before forking"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def resize(self, data, size):
+        if not self.processes:
+            return make_thumbnail(data, size)
+        return self.executor().submit(make_thumbnail, data, size).result()
+
+    def lock_for(self, url):
+        """the lock for url, one of LOCK_STRIPES, so that concurrent requests fetch it once"""
+        return self._locks[hash(url) % LOCK_STRIPES]
+
+    def thumbnail(self, url, size):
+        """path of the cached size thumbnail of the image at url
+
+        Raises AvatarError if the image cannot be fetched or decoded."""
+        digest = self.cache.digest_for(url)
+        if digest is not None and self.cache.get(self.cache.path(digest, size)):
+            return self.cache.path(digest, size)
+        with self.lock_for(url):
+            digest = self.cache.digest_for(url)
+            if digest is None:
+                data = fetch(url, self.timeout, self.max_source_bytes, self.allow_private)
+                digest = self.cache.store_image(url, data)
+            path = self.cache.path(digest, size)
+            if self.cache.get(path) is None:
+                try:
+                    with open(self.cache.path(digest), 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError as e:
+                    raise AvatarError(f"the image of {url} was evicted before it was resized") from e
+                try:
+                    thumbnail = self.resize(data, size)
+                except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+                    raise AvatarError(f"cannot resize the image of {url}: {e}") from e
+                self.cache.put(path, thumbnail)
+            return path
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def init_app(app):
+    """serve avatar thumbnails at /avatars/<user_id> and expose avatar_url to templates"""
+    app.extensions['avatars'] = Avatars(app.config)
+    app.jinja_env.globals['avatar_url'] = avatar_url
+    app.add_url_rule('/avatars/<int:user_id>', 'avatar', avatar_view)
+
+
+def avatar_url(user, size=128):
+    """link to the size thumbnail of user's avatar"""
+    return f"/avatars/{user.id}?size={size}&v={url_version(user.image_url)}"
+
+
+def avatar_view(user_id):
+    """the avatar thumbnail of a user, ?size= one of AVATAR_SIZES"""
+    avatars = current_app.extensions['avatars']
+    size = request.args.get('size', 128, type=int)
+    if size not in avatars.sizes:
+        abort(400)
+    url = db.session.execute(db.select(User.image_url).where(User.id == user_id)).scalar()
+    if url is None:
+        abort(404)
+    try:
+        path = avatars.thumbnail(url, size)
+    except AvatarError as e:
+        log.warning("%s", e)
+        return redirect(url)
+    # a link with the current image's version can be cached for good
+    current = request.args.get('v') == url_version(url)
+    response = send_file(path, mimetype='image/jpeg', etag=os.path.basename(path),
+                         max_age=ONE_YEAR if current else 300, conditional=True)
+    if current:
+        response.cache_control.immutable = True
+    response.cache_control.public = True
+    return response
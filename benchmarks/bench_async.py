@@ -0,0 +1,164 @@
+"""Compare the throughput of the sync and async read routes under concurrency.
+
+The sync app runs on a WSGI server with a fixed pool of worker threads, as it
+would under a threaded production server. The async app runs on hypercorn
+with a single event loop. Each server gets its own process. The client opens
+many connections at once from an asyncio loop and rotates through the home,
+posts, post, user and tag pages.
+
+The database is wiped and reseeded (BENCH_DATABASE_URL, blogly_bench by
+default):
+
+    python benchmarks/bench_async.py --posts 20000 --concurrency 8 32 128
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from werkzeug.serving import BaseWSGIServer
+
+# bench_routes puts the repository root on sys.path
+from bench_routes import BenchmarkConfig, QuietHandler, percentile
+from app import create_app
+from async_app import create_async_app
+import seed
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server handling requests on a fixed number of threads"""
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app, handler=QuietHandler)
+        self.executor = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.handle_in_thread, request, client_address)
+
+    def handle_in_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_sync(port, threads):
+    PooledWSGIServer('127.0.0.1', port, create_app(BenchmarkConfig), threads).serve_forever()
+
+
+def serve_async(port):
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f'127.0.0.1:{port}']
+    config.accesslog = None
+    config.errorlog = None
+    config.backlog = 1024
+    asyncio.run(serve(create_async_app(BenchmarkConfig), config))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def fetch(port, path):
+    """GET path over a fresh connection; return the status code"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(response.split(b' ', 2)[1])
+
+
+async def drive(port, paths, requests, concurrency):
+    """send requests GETs with at most concurrency in flight; return latencies and elapsed time"""
+    latencies = []
+    queue = iter(range(requests))
+
+    async def worker():
+        for i in queue:
+            t = time.perf_counter()
+            status = await fetch(port, paths[i % len(paths)])
+            latencies.append(time.perf_counter() - t)
+            if status >= 400:
+                raise RuntimeError(f"{paths[i % len(paths)]} returned {status}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+def bench_paths(users, posts, tags, rng, count=200):
+    """a fixed mix of the five async routes"""
+    makers = [lambda: '/', lambda: '/posts',
+              lambda: f'/posts/{rng.randint(1, posts)}',
+              lambda: f'/users/{rng.randint(1, users)}',
+              lambda: f'/tags/{rng.randint(1, tags)}']
+    return [makers[i % len(makers)]() for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--tags', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=500, help='requests per server and concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--threads', type=int, default=8, help='worker threads of the sync server')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    rng = random.Random(0)
+    with app.app_context():
+        seed.reset_schema()
+        seed.seed(seed.synthetic_tables(args.users, args.posts, args.tags, rng, datetime.now()))
+    paths = bench_paths(args.users, args.posts, args.tags, rng)
+
+    servers = {'sync': (serve_sync, (args.threads,)), 'async': (serve_async, ())}
+    context = multiprocessing.get_context('spawn')
+    print(f"{'server':>6} {'conns':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for name, (target, extra) in servers.items():
+        port = free_port()
+        process = context.Process(target=target, args=(port, *extra), daemon=True)
+        process.start()
+        try:
+            wait_for(port)
+            asyncio.run(drive(port, paths, min(50, args.requests), 4))  # warm up
+            for concurrency in args.concurrency:
+                latencies, elapsed = asyncio.run(drive(port, paths, args.requests, concurrency))
+                ms = [s * 1000 for s in latencies]
+                print(f"{name:>6} {concurrency:>6} {args.requests / elapsed:>9.1f} {percentile(ms, 50):>9.2f} "
+                      f"{percentile(ms, 99):>9.2f} {statistics.fmean(ms):>9.2f}")
+        finally:
+            process.terminate()
+            process.join()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Measure Blogly worker cold start.
+
+Each sample starts a fresh interpreter, imports the app, builds it with
+create_app() and serves one request, timing each step separately. It also
+counts database connections opened before the first request, which should
+be zero.
+
+Every template mode is measured in turn: compiling templates from source, a
+warm TEMPLATE_BYTECODE_CACHE_DIR, and modules precompiled with
+`flask compile-templates` (TEMPLATE_PRECOMPILED_DIR).
+
+    python benchmarks/bench_cold_start.py [--runs N] [--path /] [--modes source precompiled]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, time
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+connects = []
+event.listen(Pool, 'connect', lambda *args: connects.append(time.perf_counter()))
+import app
+imported = time.perf_counter()
+blogly = app.create_app()
+created = time.perf_counter()
+connects_before_request = len(connects)
+with blogly.test_client() as client:
+    status = client.get(%(path)r).status_code
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'connects_before_request': connects_before_request,
+    'status': status,
+}))
+'''
+
+
+MODES = ('source', 'bytecode', 'precompiled')
+
+
+def sample(path, env=None):
+    out = subprocess.run([sys.executable, '-c', CHILD % {'path': path}], cwd=ROOT,
+                         env={**os.environ, **(env or {})},
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def mode_env(mode, workdir):
+    """environment for mode, with its bytecode cache or compiled templates ready"""
+    if mode == 'source':
+        return {}
+    target = os.path.join(workdir, mode)
+    if mode == 'bytecode':
+        env = {'TEMPLATE_BYTECODE_CACHE_DIR': target}
+        sample('/no-such-page', env)  # the 404 page fills the cache for base.html
+        return env
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app:create_app', 'compile-templates', target],
+                   cwd=ROOT, capture_output=True, check=True)
+    return {'TEMPLATE_PRECOMPILED_DIR': target}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        for mode in args.modes:
+            env = mode_env(mode, workdir)
+            if mode == 'bytecode':
+                sample(args.path, env)  # and the path's own templates
+            samples = [sample(args.path, env) for _ in range(args.runs)]
+            print(f"templates: {mode}")
+            for key in ('import_ms', 'create_app_ms', 'first_request_ms'):
+                values = [s[key] for s in samples]
+                print(f"{key:>18}: median {statistics.median(values):8.2f}  max {max(values):8.2f}")
+            print(f"{'connects at boot':>18}: {max(s['connects_before_request'] for s in samples)}")
+            print(f"{'status':>18}: {sorted({s['status'] for s in samples})}")
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Time rendering a feed of post cards from ORM objects and from display views.
+
+Builds posts in memory, with authors and tags shared the way a real feed
+shares them, and renders post_card.html for each. Fragment caching is left
+out so only attribute access and template work are measured. The views
+column includes building the views from the ORM objects.
+
+    python benchmarks/bench_feed_render.py --posts 1000 --runs 20
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# bench_routes puts the repository root on sys.path
+from bench_routes import BenchmarkConfig
+from app import create_app
+from display import post_views
+from models import User, Post, Tag
+
+
+def make_posts(count, users=50, tags=30):
+    people = [User(id=i, first_name=f"First{i}", last_name=f"Last{i}") for i in range(users)]
+    labels = [Tag(id=i, name=f"tag-{i}") for i in range(tags)]
+    start = datetime(2024, 1, 1)
+    return [Post(id=i, title=f"Post {i}", content="benchmark content " * 5,
+                 created_at=start + timedelta(minutes=i), user=people[i % users],
+                 tags=[labels[(i + k) % tags] for k in range(3)])
+            for i in range(count)]
+
+
+def render_feed(template, posts):
+    return [template.render(post=post) for post in posts]
+
+
+def time_runs(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def peak_kib(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context(), app.test_request_context():
+        template = app.jinja_env.get_template('post_card.html')
+        posts = make_posts(args.posts)
+        cases = {'orm': lambda: render_feed(template, posts),
+                 'views': lambda: render_feed(template, post_views(posts))}
+        for fn in cases.values():
+            fn()  # warm up
+        print(f"{'source':>6} {'median ms':>10} {'min ms':>8} {'peak KiB':>9}")
+        for name, fn in cases.items():
+            ms = time_runs(fn, args.runs)
+            print(f"{name:>6} {statistics.median(ms):>10.2f} {min(ms):>8.2f} {peak_kib(fn):>9.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
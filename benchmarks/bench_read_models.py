@@ -0,0 +1,91 @@
+"""Compare loading listings as ORM entities and as column-only read models.
+
+For each listing the ORM case runs the entity query the routes used before
+(feed_query() with its eager loads, or whole User/Tag rows) and builds the
+display views from it. The read model case runs the column-only select from
+read_models.py. Both time the query, fetching and the views, but not the
+template. Peak Python memory comes from a separate tracemalloc pass.
+
+The database is wiped and reseeded (BENCH_DATABASE_URL, blogly_bench by
+default) unless --no-seed is given:
+
+    python benchmarks/bench_read_models.py --posts 100000 --users 2000 --tags 300
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+# bench_routes puts the repository root on sys.path
+from bench_routes import BenchmarkConfig, peak_memory
+from app import create_app
+from display import post_views
+from models import db, User, Post, Tag
+from queries import MAX_PAGE_SIZE, feed_query
+import read_models
+import seed
+
+
+def listings(user_id):
+    """(name, orm loader, read model loader) for each listing"""
+    user_posts = Post.user_id == user_id
+    return [
+        ('feed page', lambda: post_views(db.session.execute(feed_query().limit(MAX_PAGE_SIZE)).scalars()),
+         lambda: read_models.post_views(db.session.execute(read_models.feed_select().limit(MAX_PAGE_SIZE)))),
+        ('user posts', lambda: post_views(db.session.execute(feed_query().where(user_posts)).scalars()),
+         lambda: read_models.post_views(db.session.execute(read_models.feed_select().where(user_posts)))),
+        ('users page', lambda: db.session.execute(db.select(User).order_by(User.last_name, User.first_name, User.id)
+                                                  .limit(MAX_PAGE_SIZE)).scalars().all(),
+         lambda: read_models.user_views(db.session.execute(
+             read_models.user_select().order_by(User.last_name, User.first_name, User.id).limit(MAX_PAGE_SIZE)))),
+        ('all tags', lambda: db.session.execute(db.select(Tag).order_by(Tag.name)).scalars().all(),
+         lambda: read_models.tag_views(db.session.execute(read_models.tag_select().order_by(Tag.name)))),
+    ]
+
+
+def measure(fn, runs):
+    """median ms of fn over runs, each in a fresh session"""
+    samples = []
+    for _ in range(runs):
+        db.session.remove()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    db.session.remove()
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--tags', type=int, default=300)
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--no-seed', action='store_true', help='use the data already in the database')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        if not args.no_seed:
+            seed.reset_schema()
+            seed.seed(seed.synthetic_tables(args.users, args.posts, args.tags, random.Random(0), datetime.now()))
+        # the most prolific author makes for the longest user page
+        user_id = db.session.execute(db.select(User.id).order_by(User.post_count.desc()).limit(1)).scalar()
+        print(f"{'listing':>12} {'orm ms':>8} {'rows ms':>8} {'orm KiB':>9} {'rows KiB':>9}")
+        for name, orm, rows in listings(user_id):
+            orm(), rows()  # warm up
+            orm_ms, rows_ms = measure(orm, args.runs), measure(rows, args.runs)
+            db.session.remove()
+            orm_kib = peak_memory(orm) / 1024
+            db.session.remove()
+            rows_kib = peak_memory(rows) / 1024
+            db.session.remove()
+            print(f"{name:>12} {orm_ms:>8.2f} {rows_ms:>8.2f} {orm_kib:>9.0f} {rows_kib:>9.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
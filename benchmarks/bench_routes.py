@@ -0,0 +1,255 @@
+"""Benchmark every Blogly route and compare against a stored baseline.
+
+Seeds a database of the requested size, then drives each route first through
+the Flask test client and then through a real threaded WSGI server. For every
+route it records p50/p95/p99 latency, throughput, SQL statements per request
+and peak Python memory. Results are compared with a JSON baseline and the
+script exits non-zero when a route regresses past the threshold.
+
+The target database is wiped and reseeded, so it defaults to its own
+blogly_bench database (BENCH_DATABASE_URL overrides it):
+
+    python benchmarks/bench_routes.py --posts 20000 --requests 200
+    python benchmarks/bench_routes.py --update-baseline
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event  # noqa: E402
+from werkzeug.serving import WSGIRequestHandler, make_server  # noqa: E402
+
+from app import create_app  # noqa: E402
+from config import Config, engine_options  # noqa: E402
+from models import db  # noqa: E402
+import seed  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'postgresql:///blogly_bench')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_ECHO = False
+    DEBUG_TB_ENABLED = False
+
+
+def routes(users, posts, tags, rng):
+    """(name, method, path-or-callable, form) for every route in app.py
+
+    Paths are callables where each request should hit a different row."""
+    user = lambda: rng.randint(1, users)
+    post = lambda: rng.randint(1, posts)
+    tag = lambda: rng.randint(1, tags)
+    post_form = lambda: {'title': f'bench {rng.random()}', 'content': 'benchmark content',
+                         'tag': [f"{seed.WORDS[i % len(seed.WORDS)]}-{i}" for i in rng.sample(range(1, tags + 1), min(tags, 3))]}
+    return [
+        ('home', 'GET', lambda: '/', None),
+        ('posts', 'GET', lambda: '/posts', None),
+        ('users', 'GET', lambda: '/users', None),
+        ('tags', 'GET', lambda: '/tags', None),
+        ('user_detail', 'GET', lambda: f'/users/{user()}', None),
+        ('post_detail', 'GET', lambda: f'/posts/{post()}', None),
+        ('tag_detail', 'GET', lambda: f'/tags/{tag()}', None),
+        ('search', 'GET', lambda: '/search?' + urlencode({'q': rng.choice(seed.WORDS[:40])}), None),
+        ('add_user', 'POST', lambda: '/users/new', lambda: {'first-name': 'Bench', 'last-name': 'Mark', 'image-url': ''}),
+        ('add_post', 'POST', lambda: f'/users/{user()}/posts/new', post_form),
+        ('edit_post', 'POST', lambda: f'/posts/{post()}/edit', post_form),
+    ]
+
+
+def percentile(values, pct):
+    """nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, statements, requests, peak):
+    ms = [s * 1000 for s in latencies]
+    return {
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'mean_ms': round(statistics.fmean(ms), 3),
+        'throughput_rps': round(requests / elapsed, 1),
+        'sql_per_request': round(statements / requests, 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+class StatementCounter:
+    """Counts statements run on the engine, across all threads"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def peak_memory(fn, *args):
+    """run fn(*args) under tracemalloc and return the peak bytes allocated
+
+    Tracing slows Python down several times over, so it runs as a separate,
+    shorter pass from the one that is timed."""
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_test_client(app, method, path, form, requests):
+    client = app.test_client()
+
+    def drive(count):
+        latencies = []
+        for _ in range(count):
+            t = time.perf_counter()
+            resp = client.open(path(), method=method, data=form() if form else None)
+            latencies.append(time.perf_counter() - t)
+            if resp.status_code >= 400:
+                raise RuntimeError(f"{method} {resp.request.path} returned {resp.status_code}")
+        return latencies
+
+    with StatementCounter(db.engine) as counter:
+        started = time.perf_counter()
+        latencies = drive(requests)
+        elapsed = time.perf_counter() - started
+    peak = peak_memory(drive, max(1, requests // 10))
+    return summarize(latencies, elapsed, counter.count, requests, peak)
+
+
+def run_server(app, method, path, form, requests, concurrency):
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_port
+
+    def one(_):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        body = urlencode(form(), doseq=True) if form else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+        t = time.perf_counter()
+        conn.request(method, path(), body=body, headers=headers)
+        resp = conn.getresponse()
+        resp.read()
+        conn.close()
+        if resp.status >= 400:
+            raise RuntimeError(f"{method} returned {resp.status}")
+        return time.perf_counter() - t
+
+    def drive(count):
+        with ThreadPoolExecutor(concurrency) as pool:
+            return list(pool.map(one, range(count)))
+
+    try:
+        with StatementCounter(db.engine) as counter:
+            started = time.perf_counter()
+            latencies = drive(requests)
+            elapsed = time.perf_counter() - started
+        peak = peak_memory(drive, max(1, requests // 10))
+    finally:
+        server.shutdown()
+    return summarize(latencies, elapsed, counter.count, requests, peak)
+
+
+def compare(results, baseline, threshold):
+    """list the metrics that regressed by more than threshold (a fraction)"""
+    failures = []
+    for route, modes in results.items():
+        for mode, metrics in modes.items():
+            base = baseline.get(route, {}).get(mode)
+            if not base:
+                continue
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if metrics[key] > base[key] * (1 + threshold):
+                    failures.append(f"{route} [{mode}] {key}: {metrics[key]} > {base[key]}")
+            if metrics['throughput_rps'] < base['throughput_rps'] * (1 - threshold):
+                failures.append(f"{route} [{mode}] throughput_rps: {metrics['throughput_rps']} < {base['throughput_rps']}")
+            if metrics['sql_per_request'] > base['sql_per_request']:
+                failures.append(f"{route} [{mode}] sql_per_request: {metrics['sql_per_request']} > {base['sql_per_request']}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--tags', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=100, help='requests per route and mode')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads for the WSGI server')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed regression, as a fraction')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--no-server', action='store_true', help='only use the test client')
+    parser.add_argument('--route', action='append', help='only run the named route(s)')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    rng = random.Random(0)
+    with app.app_context():
+        seed.reset_schema()
+        seed.seed(seed.synthetic_tables(args.users, args.posts, args.tags, rng, datetime.now()))
+
+    results = {}
+    for name, method, path, form in routes(args.users, args.posts, args.tags, rng):
+        if args.route and name not in args.route:
+            continue
+        with app.app_context():
+            results[name] = {'test_client': run_test_client(app, method, path, form, args.requests)}
+            if not args.no_server:
+                results[name]['wsgi'] = run_server(app, method, path, form, args.requests, args.concurrency)
+        for mode, metrics in results[name].items():
+            print(f"{name:>12} {mode:>11}  p50 {metrics['p50_ms']:8.2f}ms  p95 {metrics['p95_ms']:8.2f}ms  "
+                  f"p99 {metrics['p99_ms']:8.2f}ms  {metrics['throughput_rps']:8.1f} req/s  "
+                  f"{metrics['sql_per_request']:6.2f} sql  {metrics['peak_memory_kb']:9.1f} KiB")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Wrote {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --update-baseline")
+        return 0
+    with open(args.baseline) as f:
+        failures = compare(results, json.load(f), args.threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
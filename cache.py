@@ -0,0 +1,144 @@
+"""Cache backends for Blogly.
+
+Every backend stores strings under string keys and keeps hit/miss counters.
+add() sets a key only when it is free, so a short-lived key can serve as a
+lock between workers sharing the cache. The backends are:
+
+    LRUCache   in-process, bounded in size, with a per-entry TTL
+    RedisCache any client with the redis-py get/set/delete API, for caches
+               shared between worker processes
+
+make_cache() picks one from a URL: memory:// or redis://host:port/db.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheStats:
+    """Hit and miss counters for a cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+
+class LRUCache:
+    """In-process cache holding at most maxsize entries, each for ttl seconds"""
+
+    def __init__(self, maxsize=1000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+        self.stats.record(entry is not None)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """set key only if it holds no live value; return whether it was set"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return False
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """Cache kept in Redis, or any server that speaks its protocol
+
+    client is a redis-py style client; keys are namespaced with prefix."""
+
+    def __init__(self, client, prefix='blogly:', ttl=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        self.stats.record(value is not None)
+        if isinstance(value, bytes):
+            value = value.decode()
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, value, ex=ttl or None)
+
+    def add(self, key, value, ttl=None):
+        """set key only if it holds no value (SET NX); return whether it was set"""
+        ttl = self.ttl if ttl is None else ttl
+        return bool(self.client.set(self.prefix + key, value, ex=ttl or None, nx=True))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def make_cache(url, maxsize=1000, ttl=None, prefix='blogly:'):
+    """build a cache backend from a memory:// or redis:// URL"""
+    if url.startswith('memory://'):
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        return RedisCache(redis.Redis.from_url(url), prefix=prefix, ttl=ttl)
+    raise ValueError(f"Unsupported cache URL: {url}")
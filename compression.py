@@ -0,0 +1,160 @@
+"""Response compression and fingerprinted static assets for Blogly.
+
+Text responses of at least COMPRESS_MIN_SIZE bytes are compressed with
+brotli when the client accepts it and the brotli package is installed, and
+with gzip otherwise. Streamed responses and files are left alone.
+
+`flask build-assets` copies every file in static/ to static/build/ under a
+name carrying a hash of its content, next to .gz and .br variants, and
+writes static/build/manifest.json. Templates link to assets through
+asset_url('app.css'), which uses the manifest when there is one and the
+plain /static/ path otherwise. A fingerprinted name changes whenever its
+content does, so those files are served with a one-year immutable cache
+lifetime, precompressed if the client accepts it.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from functools import partial
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+BUILD_DIR = 'build'
+MANIFEST = 'manifest.json'
+ONE_YEAR = 365 * 24 * 3600
+COMPRESSIBLE = ('text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                'application/json', 'image/svg+xml')
+
+
+def init_app(app):
+    """compress app's responses and serve its fingerprinted assets"""
+    app.extensions['asset_manifest'] = load_manifest(app.static_folder)
+    app.jinja_env.globals['asset_url'] = partial(asset_url, app.extensions['asset_manifest'])
+    app.view_functions['static'] = static_view
+    if app.config['COMPRESS_ENABLED']:
+        app.after_request(compress_response)
+
+
+def load_manifest(static_folder):
+    """{name: fingerprinted name} from the last build, empty without one"""
+    try:
+        with open(os.path.join(static_folder, BUILD_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(manifest, name):
+    """URL of a file in static/, fingerprinted if it is in the build manifest"""
+    fingerprinted = manifest.get(name)
+    if fingerprinted is None:
+        return f"/static/{name}"
+    return f"/static/{BUILD_DIR}/{fingerprinted}"
+
+
+def accepted_encodings():
+    """the content codings the client accepts, best first"""
+    accepted = request.accept_encodings
+    encodings = []
+    if brotli is not None and accepted['br']:
+        encodings.append('br')
+    if accepted['gzip']:
+        encodings.append('gzip')
+    return encodings
+
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def compress_response(response):
+    """compress a large enough text response for a client that accepts it"""
+    if response.mimetype not in COMPRESSIBLE:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers):
+        return response
+    if response.content_length is not None and response.content_length < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    encodings = accepted_encodings()
+    if not encodings:
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    response.set_data(compress(data, encodings[0], current_app.config))
+    response.headers['Content-Encoding'] = encodings[0]
+    return response
+
+
+def static_view(filename):
+    """the static files, with fingerprinted ones cached for good and precompressed"""
+    directory = current_app.static_folder
+    if not filename.startswith(f"{BUILD_DIR}/") or filename.endswith(('.gz', '.br')):
+        return current_app.send_static_file(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    suffixes = {'br': '.br', 'gzip': '.gz'}
+    for encoding in accepted_encodings():
+        if os.path.isfile(os.path.join(directory, filename + suffixes[encoding])):
+            response = send_from_directory(directory, filename + suffixes[encoding], mimetype=mimetype,
+                                           max_age=ONE_YEAR)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype, max_age=ONE_YEAR)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def fingerprint(name, data):
+    """name with the first 12 hex digits of data's sha256 before its extension"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def build_assets(static_folder, gzip_level=9, brotli_quality=11):
+    """fingerprint and precompress every file in static_folder; return the manifest
+
+    Files of an earlier build that are no longer referenced are removed."""
+    build = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != build]
+        for filename in files:
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            manifest[name] = fingerprint(name, data)
+            target = os.path.join(build, manifest[name])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            with open(target + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=gzip_level, mtime=0))
+            if brotli is not None:
+                with open(target + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=brotli_quality))
+    keep = {os.path.join(build, name) + suffix for name in manifest.values() for suffix in ('', '.gz', '.br')}
+    for root, _, files in os.walk(build):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if path not in keep and filename != MANIFEST:
+                os.remove(path)
+    os.makedirs(build, exist_ok=True)
+    with open(os.path.join(build, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
@@ -0,0 +1,62 @@
+"""HTTP conditional GET for Blogly read routes.
+
+A route decorated with @conditional(version) first runs version(**view_args),
+a cheap column lookup, and derives a weak ETag and Last-Modified from it.
+When the client already holds that version the route answers 304 without
+loading any ORM objects or rendering a template.
+"""
+
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+
+def make_etag(version):
+    """a stable tag for a version tuple and the requested URL"""
+    seed = f"{current_app.config['ETAG_VERSION']}|{request.full_path}|{version!r}"
+    return hashlib.sha1(seed.encode()).hexdigest()
+
+
+def as_utc(timestamp):
+    """timestamp in UTC; naive timestamps, as the models store them, are server local time"""
+    return None if timestamp is None else timestamp.replace(microsecond=0).astimezone(timezone.utc)
+
+
+def is_fresh(etag, last_modified):
+    """does the client's cached copy match this version?"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(version):
+    """answer GETs of the decorated view with 304 while version() is unchanged
+
+    Pages carrying flashed messages are one-off and are never tagged."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if '_flashes' in session:
+                return view(**kwargs)
+            current = version(**kwargs)
+            if current is None:
+                return view(**kwargs)
+            etag = make_etag(current)
+            last_modified = as_utc(current[0])
+            if is_fresh(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
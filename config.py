@@ -0,0 +1,163 @@
+"""Configuration for Blogly.
+
+Every setting can be overridden through an environment variable of the same
+name; DATABASE_URL sets the database and DATABASE_REPLICA_URLS lists read
+replicas, comma separated. The defaults are safe for production:
+statement echo is off and the pool checks connections before handing them out.
+"""
+
+import os
+import tempfile
+
+from sqlalchemy.engine import make_url
+
+from pool import TimedQueuePool
+
+
+def env_bool(name, default, environ=os.environ):
+    """read a true/false setting from the environment"""
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default, environ=os.environ):
+    """read an integer setting from the environment"""
+    value = environ.get(name)
+    return default if value in (None, '') else int(value)
+
+
+def engine_options(uri, environ=os.environ):
+    """build SQLALCHEMY_ENGINE_OPTIONS for uri from the environment
+
+    SQLite gets SQLAlchemy's own pool defaults; the pool and timeout settings
+    only apply to server databases."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': env_int('DB_POOL_SIZE', 10, environ),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 20, environ),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30, environ),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800, environ),
+        'pool_pre_ping': env_bool('DB_POOL_PRE_PING', True, environ),
+    }
+    timeout = env_int('DB_STATEMENT_TIMEOUT_MS', 30000, environ)
+    if timeout and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    return options
+
+
+def env_list(name, environ=os.environ):
+    """read a comma separated list from the environment"""
+    return [item.strip() for item in environ.get(name, '').split(',') if item.strip()]
+
+
+def replica_options(urls, environ=os.environ):
+    """engine settings, url included, for each read replica url
+
+    Replicas get a short connect timeout so that a dead one is noticed by
+    its health check quickly (see replicas.py)."""
+    replicas = []
+    for url in urls:
+        options = engine_options(url, environ)
+        if make_url(url).get_backend_name() == 'postgresql':
+            connect_args = options.setdefault('connect_args', {})
+            connect_args['connect_timeout'] = env_int('DB_REPLICA_CONNECT_TIMEOUT', 2, environ)
+        replicas.append({'url': url, **options})
+    return replicas
+
+
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def async_database_url(uri):
+    """the same database as uri, through its asyncio driver"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver for {backend}")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def async_engine_options(uri, environ=os.environ):
+    """engine_options() for create_async_engine
+
+    The async engine brings its own queue pool, and asyncpg takes the
+    statement timeout as a server setting instead of a libpq option."""
+    options = engine_options(uri, environ)
+    options.pop('poolclass', None)
+    connect_args = options.pop('connect_args', None)
+    if connect_args:
+        timeout = env_int('DB_STATEMENT_TIMEOUT_MS', 30000, environ)
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}}
+    return options
+
+
+class Config:
+    """Settings read from the environment when the module is imported"""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///blogly')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = env_bool('SQLALCHEMY_ECHO', False)
+    DATABASE_REPLICAS = replica_options(env_list('DATABASE_REPLICA_URLS'))
+    REPLICA_STICKY_SECONDS = env_int('REPLICA_STICKY_SECONDS', 5)
+    REPLICA_CHECK_INTERVAL = env_int('REPLICA_CHECK_INTERVAL', 10)
+    REPLICA_MAX_LAG_SECONDS = env_int('REPLICA_MAX_LAG_SECONDS', 10)
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'secret')
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+    FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL', 'memory://')
+    FRAGMENT_CACHE_SIZE = env_int('FRAGMENT_CACHE_SIZE', 10000)
+    FRAGMENT_CACHE_TTL = env_int('FRAGMENT_CACHE_TTL', 3600)
+    FRAGMENT_CACHE_VERSION = os.environ.get('FRAGMENT_CACHE_VERSION', '1')
+    PAGE_CACHE_URL = os.environ.get('PAGE_CACHE_URL', 'memory://')
+    PAGE_CACHE_SIZE = env_int('PAGE_CACHE_SIZE', 1000)
+    PAGE_CACHE_TTL = env_int('PAGE_CACHE_TTL', 30)
+    PAGE_CACHE_STALE_TTL = env_int('PAGE_CACHE_STALE_TTL', 300)
+    PAGE_CACHE_LOCK_TIMEOUT = env_int('PAGE_CACHE_LOCK_TIMEOUT', 10)
+    ETAG_VERSION = os.environ.get('ETAG_VERSION', '1')
+    SQL_INSTRUMENTATION = env_bool('SQL_INSTRUMENTATION', True)
+    SQL_LOG_REQUESTS = env_bool('SQL_LOG_REQUESTS', True)
+    SQL_SLOW_QUERY_MS = env_int('SQL_SLOW_QUERY_MS', 250)
+    METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+    TEMPLATES_AUTO_RELOAD = env_bool('TEMPLATES_AUTO_RELOAD', None)
+    TASK_QUEUE = os.environ.get('TASK_QUEUE', 'thread')
+    TASK_WORKERS = env_int('TASK_WORKERS', 4)
+    TASK_MAX_ATTEMPTS = env_int('TASK_MAX_ATTEMPTS', 5)
+    TASK_RETRY_DELAY = env_int('TASK_RETRY_DELAY', 2)
+    TASK_LOCK_TIMEOUT = env_int('TASK_LOCK_TIMEOUT', 300)
+    TASK_RETENTION = env_int('TASK_RETENTION', 7 * 24 * 3600)
+    AVATAR_CACHE_DIR = os.environ.get('AVATAR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'blogly-avatars'))
+    AVATAR_CACHE_MAX_BYTES = env_int('AVATAR_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+    AVATAR_SIZES = (48, 128, 256)
+    AVATAR_PROCESSES = env_int('AVATAR_PROCESSES', 2)
+    AVATAR_FETCH_TIMEOUT = env_int('AVATAR_FETCH_TIMEOUT', 5)
+    AVATAR_MAX_SOURCE_BYTES = env_int('AVATAR_MAX_SOURCE_BYTES', 10 * 1024 * 1024)
+    AVATAR_ALLOW_PRIVATE_HOSTS = env_bool('AVATAR_ALLOW_PRIVATE_HOSTS', False)
+    COMPRESS_ENABLED = env_bool('COMPRESS_ENABLED', True)
+    COMPRESS_MIN_SIZE = env_int('COMPRESS_MIN_SIZE', 500)
+    COMPRESS_GZIP_LEVEL = env_int('COMPRESS_GZIP_LEVEL', 6)
+    COMPRESS_BROTLI_QUALITY = env_int('COMPRESS_BROTLI_QUALITY', 5)
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    TEMPLATE_PRECOMPILED_DIR = os.environ.get('TEMPLATE_PRECOMPILED_DIR')
+
+
+class TestingConfig(Config):
+    """Settings for the test suite, which runs against its own database"""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'postgresql:///blogly_test')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    DATABASE_REPLICAS = []
+    SQLALCHEMY_ECHO = False
+    TASK_QUEUE = 'eager'
+    # the tests read pages straight after changing rows behind the routes' backs
+    PAGE_CACHE_TTL = 0
+    AVATAR_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'blogly-test-avatars')
+    AVATAR_PROCESSES = 0
+    # the tests fetch avatars from a stand-in server on localhost
+    AVATAR_ALLOW_PRIVATE_HOSTS = True
+    TESTING = True
+    DEBUG_TB_HOSTS = ['dont-show-debug-toolbar']
@@ -0,0 +1,101 @@
+"""Display views of Blogly rows for the feed templates.
+
+Listing pages read the same few attributes of every post, author and tag,
+and each read of a mapped attribute goes through SQLAlchemy's
+instrumentation. The views here copy those attributes once per query into
+plain slotted objects. Values derived for display, such as nice_date and
+full_name, are computed once per row rather than on every template
+reference. An author or tag shown on many posts gets a single view.
+
+The views keep the attribute names of the models, so every template works
+with either.
+"""
+
+from models import DATE_FORMAT
+from queries import Page
+
+
+def nice_date(value):
+    """format a datetime the way posts show it"""
+    return value.strftime(DATE_FORMAT)
+
+
+class UserView:
+    """What the templates show of a user"""
+
+    __slots__ = ('id', 'first_name', 'last_name', 'full_name', 'image_url', 'post_count')
+
+    def __init__(self, id, first_name, last_name, image_url=None, post_count=0):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.full_name = f"{first_name} {last_name}"
+        self.image_url = image_url
+        self.post_count = post_count
+
+    @classmethod
+    def from_model(cls, user):
+        return cls(user.id, user.first_name, user.last_name, user.image_url, user.post_count)
+
+
+class TagView:
+    """What the templates show of a tag"""
+
+    __slots__ = ('id', 'name', 'post_count')
+
+    def __init__(self, id, name, post_count=0):
+        self.id = id
+        self.name = name
+        self.post_count = post_count
+
+
+class PostView:
+    """What the templates show of a post, with its author and tags"""
+
+    __slots__ = ('id', 'title', 'content', 'created_at', 'nice_date', 'user_id', 'user', 'tags', 'updated_at')
+
+    def __init__(self, id, title, content, created_at, user, tags, updated_at=None):
+        self.id = id
+        self.title = title
+        self.content = content
+        self.created_at = created_at
+        self.nice_date = nice_date(created_at)
+        self.user_id = user.id if user is not None else None
+        self.user = user
+        self.tags = tags
+        self.updated_at = updated_at
+
+
+def post_views(posts):
+    """PostViews of posts, which should have their user and tags loaded
+
+    Authors and tags shared between posts share one view."""
+    users, tags = {}, {}
+
+    def user_view(user):
+        if user is None:
+            return None
+        view = users.get(user.id)
+        if view is None:
+            view = users[user.id] = UserView.from_model(user)
+        return view
+
+    def tag_view(tag):
+        view = tags.get(tag.id)
+        if view is None:
+            view = tags[tag.id] = TagView(tag.id, tag.name)
+        return view
+
+    return [PostView(post.id, post.title, post.content, post.created_at,
+                     user_view(post.user), [tag_view(tag) for tag in post.tags], post.updated_at)
+            for post in posts]
+
+
+def post_view(post):
+    """the PostView of a single post"""
+    return post_views([post])[0]
+
+
+def page_views(page, make_views=post_views):
+    """page with its items replaced by their views"""
+    return Page(make_views(page.items), page.limit, page.next_cursor, page.prev_cursor)
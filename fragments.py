@@ -0,0 +1,53 @@
+"""Cached post fragments for Blogly listing pages.
+
+Post cards on the home page, /posts and user pages are rendered once and
+then served from a cache. Keys combine the post id, its updated_at, the
+fragment variant and FRAGMENT_CACHE_VERSION, which should be bumped when the
+fragment templates change. Every write that changes a card, including
+renaming its author or one of its tags, bumps the post's updated_at, so the
+next listing asks for a new key in every process. Nothing has to be deleted
+and a per-process memory:// cache never serves an old card; entries of old
+versions are dropped by the LRU or FRAGMENT_CACHE_TTL.
+"""
+
+from flask import current_app, render_template
+from markupsafe import Markup
+
+from cache import make_cache
+
+
+def init_app(app):
+    """attach a fragment cache to app and expose post_fragment to templates"""
+    app.extensions['fragment_cache'] = make_fragment_cache(app.config)
+    app.jinja_env.globals['post_fragment'] = post_fragment
+
+
+def make_fragment_cache(config):
+    """the cache backend FRAGMENT_CACHE_URL names; a redis:// one is shared by every app using it"""
+    return make_cache(config['FRAGMENT_CACHE_URL'],
+                      maxsize=config['FRAGMENT_CACHE_SIZE'],
+                      ttl=config['FRAGMENT_CACHE_TTL'],
+                      prefix='blogly:fragment:')
+
+
+def fragment_cache():
+    return current_app.extensions['fragment_cache']
+
+
+def fragment_key(post, variant, version=None):
+    """the cache key of post's variant fragment, as of its updated_at"""
+    if version is None:
+        version = current_app.config['FRAGMENT_CACHE_VERSION']
+    return f"v{version}:post:{post.id}:{post.updated_at:%Y%m%d%H%M%S%f}:{variant}"
+
+
+def post_fragment(post, variant='card'):
+    """return the rendered post_<variant>.html fragment for post"""
+    cache = fragment_cache()
+    key = fragment_key(post, variant)
+    html = cache.get(key)
+    if html is None:
+        html = render_template(f'post_{variant}.html', post=post)
+        cache.set(key, html)
+    return Markup(html)
+
@@ -0,0 +1,130 @@
+"""Per-request SQL instrumentation for Blogly.
+
+Engine events time every statement; request hooks collect the totals for the
+current request. Each response carries them as Server-Timing entries
+
+    db-pool;dur=<ms>                 time spent waiting for a connection
+    db;dur=<ms>;desc="<n> queries"   time spent executing SQL
+    app;dur=<ms>                     time spent in the whole request
+
+and one JSON line per request goes to the blogly.request logger. Statements
+slower than SQL_SLOW_QUERY_MS are logged to blogly.sql.slow with their
+parameters and the route that ran them. The bookkeeping is a couple of
+perf_counter() calls per statement, cheap enough to leave on in production.
+"""
+
+import json
+import logging
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+from replicas import replica_engines
+
+request_log = logging.getLogger('blogly.request')
+slow_log = logging.getLogger('blogly.sql.slow')
+
+MAX_PARAMETERS_LENGTH = 1000
+
+
+class QueryStats:
+    """Statements, time and rows for one request"""
+
+    __slots__ = ('count', 'duration', 'rows')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.rows = 0
+
+
+def init_app(app):
+    """time the statements run on app's engines and report them per request"""
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    timer = StatementTimer(app.config['SQL_SLOW_QUERY_MS'])
+    with app.app_context():
+        for engine in [*db.engines.values(), *replica_engines(app)]:
+            event.listen(engine, 'before_cursor_execute', timer.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', timer.after_cursor_execute)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+
+class StatementTimer:
+    """Engine event listeners timing each statement
+
+    Statements taking at least slow_ms milliseconds are logged; 0 turns the
+    slow-query log off."""
+
+    def __init__(self, slow_ms):
+        self.slow = slow_ms / 1000 if slow_ms else None
+
+    # the start time is kept on the statement's execution context, which is
+    # dropped with it even when the statement fails and this is never called
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'query_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        in_request = has_request_context()
+        if in_request:
+            stats = g.get('sql_stats')
+            if stats is not None:
+                stats.count += 1
+                stats.duration += elapsed
+                # DBAPI rowcount is -1 where the driver does not know it up front
+                if cursor.description is not None and cursor.rowcount > 0:
+                    stats.rows += cursor.rowcount
+        if self.slow is not None and elapsed >= self.slow:
+            log_slow_query(statement, parameters, elapsed, executemany, in_request)
+
+
+def log_slow_query(statement, parameters, elapsed, executemany, in_request):
+    slow_log.warning(json.dumps({
+        'event': 'slow_query',
+        'duration_ms': round(elapsed * 1000, 2),
+        'route': request.endpoint if in_request else None,
+        'path': request.path if in_request else None,
+        'statement': ' '.join(statement.split()),
+        'parameters': repr(parameters)[:MAX_PARAMETERS_LENGTH],
+        'executemany': executemany,
+    }))
+
+
+def start_request():
+    g.request_start = time.perf_counter()
+    g.sql_stats = QueryStats()
+
+
+def finish_request(response):
+    """add Server-Timing entries and log the request's totals"""
+    stats = g.get('sql_stats')
+    start = g.get('request_start')
+    if stats is None or start is None:
+        return response
+    wait = g.get('pool_wait', 0.0)
+    total = time.perf_counter() - start
+    response.headers.add('Server-Timing', f'db-pool;dur={wait * 1000:.2f}')
+    response.headers.add('Server-Timing', f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"')
+    response.headers.add('Server-Timing', f'app;dur={total * 1000:.2f}')
+    if current_app.config['SQL_LOG_REQUESTS']:
+        request_log.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'route': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 2),
+            'db_ms': round(stats.duration * 1000, 2),
+            'db_pool_ms': round(wait * 1000, 2),
+            'queries': stats.count,
+            'rows': stats.rows,
+        }))
+    return response
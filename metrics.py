@@ -0,0 +1,153 @@
+"""Prometheus metrics for Blogly, served at /metrics.
+
+Collected per route (the Flask endpoint name):
+
+    blogly_http_request_duration_seconds   histogram of request latency
+    blogly_http_requests_total             requests by status code
+    blogly_http_request_errors_total       responses with a 5xx status
+    blogly_sql_statements_total            statements run, from instrumentation.py
+    blogly_sql_duration_seconds_total      time spent running them
+
+and for the app as a whole: connection pool checked-out/overflow gauges,
+labelled by engine ("primary", another bind's key or "replica-N"), a
+histogram of pool checkout waits per request, template render times and
+fragment cache hits and misses.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by the workers before they start; each process then writes
+its samples to memory-mapped files there and /metrics aggregates them all.
+Under gunicorn, also call prometheus_client.multiprocess.mark_process_dead
+from the child_exit hook so the gauges of dead workers are dropped.
+"""
+
+import os
+import time
+
+from flask import g, request
+from flask.signals import before_render_template, template_rendered
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+from sqlalchemy import event
+
+from cache import CacheStats
+from models import db
+from replicas import replica_engines
+
+REQUEST_LATENCY = Histogram(
+    'blogly_http_request_duration_seconds', 'Request latency', ['route', 'method'])
+REQUESTS = Counter(
+    'blogly_http_requests_total', 'Requests served', ['route', 'method', 'status'])
+REQUEST_ERRORS = Counter(
+    'blogly_http_request_errors_total', 'Requests answered with a server error', ['route', 'method'])
+SQL_STATEMENTS = Counter(
+    'blogly_sql_statements_total', 'SQL statements run while serving requests', ['route'])
+SQL_DURATION = Counter(
+    'blogly_sql_duration_seconds_total', 'Time spent running SQL while serving requests', ['route'])
+POOL_CHECKED_OUT = Gauge(
+    'blogly_db_pool_checked_out', 'Connections checked out of the pool', ['engine'],
+    multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge(
+    'blogly_db_pool_overflow', 'Connections open beyond the pool size', ['engine'],
+    multiprocess_mode='livesum')
+POOL_WAIT = Histogram(
+    'blogly_db_pool_wait_seconds', 'Time a request waited for database connections',
+    buckets=(.0005, .001, .005, .01, .05, .1, .5, 1, 5, 30))
+TEMPLATE_RENDER = Histogram(
+    'blogly_template_render_seconds', 'Template render time', ['template'])
+CACHE_REQUESTS = Counter(
+    'blogly_cache_requests_total', 'Cache lookups', ['cache', 'result'])
+
+
+class MetricsCacheStats(CacheStats):
+    """CacheStats that also counts lookups in blogly_cache_requests_total"""
+
+    def __init__(self, name):
+        super().__init__()
+        self.hit_counter = CACHE_REQUESTS.labels(name, 'hit')
+        self.miss_counter = CACHE_REQUESTS.labels(name, 'miss')
+
+    def record(self, hit):
+        super().record(hit)
+        (self.hit_counter if hit else self.miss_counter).inc()
+
+
+def init_app(app):
+    """record metrics for app and serve them at /metrics"""
+    if not app.config['METRICS_ENABLED']:
+        return
+    with app.app_context():
+        for key, engine in db.engines.items():
+            watch_pool(engine, 'primary' if key is None else key)
+        for i, engine in enumerate(replica_engines(app)):
+            watch_pool(engine, f'replica-{i}')
+    cache = app.extensions.get('fragment_cache')
+    if cache is not None:
+        cache.stats = MetricsCacheStats('fragment')
+    pages = app.extensions.get('page_cache')
+    if pages is not None:
+        pages.stats = MetricsCacheStats('page')
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(finish_render, app)
+    app.before_request(start_request)
+    app.after_request(record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def watch_pool(engine, name):
+    """keep engine's pool gauges, labelled name, current as connections are checked out and in"""
+    pool = engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return
+    checked_out, overflow = POOL_CHECKED_OUT.labels(name), POOL_OVERFLOW.labels(name)
+
+    def update(*args):
+        checked_out.set(pool.checkedout())
+        overflow.set(max(pool.overflow(), 0))
+
+    event.listen(engine, 'checkout', update)
+    event.listen(engine, 'checkin', update)
+
+
+def start_render(sender, template, context, **extra):
+    g.setdefault('render_start', []).append(time.perf_counter())
+
+
+def finish_render(sender, template, context, **extra):
+    starts = g.get('render_start')
+    if starts:
+        TEMPLATE_RENDER.labels(template.name or 'string').observe(time.perf_counter() - starts.pop())
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+
+
+def record_request(response):
+    start = g.get('metrics_start')
+    if start is None or request.endpoint == 'metrics':
+        return response
+    route = request.endpoint or 'unmatched'
+    REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - start)
+    REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    if response.status_code >= 500:
+        REQUEST_ERRORS.labels(route, request.method).inc()
+    stats = g.get('sql_stats')
+    if stats is not None:
+        SQL_STATEMENTS.labels(route).inc(stats.count)
+        SQL_DURATION.labels(route).inc(stats.duration)
+    POOL_WAIT.observe(g.get('pool_wait', 0.0))
+    return response
+
+
+def registry():
+    """the registry to expose: every worker's samples in multiprocess mode"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        aggregated = CollectorRegistry()
+        multiprocess.MultiProcessCollector(aggregated)
+        return aggregated
+    return REGISTRY
+
+
+def metrics_view():
+    """the current metrics in the Prometheus text exposition format"""
+    return generate_latest(registry()), 200, {'Content-Type': CONTENT_TYPE_LATEST}
@@ -0,0 +1,214 @@
+"""Versioned schema migrations for Blogly.
+
+db.create_all() only creates tables that are missing; it never changes a
+table that already exists. Each migration below brings an existing database
+forward one step, and the schema_migrations table records which have run.
+
+Run pending migrations with:
+
+    flask --app app migrate
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, inspect, select
+from sqlalchemy.schema import CreateTable
+
+from models import db, Job, POST_SEARCH_VECTOR_SQL, POST_SEARCH_INDEX_SQL
+from queries import recount_posts
+
+MIGRATIONS = []
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('applied_at', DateTime, nullable=False, default=datetime.now),
+)
+
+
+def migration(version, transactional=True):
+    """register a function as the migration to schema version `version`
+
+    Migrations run in their own transaction unless transactional is False,
+    in which case they run in autocommit mode (needed for statements such as
+    CREATE INDEX CONCURRENTLY)."""
+    def register(fn):
+        fn.version = version
+        fn.transactional = transactional
+        MIGRATIONS.append(fn)
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return register
+
+
+def model_index(name):
+    """find an index declared on the models by name"""
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise LookupError(name)
+
+
+def create_index(conn, name):
+    """create a model-declared index if it is missing
+
+    On PostgreSQL the index is built CONCURRENTLY so that a live database
+    keeps accepting writes while it is built."""
+    index = model_index(name)
+    columns = ', '.join(column.name for column in index.columns)
+    concurrently = 'CONCURRENTLY ' if conn.dialect.name == 'postgresql' else ''
+    conn.exec_driver_sql(f'CREATE INDEX {concurrently}IF NOT EXISTS {index.name} ON {index.table.name} ({columns})')
+
+
+@migration(1, transactional=False)
+def add_listing_indexes(conn):
+    """indexes for feed ordering, user pages, the users list and tag pages"""
+    for name in ('ix_posts_created_at_id',
+                 'ix_posts_user_id_created_at_id',
+                 'ix_users_last_name_first_name_id',
+                 'ix_posts_tags_tag_id'):
+        create_index(conn, name)
+
+
+def add_column(conn, table, column, definition):
+    """add a column to an existing table unless it is already there"""
+    if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+        conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    return False
+
+
+@migration(2)
+def add_updated_at(conn):
+    """updated_at on users, posts and tags, used for ETags and Last-Modified"""
+    for table in ('users', 'posts', 'tags'):
+        added = add_column(conn, table, 'updated_at', 'TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP')
+        if added and table == 'posts':
+            conn.exec_driver_sql('UPDATE posts SET updated_at = created_at')
+
+
+@migration(3, transactional=False)
+def add_post_search_vector(conn):
+    """generated tsvector column and GIN index for full text search of posts"""
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql(POST_SEARCH_VECTOR_SQL)
+        conn.exec_driver_sql(POST_SEARCH_INDEX_SQL.format(concurrently='CONCURRENTLY '))
+
+
+@migration(4, transactional=False)
+def add_post_counts(conn):
+    """post_count on users and tags, backfilled in bulk, with indexes for sorting by it"""
+    for table in ('users', 'tags'):
+        add_column(conn, table, 'post_count', 'INTEGER NOT NULL DEFAULT 0')
+    recount_posts(conn)
+    for name in ('ix_users_post_count_id', 'ix_tags_post_count_id'):
+        create_index(conn, name)
+
+
+# (table, column, referenced table) of each foreign key that cascades deletes
+CASCADING_FOREIGN_KEYS = (('posts', 'user_id', 'users'),
+                          ('posts_tags', 'post_id', 'posts'),
+                          ('posts_tags', 'tag_id', 'tags'))
+
+
+@migration(5, transactional=False)
+def cascade_deletes(conn):
+    """ON DELETE CASCADE on the foreign keys of posts and posts_tags
+
+    Each key is swapped in a single ALTER TABLE and added NOT VALID, so the
+    tables are only locked briefly; validating the existing rows afterwards
+    does not block writes. SQLite cannot alter constraints, so there the
+    tables are rebuilt instead."""
+    if conn.dialect.name == 'sqlite':
+        for table in dict.fromkeys(table for table, _, _ in CASCADING_FOREIGN_KEYS):
+            if not all(fk['options'].get('ondelete', '').upper() == 'CASCADE'
+                       for fk in inspect(conn).get_foreign_keys(table)):
+                rebuild_sqlite_table(conn, db.metadata.tables[table])
+        return
+    if conn.dialect.name != 'postgresql':
+        return
+    for table, column, referred in CASCADING_FOREIGN_KEYS:
+        keys = [fk for fk in inspect(conn).get_foreign_keys(table) if fk['constrained_columns'] == [column]]
+        if any(fk['options'].get('ondelete', '').upper() == 'CASCADE' for fk in keys):
+            continue
+        name = f'{table}_{column}_fkey'
+        drops = ''.join(f'DROP CONSTRAINT {fk["name"]}, ' for fk in keys)
+        conn.exec_driver_sql(f'ALTER TABLE {table} {drops}ADD CONSTRAINT {name} FOREIGN KEY ({column}) '
+                             f'REFERENCES {referred} (id) ON DELETE CASCADE NOT VALID')
+        conn.exec_driver_sql(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}')
+
+
+def rebuild_sqlite_table(conn, table):
+    """recreate table as the models declare it, keeping its rows
+
+    Follows SQLite's procedure for schema changes ALTER TABLE cannot make:
+    with foreign keys off, copy the rows into a new table, drop the old one,
+    rename the new one and check the keys before committing."""
+    columns = ', '.join(column['name'] for column in inspect(conn).get_columns(table.name))
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+    new_name = f'_new_{table.name}'
+    conn.exec_driver_sql('PRAGMA foreign_keys = OFF')
+    try:
+        conn.exec_driver_sql('BEGIN')
+        try:
+            conn.exec_driver_sql(ddl.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {new_name} ', 1))
+            conn.exec_driver_sql(f'INSERT INTO {new_name} ({columns}) SELECT {columns} FROM {table.name}')
+            conn.exec_driver_sql(f'DROP TABLE {table.name}')
+            conn.exec_driver_sql(f'ALTER TABLE {new_name} RENAME TO {table.name}')
+            for index in table.indexes:
+                index.create(conn)
+            if conn.exec_driver_sql('PRAGMA foreign_key_check').first() is not None:
+                raise RuntimeError(f'{table.name} has rows with broken foreign keys')
+        except BaseException:
+            conn.exec_driver_sql('ROLLBACK')
+            raise
+        conn.exec_driver_sql('COMMIT')
+    finally:
+        conn.exec_driver_sql('PRAGMA foreign_keys = ON')
+
+
+@migration(6)
+def add_jobs(conn):
+    """the jobs table of the database task queue"""
+    Job.__table__.create(conn, checkfirst=True)
+
+
+def applied_versions(engine):
+    """return the set of migration versions already applied to engine"""
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def record(conn, version):
+    conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.now()))
+
+
+def upgrade(engine):
+    """apply every pending migration in version order; return the versions applied"""
+    done = applied_versions(engine)
+    applied = []
+    for fn in MIGRATIONS:
+        if fn.version in done:
+            continue
+        if fn.transactional:
+            with engine.begin() as conn:
+                fn(conn)
+                record(conn, fn.version)
+        else:
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                fn(conn)
+                record(conn, fn.version)
+        applied.append(fn.version)
+    return applied
+
+
+def stamp(engine):
+    """mark every migration as applied, for a schema just built by create_all()"""
+    done = applied_versions(engine)
+    with engine.begin() as conn:
+        for fn in MIGRATIONS:
+            if fn.version not in done:
+                record(conn, fn.version)
+
@@ -1,24 +1,47 @@
 """Models for Blogly."""
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, Engine, event
 from datetime import datetime, date
 
-db = SQLAlchemy()
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# how posts show their date; see also display.py
+DATE_FORMAT = '%a %m %d %Y, %I:%M %p'
 
 def connect_db(app):
     db.app = app
     db.init_app(app)
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys, and their ON DELETE CASCADE, when asked to"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute('PRAGMA foreign_keys = ON')
+
 class User(db.Model):
     """User model for blogly app"""
 
     __tablename__ = "users"
+    __table_args__ = (
+        db.Index('ix_users_last_name_first_name_id', 'last_name', 'first_name', 'id'),
+        db.Index('ix_users_post_count_id', 'post_count', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     image_url = db.Column(db.Text, nullable=False, default='https://static.vecteezy.com/system/resources/previews/002/318/271/original/user-profile-icon-free-vector.jpg')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    # maintained by the routes through queries.adjust_post_counts
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
-    posts = db.relationship('Post', backref="user", cascade="all,delete")
+    # the database deletes a user's posts (ON DELETE CASCADE) without the
+    # session loading them first
+    posts = db.relationship('Post', back_populates="user", cascade="all,delete", passive_deletes=True)
 
     def __repr__(self):
         """show info about a user"""
@@ -34,14 +57,20 @@ class Post(db.Model):
     """Post model for blogly app"""
 
     __tablename__ = "posts"
+    __table_args__ = (
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_posts_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.Text, nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
 
-    # user = db.relationship('User', backrefs="posts")
+    user = db.relationship('User', back_populates="posts")
+    tags = db.relationship('Tag', secondary='posts_tags', back_populates='posts', passive_deletes=True)
 
 
     def __repr__(self):
@@ -51,17 +80,37 @@ class Post(db.Model):
     @property
     def nice_date(self):
         """Return a nicely formatted date"""
-        return self.created_at.strftime('%a %m %d %Y, %I:%M %p')
+        return self.created_at.strftime(DATE_FORMAT)
+
+# On PostgreSQL posts carry a generated tsvector of title (weighted A) and
+# content (weighted B) with a GIN index for full text search. It is not a
+# mapped column so that other databases can still create the table; see
+# search.py for how it is queried.
+POST_SEARCH_VECTOR_SQL = (
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(content, '')), 'B')) STORED")
+POST_SEARCH_INDEX_SQL = "CREATE INDEX {concurrently}IF NOT EXISTS ix_posts_search_vector ON posts USING gin (search_vector)"
+
+event.listen(Post.__table__, 'after_create', DDL(POST_SEARCH_VECTOR_SQL).execute_if(dialect='postgresql'))
+event.listen(Post.__table__, 'after_create',
+             DDL(POST_SEARCH_INDEX_SQL.format(concurrently='')).execute_if(dialect='postgresql'))
     
 class Tag(db.Model):
     """Tag model for blogly app"""
 
     __tablename__ = "tags"
+    __table_args__ = (
+        db.Index('ix_tags_post_count_id', 'post_count', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.Text, nullable=False, unique=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    # maintained by the routes through queries.adjust_post_counts
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
-    posts = db.relationship('Post', secondary='posts_tags', backref='tags')
+    posts = db.relationship('Post', secondary='posts_tags', back_populates='tags', passive_deletes=True)
 
     def __repr__(self):
         """show info about a tag"""
@@ -71,10 +120,38 @@ class PostTag(db.Model):
     """PostTag model for blogly app"""
 
     __tablename__ = "posts_tags"
+    __table_args__ = (
+        db.Index('ix_posts_tags_tag_id', 'tag_id'),
+    )
 
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
-    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
 
     def __repr__(self):
         """show data in line"""
         return f"<PostTag {self.post_id} {self.tag_id}>"
+
+class Job(db.Model):
+    """A background task waiting in, or finished by, the database queue (see tasks.py)"""
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.Text, nullable=False)
+    args = db.Column(db.JSON, nullable=False)
+    # jobs enqueued with a key that is already taken are dropped
+    key = db.Column(db.Text, unique=True)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.name} {self.status}>"
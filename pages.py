@@ -0,0 +1,158 @@
+"""Whole-page cache for Blogly's busiest anonymous pages.
+
+The home page and the tag list look the same to every visitor. A view
+decorated with @cached_page(group, version) keeps its whole 200 response in
+the page cache and serves it from there for PAGE_CACHE_TTL seconds. The key
+holds the URL and the page's version, looked up with the same cheap query
+@conditional uses, so a write committed by any process, CLI commands
+included, changes the key of every process at once.
+After that the entry is stale but kept for PAGE_CACHE_STALE_TTL more
+seconds: the first request to find it stale takes a lock and renders the
+page again, and every other request gets the stale copy meanwhile. When a
+page is not cached at all, one request renders it while the others wait up
+to PAGE_CACHE_LOCK_TIMEOUT seconds for the result. The locks live in the
+cache, so with the default memory:// cache a burst costs one render per
+worker process; set PAGE_CACHE_URL to a redis:// URL to share entries and
+locks between processes and render once.
+
+Write routes also call purge_pages() with the groups they change once they
+have committed. Every key carries its group's generation, so a purge drops
+all of the group's URLs, ?sort= variants included, by starting a new one,
+for changes the version does not capture. Pages with flashed messages
+bypass the cache. PAGE_CACHE_TTL=0 turns the cache off.
+"""
+
+import json
+import time
+import uuid
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from cache import CacheStats, make_cache
+from conditional import make_etag
+
+WAIT_INTERVAL = 0.05
+
+
+class PageCache:
+    """Rendered pages in a cache backend, with a lock per page being rendered"""
+
+    def __init__(self, backend, ttl=30, stale_ttl=300, lock_timeout=10):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.stats = CacheStats()
+
+    def generation(self, group):
+        """the token of group's current generation, started on first use"""
+        key = f"gen:{group}"
+        current = self.backend.get(key)
+        if current is None:
+            self.backend.add(key, uuid.uuid4().hex)
+            current = self.backend.get(key)
+        return current
+
+    def key(self, group, tag):
+        """the key of a page of group; tag identifies its URL and version"""
+        return f"{group}:{self.generation(group)}:{tag}"
+
+    def purge(self, *groups):
+        """drop every cached page of groups"""
+        for group in groups:
+            self.backend.set(f"gen:{group}", uuid.uuid4().hex)
+
+    def load(self, key):
+        entry = self.backend.get(key)
+        return None if entry is None else json.loads(entry)
+
+    def store(self, key, response):
+        """keep a 200 response that sets no cookie; return whether it was kept"""
+        if response.status_code != 200 or response.is_streamed or 'Set-Cookie' in response.headers:
+            return False
+        now = time.time()
+        entry = {'body': response.get_data(as_text=True),
+                 'headers': [(name, value) for name, value in response.headers if name != 'Content-Length'],
+                 'stored': now, 'expires': now + self.ttl}
+        self.backend.set(key, json.dumps(entry), ttl=self.ttl + self.stale_ttl)
+        return True
+
+    def lock(self, key):
+        """claim the right to render key's page; False if another request has it"""
+        return self.backend.add(f"lock:{key}", '1', ttl=self.lock_timeout)
+
+    def unlock(self, key):
+        self.backend.delete(f"lock:{key}")
+
+    def wait(self, key):
+        """key's entry once the request holding its lock has stored it, or None"""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = self.load(key)
+            if entry is not None:
+                return entry
+            if self.backend.get(f"lock:{key}") is None:
+                return None
+        return None
+
+
+def init_app(app):
+    """attach a page cache to app"""
+    app.extensions['page_cache'] = PageCache(
+        make_cache(app.config['PAGE_CACHE_URL'], maxsize=app.config['PAGE_CACHE_SIZE'], prefix='blogly:page:'),
+        ttl=app.config['PAGE_CACHE_TTL'],
+        stale_ttl=app.config['PAGE_CACHE_STALE_TTL'],
+        lock_timeout=app.config['PAGE_CACHE_LOCK_TIMEOUT'])
+
+
+def page_cache():
+    return current_app.extensions['page_cache']
+
+
+def purge_pages(*groups):
+    """drop the cached pages of groups, after a write that changes them"""
+    page_cache().purge(*groups)
+
+
+def cached_response(entry):
+    """a response from a cache entry, 304 if the client holds its ETag"""
+    response = current_app.response_class(entry['body'], headers=entry['headers'])
+    response.age = max(int(time.time() - entry['stored']), 0)
+    return response.make_conditional(request)
+
+
+def cached_page(group, version):
+    """serve GETs of the decorated view from the page cache, filed under group
+
+    version(**view_args) is the view's @conditional version lookup."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            pages = page_cache()
+            if not pages.ttl or request.method != 'GET' or '_flashes' in session:
+                return view(**kwargs)
+            current = version(**kwargs)
+            if current is None:
+                return view(**kwargs)
+            key = pages.key(group, make_etag(current))
+            entry = pages.load(key)
+            if entry is not None and entry['expires'] > time.time():
+                pages.stats.record(True)
+                return cached_response(entry)
+            if pages.lock(key):
+                pages.stats.record(False)
+                try:
+                    response = make_response(view(**kwargs))
+                    pages.store(key, response)
+                finally:
+                    pages.unlock(key)
+                return response
+            # another request is rendering this page: serve the stale copy, or wait for it
+            if entry is None:
+                entry = pages.wait(key)
+            pages.stats.record(entry is not None)
+            return view(**kwargs) if entry is None else cached_response(entry)
+        return wrapper
+    return decorator
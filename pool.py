@@ -0,0 +1,21 @@
+"""Connection pool instrumentation for Blogly."""
+
+import time
+
+from flask import g, has_request_context
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection
+
+    During a request, waits are added to g.pool_wait, which is reported in
+    the Server-Timing header and the blogly_db_pool_wait_seconds histogram."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if has_request_context():
+                g.pool_wait = g.get('pool_wait', 0.0) + time.perf_counter() - start
@@ -0,0 +1,329 @@
+"""Reusable queries for Blogly."""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, case, exists, func, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+from models import db, User, Post, Tag, PostTag
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def feed_query():
+    """select posts newest first, loading each post's user and tags up front
+
+    Listing templates show the author and tag badges of every post, so both
+    are fetched alongside the posts instead of lazily once per post."""
+    return (db.select(Post)
+            .options(joinedload(Post.user), selectinload(Post.tags))
+            .order_by(Post.created_at.desc(), Post.id.desc()))
+
+
+class Page:
+    """One page of a keyset-paginated listing"""
+
+    def __init__(self, items, limit, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.limit = limit
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def page_size(limit):
+    """clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    """turn the sort key of a row into an opaque url-safe token"""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """turn a token made by encode_cursor back into sort key values
+
+    Raises ValueError if the token is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('invalid cursor') from e
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError('invalid cursor')
+    return tuple(decode_value(v, key) for v, key in zip(values, keys))
+
+
+def decode_value(value, key):
+    """one cursor value, checked against the type of its key column"""
+    if isinstance(key.type, DateTime):
+        if not isinstance(value, str):
+            raise ValueError('invalid cursor')
+        return datetime.fromisoformat(value)
+    expected = (int, float) if key.type.python_type is float else key.type.python_type
+    if not isinstance(value, expected) or isinstance(value, bool):
+        raise ValueError('invalid cursor')
+    return value
+
+
+def paginate(stmt, keys, after=None, before=None, limit=None, descending=False, rows=False):
+    """return a Page of stmt ordered by keys, starting after or before a cursor
+
+    keys must be mapped attributes that together identify a row uniquely.
+    The page holds ORM objects, or with rows=True the result rows of a
+    column select, which must then include the keys.
+    Rows are located with a row-value comparison on keys rather than an
+    OFFSET, so every page costs the same no matter how deep it is."""
+    stmt, limit = page_statement(stmt, keys, after, before, limit, descending)
+    result = db.session.execute(stmt)
+    return make_page(result.all() if rows else result.scalars().all(), keys, limit, after, before)
+
+
+def page_statement(stmt, keys, after=None, before=None, limit=None, descending=False):
+    """the first half of paginate(): stmt limited to the requested page
+
+    Returns the statement, which fetches one row more than the page to tell
+    whether there is another, and the page size. Raises ValueError for a
+    malformed cursor."""
+    limit = page_size(limit)
+    backwards = before is not None
+    cursor = before if backwards else after
+    key = tuple_(*keys)
+    if cursor is not None:
+        values = decode_cursor(cursor, keys)
+        stmt = stmt.where(key < values if backwards != descending else key > values)
+    reverse = backwards != descending
+    stmt = stmt.order_by(None).order_by(*(k.desc() if reverse else k.asc() for k in keys))
+    return stmt.limit(limit + 1), limit
+
+
+def make_page(rows, keys, limit, after=None, before=None):
+    """the second half of paginate(): a Page from the rows page_statement() fetched"""
+    backwards = before is not None
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return Page(rows, limit)
+
+    def cursor_for(row):
+        return encode_cursor([getattr(row, k.key) for k in keys])
+
+    first, last = cursor_for(rows[0]), cursor_for(rows[-1])
+    if backwards:
+        return Page(rows, limit, next_cursor=last, prev_cursor=first if has_more else None)
+    return Page(rows, limit, next_cursor=last if has_more else None,
+                prev_cursor=first if after is not None else None)
+
+
+def tag_ids_for_names(names):
+    """resolve tag names to ids with a single IN lookup"""
+    if not names:
+        return set()
+    return set(db.session.execute(db.select(Tag.id).where(Tag.name.in_(names))).scalars())
+
+
+def existing_post_ids(ids):
+    """keep only the ids that belong to a post, with a single IN lookup"""
+    if not ids:
+        return set()
+    return set(db.session.execute(db.select(Post.id).where(Post.id.in_(ids))).scalars())
+
+
+def sync_links(owner, owner_id, other, wanted, existing=None):
+    """make the posts_tags rows for owner_id link to exactly the wanted ids
+
+    owner and other are the two PostTag columns, e.g. PostTag.post_id and
+    PostTag.tag_id. Only the difference against the current rows is deleted
+    and inserted, each in one statement; the caller commits. Pass existing=()
+    for a row that was just created and cannot have links yet. Returns the
+    ids of other whose link was added or removed.
+
+    Tag.post_count is adjusted to match in the same transaction."""
+    wanted = set(wanted)
+    if existing is None:
+        existing = set(db.session.execute(db.select(other).where(owner == owner_id)).scalars())
+    stale = set(existing) - wanted
+    if stale:
+        db.session.execute(db.delete(PostTag).where(owner == owner_id, other.in_(stale)))
+    new = wanted - set(existing)
+    if new:
+        db.session.execute(db.insert(PostTag), [{owner.key: owner_id, other.key: i} for i in new])
+    if other.key == 'tag_id':
+        adjust_post_counts(Tag, {**dict.fromkeys(new, 1), **dict.fromkeys(stale, -1)})
+    else:
+        adjust_post_counts(Tag, {owner_id: len(new) - len(stale)})
+    return stale | new
+
+
+def post_ids_for_tag(tag_id):
+    """ids of every post carrying a tag"""
+    return set(db.session.execute(db.select(PostTag.post_id).where(PostTag.tag_id == tag_id)).scalars())
+
+
+def touch(model, ids):
+    """bump updated_at on the given rows of model, whose pages changed"""
+    if ids:
+        db.session.execute(db.update(model).where(model.id.in_(ids)).values(updated_at=datetime.now()))
+
+
+def adjust_post_counts(model, deltas):
+    """add {id: change} to the post_count of rows of model
+
+    One UPDATE per model, with the change picked per row by a CASE.
+    updated_at is bumped as well, since listings show the count. The rows
+    are locked in id order first, so concurrent writes touching overlapping
+    tags wait for each other instead of deadlocking. On PostgreSQL the lock
+    is FOR NO KEY UPDATE, which does not conflict with the key share locks
+    that inserting posts_tags rows takes on the same tags."""
+    deltas = {row_id: delta for row_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    locked = db.select(model.id).where(model.id.in_(deltas)).order_by(model.id).with_for_update(key_share=True)
+    db.session.execute(db.update(model).where(model.id.in_(locked))
+                       .values(post_count=model.post_count + case(deltas, value=model.id),
+                               updated_at=datetime.now())
+                       .execution_options(synchronize_session=False))
+
+
+def tag_counts_for_posts(post_ids):
+    """{tag id: how many of the given posts carry it}"""
+    if not post_ids:
+        return {}
+    return dict(db.session.execute(
+        db.select(PostTag.tag_id, func.count())
+        .where(PostTag.post_id.in_(post_ids))
+        .group_by(PostTag.tag_id)).all())
+
+
+# Each counter and the column its rows are counted by
+POST_COUNTERS = ((User.__table__, Post.__table__.c.user_id),
+                 (Tag.__table__, PostTag.__table__.c.tag_id))
+
+
+def recount_posts(conn):
+    """recompute every post_count from posts and posts_tags in bulk
+
+    Works on a Connection or a Session, only touches rows whose count was
+    wrong, and returns how many were fixed."""
+    fixed = 0
+    now = datetime.now()
+    for table, counted_by in POST_COUNTERS:
+        counts = db.select(counted_by.label('id'), func.count().label('n')).group_by(counted_by).subquery()
+        fixed += conn.execute(
+            table.update()
+            .where(table.c.id == counts.c.id, table.c.post_count != counts.c.n)
+            .values(post_count=counts.c.n, updated_at=now)).rowcount
+        fixed += conn.execute(
+            table.update()
+            .where(table.c.post_count != 0, ~exists().where(counted_by == table.c.id))
+            .values(post_count=0, updated_at=now)).rowcount
+    return fixed
+
+
+def delete_users(user_ids):
+    """delete users in one statement, and their posts and links with them
+
+    posts and posts_tags rows go through ON DELETE CASCADE; the tag counts
+    they contributed to drop in one UPDATE first. The caller commits.
+    Returns the number of users deleted and the ids of their posts."""
+    if not user_ids:
+        return 0, set()
+    doomed = db.select(Post.id).where(Post.user_id.in_(user_ids))
+    post_ids = set(db.session.execute(doomed).scalars())
+    if post_ids:
+        links = (db.select(func.count()).select_from(PostTag)
+                 .where(PostTag.tag_id == Tag.id, PostTag.post_id.in_(doomed)).scalar_subquery())
+        db.session.execute(
+            db.update(Tag)
+            .where(Tag.id.in_(db.select(PostTag.tag_id).where(PostTag.post_id.in_(doomed))))
+            .values(post_count=Tag.post_count - links, updated_at=datetime.now())
+            .execution_options(synchronize_session=False))
+    deleted = db.session.execute(db.delete(User).where(User.id.in_(user_ids))).rowcount
+    return deleted, post_ids
+
+
+def delete_tags(tag_ids):
+    """delete tags in one statement, and their posts_tags rows with them
+
+    The tagged posts are touched, as their pages change. The caller
+    commits. Returns the number of tags deleted and the ids of the posts
+    that carried them."""
+    if not tag_ids:
+        return 0, set()
+    tagged = db.select(PostTag.post_id).where(PostTag.tag_id.in_(tag_ids))
+    post_ids = set(db.session.execute(tagged).scalars())
+    if post_ids:
+        db.session.execute(db.update(Post).where(Post.id.in_(tagged)).values(updated_at=datetime.now())
+                           .execution_options(synchronize_session=False))
+    deleted = db.session.execute(db.delete(Tag).where(Tag.id.in_(tag_ids))).rowcount
+    return deleted, post_ids
+
+
+def newest(*timestamps):
+    """the latest of some possibly missing timestamps"""
+    timestamps = [t for t in timestamps if t is not None]
+    return max(timestamps) if timestamps else None
+
+
+# Version lookups for conditional GET. Each returns None when the row is
+# missing, otherwise a tuple whose first item is the last-modified time and
+# whose whole value changes whenever the page built from it would.
+
+def post_version(post_id):
+    row = db.session.execute(
+        db.select(Post.updated_at, User.updated_at)
+        .outerjoin(User, User.id == Post.user_id)
+        .where(Post.id == post_id)).first()
+    return None if row is None else (newest(*row), *row)
+
+
+def user_version(user_id):
+    row = db.session.execute(
+        db.select(User.updated_at,
+                  db.select(func.max(Post.updated_at)).where(Post.user_id == User.id).scalar_subquery(),
+                  db.select(func.count(Post.id)).where(Post.user_id == User.id).scalar_subquery())
+        .where(User.id == user_id)).first()
+    return None if row is None else (newest(row[0], row[1]), *row)
+
+
+def tag_version(tag_id):
+    tagged = db.select(PostTag.post_id).where(PostTag.tag_id == Tag.id)
+    row = db.session.execute(
+        db.select(Tag.updated_at,
+                  db.select(func.max(Post.updated_at)).where(Post.id.in_(tagged)).scalar_subquery(),
+                  db.select(func.count()).select_from(PostTag).where(PostTag.tag_id == Tag.id).scalar_subquery())
+        .where(Tag.id == tag_id)).first()
+    return None if row is None else (newest(row[0], row[1]), *row)
+
+
+def feed_version():
+    row = db.session.execute(db.select(
+        db.select(func.max(Post.updated_at)).scalar_subquery(),
+        db.select(func.count(Post.id)).scalar_subquery(),
+        db.select(func.max(User.updated_at)).scalar_subquery(),
+        db.select(func.max(Tag.updated_at)).scalar_subquery())).first()
+    return (newest(row[0], row[2], row[3]), *row)
+
+
+def users_version():
+    row = db.session.execute(db.select(func.max(User.updated_at), func.count(User.id))).first()
+    return (row[0], *row)
+
+
+def tags_version():
+    row = db.session.execute(db.select(func.max(Tag.updated_at), func.count(Tag.id))).first()
+    return (row[0], *row)
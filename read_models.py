@@ -0,0 +1,138 @@
+"""Column-only read models for the Blogly listing pages.
+
+The listings need a handful of columns per row, so these queries select
+exactly those columns instead of whole entities. The author comes in
+through a join. Each post's tags come back as one aggregated list of
+"id<FIELD_SEPARATOR>name" pairs from a correlated subquery, so ids and
+names cannot come apart. PostgreSQL builds it with array_agg, ordered by
+name. Other databases use group_concat, which has no order, split back into
+a list when the rows are read and sorted by name in post_views(). Rows
+never enter the session's identity map and are turned straight into the
+slotted views of display.py.
+
+Each *_select() is a plain SELECT, so callers can add filters and paginate
+it with paginate(..., rows=True) or page_statement().
+"""
+
+from operator import itemgetter
+
+from sqlalchemy import String, TypeDecorator, cast, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.functions import GenericFunction
+
+from display import PostView, TagView, UserView
+from models import User, Post, Tag, PostTag
+
+# group_concat joins values with this, and tag_pairs() a tag's id and name
+# with FIELD_SEPARATOR; the tag routes reject names with control characters,
+# so neither can occur in one
+SEPARATOR = '\x1f'
+FIELD_SEPARATOR = '\x1e'
+
+
+class AggregatedList(TypeDecorator):
+    """A list aggregated by list_agg(): an array, or a SEPARATOR joined string"""
+
+    impl = String
+    cache_ok = True
+
+    def __init__(self, item_type=str):
+        super().__init__()
+        self.item_type = item_type
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = value.split(SEPARATOR)
+        return [self.item_type(item) for item in value]
+
+
+class list_agg(GenericFunction):
+    """list_agg(expr, order_by): expr of every row in the group, as a list"""
+
+    inherit_cache = True
+
+    def __init__(self, expr, order_by, item_type=str, **kwargs):
+        super().__init__(expr, order_by, **kwargs)
+        self.type = AggregatedList(item_type)
+
+
+@compiles(list_agg)
+def compile_group_concat(element, compiler, **kw):
+    expr, _ = element.clauses
+    return f"group_concat({compiler.process(expr, **kw)}, char({ord(SEPARATOR)}))"
+
+
+@compiles(list_agg, 'postgresql')
+def compile_array_agg(element, compiler, **kw):
+    expr, order_by = element.clauses
+    return f"array_agg({compiler.process(expr, **kw)} ORDER BY {compiler.process(order_by, **kw)})"
+
+
+def tag_pair(item):
+    tag_id, name = item.split(FIELD_SEPARATOR, 1)
+    return int(tag_id), name
+
+
+def tag_pairs():
+    """correlated subquery aggregating the (id, name) pairs of the tags of each post"""
+    link, tag = aliased(PostTag), aliased(Tag)
+    pair = cast(tag.id, String) + FIELD_SEPARATOR + tag.name
+    return (select(list_agg(pair, tag.name, tag_pair))
+            .join(link, link.tag_id == tag.id)
+            .where(link.post_id == Post.id)
+            .correlate(Post)
+            .scalar_subquery())
+
+
+def feed_select():
+    """posts newest first, each with its author's name and its tags"""
+    return (select(Post.id, Post.title, Post.content, Post.created_at, Post.updated_at, Post.user_id,
+                   User.first_name, User.last_name,
+                   tag_pairs().label('tags'))
+            .outerjoin(User, User.id == Post.user_id)
+            .order_by(Post.created_at.desc(), Post.id.desc()))
+
+
+def post_views(rows):
+    """PostViews of feed_select() rows; authors and tags are shared between posts"""
+    users, tags = {}, {}
+
+    def user_view(row):
+        if row.user_id is None:
+            return None
+        view = users.get(row.user_id)
+        if view is None:
+            view = users[row.user_id] = UserView(row.user_id, row.first_name, row.last_name)
+        return view
+
+    def tag_view(tag_id, name):
+        view = tags.get(tag_id)
+        if view is None:
+            view = tags[tag_id] = TagView(tag_id, name)
+        return view
+
+    return [PostView(row.id, row.title, row.content, row.created_at, user_view(row),
+                     [tag_view(tag_id, name) for tag_id, name in sorted(row.tags, key=itemgetter(1))],
+                     row.updated_at)
+            for row in rows]
+
+
+def user_select():
+    """the columns of the user list"""
+    return select(User.id, User.first_name, User.last_name, User.post_count)
+
+
+def user_views(rows):
+    return [UserView(row.id, row.first_name, row.last_name, post_count=row.post_count) for row in rows]
+
+
+def tag_select():
+    """the columns of the tag list"""
+    return select(Tag.id, Tag.name, Tag.post_count)
+
+
+def tag_views(rows):
+    return [TagView(row.id, row.name, row.post_count) for row in rows]
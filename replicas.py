@@ -0,0 +1,170 @@
+"""Read replica routing for Blogly.
+
+List replica URLs in DATABASE_REPLICA_URLS (comma separated) and the app gets
+an engine for each (see config.py). During a GET or HEAD request, SELECTs go
+to a healthy replica, chosen round robin. Flushes, INSERT/UPDATE/DELETE and
+every other method go to the primary.
+
+Any other request sets a short-lived cookie that keeps the client's reads on
+the primary for REPLICA_STICKY_SECONDS. The redirect after a write therefore
+shows the write even if the replicas have not replayed it yet.
+
+Each replica is checked at most every REPLICA_CHECK_INTERVAL seconds. On
+PostgreSQL the check fails when replay lags more than REPLICA_MAX_LAG_SECONDS
+behind. A failed check, or a connection error during a request, takes the
+replica out until its next check. The read that hit the error is run again
+on the primary, as are the rest of that request's reads. With no healthy
+replica, reads fall back to the primary.
+"""
+
+import itertools
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, create_engine, event
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+
+log = logging.getLogger('blogly.replicas')
+
+STICKY_COOKIE = 'blogly_read_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# seconds of replay lag; 0 when the replica has replayed everything it has
+# received, and NULL on a primary
+LAG_SQL = ("SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+           "ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END")
+
+
+class RoutingSession(Session):
+    """Session sending the SELECTs of a read request to g.read_bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and isinstance(clause, Select) and has_app_context():
+            read_bind = g.get('read_bind')
+            if read_bind is not None:
+                return read_bind
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def execute(self, statement, *args, **kwargs):
+        try:
+            return super().execute(statement, *args, **kwargs)
+        except DBAPIError:
+            read_bind = g.get('read_bind') if has_app_context() else None
+            if read_bind is None or current_app.extensions['replicas'].is_up(read_bind):
+                raise
+            # the replica was marked down by this error: read from the primary instead
+            log.warning("retrying a read on the primary after replica %s failed",
+                        read_bind.url.render_as_string())
+            g.read_bind = None
+            return super().execute(statement, *args, **kwargs)
+
+
+class Replica:
+    """A replica engine and the result of its last health check"""
+
+    __slots__ = ('engine', 'healthy', 'checked_at')
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = False
+        self.checked_at = None
+
+
+class ReplicaSet:
+    """Picks a healthy replica for each read request"""
+
+    def __init__(self, engines, check_interval=10, max_lag=10):
+        self.replicas = [Replica(engine) for engine in engines]
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """a healthy replica engine, or None to read from the primary"""
+        start = next(self._turn)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if self.is_healthy(replica):
+                return replica.engine
+        return None
+
+    def is_healthy(self, replica):
+        now = time.monotonic()
+        with self._lock:
+            due = replica.checked_at is None or now - replica.checked_at >= self.check_interval
+            if due:
+                # claim the check so concurrent requests do not repeat it
+                replica.checked_at = now
+        if due:
+            replica.healthy = self.check(replica.engine)
+        return replica.healthy
+
+    def check(self, engine):
+        """can engine be reached, and is it close enough to the primary?"""
+        try:
+            with engine.connect() as conn:
+                if conn.dialect.name == 'postgresql':
+                    lag = conn.exec_driver_sql(LAG_SQL).scalar()
+                    if lag is not None and self.max_lag and lag > self.max_lag:
+                        log.warning("replica %s is %.1fs behind", engine.url.render_as_string(), lag)
+                        return False
+                else:
+                    conn.exec_driver_sql('SELECT 1')
+            return True
+        except SQLAlchemyError as e:
+            log.warning("replica %s is unavailable: %s", engine.url.render_as_string(), e)
+            return False
+
+    def is_up(self, engine):
+        """was engine healthy at its last check, and not marked down since?"""
+        return any(replica.engine is engine and replica.healthy for replica in self.replicas)
+
+    def mark_down(self, engine):
+        """take a replica out of rotation until its next check"""
+        for replica in self.replicas:
+            if replica.engine is engine:
+                replica.healthy = False
+                replica.checked_at = time.monotonic()
+
+
+def init_app(app):
+    """route the reads of GET requests to app's DATABASE_REPLICAS, if any"""
+    if not app.config['DATABASE_REPLICAS']:
+        return
+    engines = [create_engine(**options) for options in app.config['DATABASE_REPLICAS']]
+    replicas = ReplicaSet(engines,
+                          check_interval=app.config['REPLICA_CHECK_INTERVAL'],
+                          max_lag=app.config['REPLICA_MAX_LAG_SECONDS'])
+    app.extensions['replicas'] = replicas
+
+    for engine in engines:
+        @event.listens_for(engine, 'handle_error')
+        def take_out(context, engine=engine):
+            if context.is_disconnect or context.connection is None:
+                replicas.mark_down(engine)
+
+    app.before_request(route_reads)
+    app.after_request(stick_to_primary)
+
+
+def replica_engines(app):
+    """the replica engines of app, which are not among db.engines"""
+    replicas = app.extensions.get('replicas')
+    return [replica.engine for replica in replicas.replicas] if replicas else []
+
+
+def route_reads():
+    if request.method in SAFE_METHODS and STICKY_COOKIE not in request.cookies:
+        g.read_bind = current_app.extensions['replicas'].choose()
+
+
+def stick_to_primary(response):
+    """keep this client's reads on the primary for a while after a write"""
+    if request.method not in SAFE_METHODS:
+        response.set_cookie(STICKY_COOKIE, '1', max_age=current_app.config['REPLICA_STICKY_SECONDS'],
+                            httponly=True, samesite='Lax')
+    return response
@@ -0,0 +1,144 @@
+"""Full text search over posts.
+
+On PostgreSQL, posts are matched against the generated search_vector column
+(see models.py) through its GIN index, ranked with ts_rank and highlighted
+with ts_headline. Other databases, such as SQLite in local test runs, fall
+back to matching and ranking in Python.
+
+Results come a page at a time, keyed on (rank, id) like the other listings.
+"""
+
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import REAL, cast, func, literal_column, tuple_
+
+from models import db, Post
+from queries import Page, decode_cursor, encode_cursor, page_size
+
+# ts_headline marks matches with these; they cannot occur in form input, so
+# the snippet can be escaped safely before they are turned into <mark> tags.
+START, STOP = '\x02', '\x03'
+HEADLINE_OPTIONS = f'StartSel={START}, StopSel={STOP}, MaxWords=35, MinWords=15, MaxFragments=2'
+SNIPPET_WORDS = 30
+
+
+class SearchResult:
+    """A post matching a search, with its rank and a highlighted snippet"""
+
+    __slots__ = ('id', 'title', 'snippet', 'rank')
+
+    def __init__(self, id, title, snippet, rank):
+        self.id = id
+        self.title = title
+        self.snippet = snippet
+        self.rank = rank
+
+
+def highlight(text):
+    """escape text and turn START/STOP markers into <mark> tags"""
+    return Markup(str(escape(text)).replace(START, '<mark>').replace(STOP, '</mark>'))
+
+
+def search_posts(q, after=None, before=None, limit=None):
+    """return a Page of SearchResults for q, best matches first
+
+    Raises ValueError for a malformed cursor."""
+    limit = page_size(limit)
+    q = q.strip()
+    if not q:
+        return Page([], limit)
+    if db.engine.dialect.name == 'postgresql':
+        rows, has_more = postgres_search(q, after, before, limit)
+    else:
+        rows, has_more = python_search(q, after, before, limit)
+    return make_page(rows, has_more, after, before, limit)
+
+
+def make_page(rows, has_more, after, before, limit):
+    if not rows:
+        return Page(rows, limit)
+    first, last = (encode_cursor([r.rank, r.id]) for r in (rows[0], rows[-1]))
+    if before is not None:
+        return Page(rows, limit, next_cursor=last, prev_cursor=first if has_more else None)
+    return Page(rows, limit, next_cursor=last if has_more else None,
+                prev_cursor=first if after is not None else None)
+
+
+def cursor_values(cursor):
+    rank, post_id = decode_cursor(cursor, (literal_column('rank', REAL), Post.id))
+    return float(rank), post_id
+
+
+def postgres_search(q, after, before, limit):
+    """rank matches in the database; only the returned page is highlighted"""
+    query = func.websearch_to_tsquery('english', q)
+    vector = literal_column('posts.search_vector')
+    rank = func.ts_rank(vector, query).label('rank')
+    stmt = db.select(Post.id, rank).where(vector.op('@@')(query))
+    backwards = before is not None
+    cursor = before if backwards else after
+    if cursor is not None:
+        # ts_rank returns a real; compare as real so the cursor round-trips exactly
+        cursor_rank, cursor_id = cursor_values(cursor)
+        value = tuple_(cast(cursor_rank, REAL), cursor_id)
+        key = tuple_(func.ts_rank(vector, query), Post.id)
+        stmt = stmt.where(key > value if backwards else key < value)
+    if backwards:
+        stmt = stmt.order_by(rank.asc(), Post.id.asc())
+    else:
+        stmt = stmt.order_by(rank.desc(), Post.id.desc())
+    page = stmt.limit(limit + 1).subquery()
+    snippet = func.ts_headline('english', Post.content, query, HEADLINE_OPTIONS)
+    rows = db.session.execute(
+        db.select(Post.id, Post.title, snippet, page.c.rank)
+        .join(page, page.c.id == Post.id)
+        .order_by(page.c.rank.desc(), Post.id.desc())).all()
+    has_more = len(rows) > limit
+    if has_more:
+        # the extra row is the one furthest from the cursor
+        rows = rows[1:] if backwards else rows[:limit]
+    return [SearchResult(id, title, highlight(snippet), rank) for id, title, snippet, rank in rows], has_more
+
+
+def python_search(q, after, before, limit):
+    """match, rank and highlight in Python, for databases without tsvector"""
+    terms = [t.lower() for t in re.findall(r'\w+', q)]
+    if not terms:
+        return [], False
+    stmt = db.select(Post.id, Post.title, Post.content)
+    for term in terms:
+        pattern = f'%{term}%'
+        stmt = stmt.where(Post.title.ilike(pattern) | Post.content.ilike(pattern))
+    matches = []
+    for post_id, title, content in db.session.execute(stmt.execution_options(yield_per=1000)):
+        title_l, content_l = title.lower(), content.lower()
+        rank = float(sum(2 * title_l.count(t) + content_l.count(t) for t in terms))
+        matches.append((rank, post_id, title, content))
+    matches.sort(key=lambda m: (m[0], m[1]), reverse=True)
+    if after is not None:
+        key = cursor_values(after)
+        matches = [m for m in matches if (m[0], m[1]) < key]
+    elif before is not None:
+        key = cursor_values(before)
+        matches = [m for m in matches if (m[0], m[1]) > key]
+        has_more = len(matches) > limit
+        return [python_result(m, terms) for m in matches[-limit:]], has_more
+    has_more = len(matches) > limit
+    return [python_result(m, terms) for m in matches[:limit]], has_more
+
+
+def python_result(match, terms):
+    rank, post_id, title, content = match
+    return SearchResult(post_id, title, highlight(python_snippet(content, terms)), rank)
+
+
+def python_snippet(content, terms):
+    """a window of words around the first match, with matches marked"""
+    words = content.split()
+    lowered = [w.lower() for w in words]
+    first = next((i for i, w in enumerate(lowered) if any(t in w for t in terms)), 0)
+    start = max(0, first - SNIPPET_WORDS // 3)
+    window = words[start:start + SNIPPET_WORDS]
+    marked = [f'{START}{w}{STOP}' if any(t in w.lower() for t in terms) else w for w in window]
+    return ' '.join(marked)
@@ -0,0 +1,258 @@
+"""Background tasks for Blogly.
+
+Write routes commit their transaction, enqueue slow follow-up work and
+redirect straight away; deleting a user or a tag, for one, queues a recount
+of every post_count. Cache invalidation is not such work: it is cheap and
+the next request must not see the old page, so routes do it inline after
+committing. A task is a function registered with @task whose arguments are
+JSON serializable; enqueue() takes the function and its arguments, plus an
+optional idempotency key. A task is
+dropped when its key is already in the queue, or for the database queue
+when it was ever used, so a retried request cannot queue the same work
+twice. Tasks themselves may run more than once, after a failure or a lost
+worker, and must be safe to repeat. Jobs that finished successfully are
+deleted after TASK_RETENTION seconds, freeing their keys.
+
+TASK_QUEUE picks where tasks run:
+
+    thread    a pool of TASK_WORKERS threads in each web process (default);
+              queued tasks are lost if the process dies
+    database  the jobs table, drained by `flask worker` processes; tasks
+              survive restarts and are shared by every web process; a
+              cache named by a task's @task(caches=...) must be shared too,
+              so a memory:// URL for it is refused
+    eager     inline, before enqueue() returns; for tests
+
+Failed tasks are retried up to TASK_MAX_ATTEMPTS times, waiting
+TASK_RETRY_DELAY seconds, doubled after each attempt, in between.
+"""
+
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from flask import current_app
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Job
+
+log = logging.getLogger('blogly.tasks')
+
+TASKS = {}
+
+
+def task(fn=None, *, caches=()):
+    """register fn as a task that enqueue() can run in the background
+
+    caches names the settings of the caches fn reads or writes, such as
+    'PAGE_CACHE_URL', which a worker process can only reach when shared."""
+    if fn is None:
+        return partial(task, caches=caches)
+    fn.task_name = f"{fn.__module__}.{fn.__qualname__}"
+    fn.caches = tuple(caches)
+    TASKS[fn.task_name] = fn
+    return fn
+
+
+def enqueue(fn, *args, key=None):
+    """run the task fn(*args) in the background of the current app"""
+    current_app.extensions['tasks'].enqueue(fn.task_name, list(args), key)
+
+
+def retry_delay(base, attempt):
+    """seconds to wait after failed attempt number attempt (1 based)"""
+    return base * 2 ** (attempt - 1)
+
+
+class EagerQueue:
+    """Runs each task as it is enqueued, letting its exceptions through"""
+
+    def __init__(self):
+        self.keys = set()
+
+    def enqueue(self, name, args, key=None):
+        if key is not None:
+            if key in self.keys:
+                return
+            self.keys.add(key)
+        TASKS[name](*args)
+
+
+class ThreadQueue:
+    """Runs tasks on a thread pool inside the web process
+
+    The pool starts with the first task, so that building the app before
+    forking workers starts no threads. Keys are remembered while their task
+    is pending."""
+
+    def __init__(self, app, workers=4, max_attempts=5, delay=2):
+        self.app = app
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.delay = delay
+        self.pending = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, name, args, key=None):
+        with self._lock:
+            if key is not None:
+                if key in self.pending:
+                    return
+                self.pending.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='blogly-task')
+        self._executor.submit(self.run, name, args, key)
+
+    def run(self, name, args, key):
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                with self.app.app_context():
+                    try:
+                        TASKS[name](*args)
+                        return
+                    except Exception:
+                        db.session.rollback()
+                        log.exception("task %s failed (attempt %d of %d)", name, attempt, self.max_attempts)
+                if attempt < self.max_attempts:
+                    time.sleep(retry_delay(self.delay, attempt))
+        finally:
+            if key is not None:
+                with self._lock:
+                    self.pending.discard(key)
+
+    def shutdown(self, wait=True):
+        """finish the queued tasks"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+class TableQueue:
+    """Keeps tasks in the jobs table until a `flask worker` runs them
+
+    A worker claims jobs with SELECT ... FOR UPDATE SKIP LOCKED on
+    PostgreSQL, so any number of workers can share the table. A job whose
+    worker has held it for longer than lock_timeout seconds is assumed lost
+    and is claimed again. Finished jobs stay in the table, marked done or
+    failed, so their keys keep blocking duplicates. Done jobs older than
+    retention seconds are deleted by purge(), which idle workers run every
+    PURGE_INTERVAL seconds; failed jobs stay for inspection."""
+
+    PURGE_INTERVAL = 60
+
+    def __init__(self, max_attempts=5, delay=2, lock_timeout=300, retention=7 * 24 * 3600):
+        self.max_attempts = max_attempts
+        self.delay = delay
+        self.lock_timeout = lock_timeout
+        self.retention = retention
+        self.purged_at = None
+
+    def enqueue(self, name, args, key=None):
+        with db.engine.begin() as conn:
+            try:
+                with conn.begin_nested():
+                    conn.execute(db.insert(Job).values(name=name, args=args, key=key, status='queued',
+                                                       attempts=0, max_attempts=self.max_attempts,
+                                                       run_at=datetime.now(), created_at=datetime.now()))
+            except IntegrityError:
+                log.info("task %s with key %s is already queued", name, key)
+
+    def claim(self, limit=10):
+        """mark up to limit runnable jobs as running; return them as (id, name, args, attempts, max_attempts)"""
+        now = datetime.now()
+        runnable = (db.select(Job.id)
+                    .where(or_(and_(Job.status == 'queued', Job.run_at <= now),
+                               and_(Job.status == 'running',
+                                    Job.locked_at < now - timedelta(seconds=self.lock_timeout))))
+                    .order_by(Job.run_at, Job.id)
+                    .limit(limit)
+                    .with_for_update(skip_locked=True))
+        jobs = db.session.execute(
+            db.update(Job).where(Job.id.in_(runnable))
+            .values(status='running', locked_at=now, attempts=Job.attempts + 1)
+            .returning(Job.id, Job.name, Job.args, Job.attempts, Job.max_attempts)
+            .execution_options(synchronize_session=False)).all()
+        db.session.commit()
+        return sorted(jobs, key=lambda job: job.id)
+
+    def run(self, job):
+        """run a claimed job and record how it went; return True if it succeeded"""
+        try:
+            TASKS[job.name](*job.args)
+            db.session.commit()
+            values = {'status': 'done', 'finished_at': datetime.now(), 'last_error': None}
+            succeeded = True
+        except Exception:
+            db.session.rollback()
+            log.exception("job %d (%s) failed (attempt %d of %d)", job.id, job.name, job.attempts, job.max_attempts)
+            error = traceback.format_exc()
+            succeeded = False
+            if job.attempts < job.max_attempts:
+                values = {'status': 'queued', 'last_error': error,
+                          'run_at': datetime.now() + timedelta(seconds=retry_delay(self.delay, job.attempts))}
+            else:
+                values = {'status': 'failed', 'last_error': error, 'finished_at': datetime.now()}
+        db.session.execute(db.update(Job).where(Job.id == job.id).values(locked_at=None, **values)
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+        return succeeded
+
+    def purge(self):
+        """delete the jobs that finished successfully over retention seconds ago; return how many"""
+        cutoff = datetime.now() - timedelta(seconds=self.retention)
+        deleted = db.session.execute(
+            db.delete(Job).where(Job.status == 'done', Job.finished_at < cutoff)
+            .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        self.purged_at = time.monotonic()
+        return deleted
+
+    def work(self, burst=False, poll_interval=1, batch=10):
+        """run jobs until stopped, or with burst until none is runnable
+
+        Returns the number of jobs that succeeded and that failed."""
+        done = failed = 0
+        while True:
+            jobs = self.claim(batch)
+            if not jobs:
+                if self.purged_at is None or time.monotonic() - self.purged_at > self.PURGE_INTERVAL:
+                    self.purge()
+                if burst:
+                    return done, failed
+                time.sleep(poll_interval)
+                continue
+            for job in jobs:
+                if self.run(job):
+                    done += 1
+                else:
+                    failed += 1
+
+
+def make_queue(app):
+    """the task queue TASK_QUEUE asks for"""
+    kind = app.config['TASK_QUEUE']
+    if kind == 'eager':
+        return EagerQueue()
+    if kind == 'thread':
+        return ThreadQueue(app, workers=app.config['TASK_WORKERS'],
+                           max_attempts=app.config['TASK_MAX_ATTEMPTS'], delay=app.config['TASK_RETRY_DELAY'])
+    if kind == 'database':
+        local = sorted({name for fn in TASKS.values() for name in fn.caches
+                        if app.config[name].startswith('memory://')})
+        if local:
+            raise RuntimeError(f"TASK_QUEUE=database runs tasks in `flask worker` processes, which cannot "
+                               f"reach a memory:// cache; set {' and '.join(local)} to a redis:// URL")
+        return TableQueue(max_attempts=app.config['TASK_MAX_ATTEMPTS'], delay=app.config['TASK_RETRY_DELAY'],
+                          lock_timeout=app.config['TASK_LOCK_TIMEOUT'], retention=app.config['TASK_RETENTION'])
+    raise ValueError(f"Unknown TASK_QUEUE {kind!r}")
+
+
+def init_app(app):
+    """give app the task queue chosen by its TASK_QUEUE setting"""
+    app.extensions['tasks'] = make_queue(app)
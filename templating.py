@@ -0,0 +1,46 @@
+"""Template loading for Blogly deployments.
+
+By default templates are compiled from templates/ on first use in every
+worker. Two settings avoid that work:
+
+    TEMPLATE_BYTECODE_CACHE_DIR   compiled templates are kept in this
+                                  directory and shared by all workers
+    TEMPLATE_PRECOMPILED_DIR      templates are imported from the modules
+                                  that `flask compile-templates` writes here
+
+Outside debug mode auto-reload (TEMPLATES_AUTO_RELOAD) is off, so a loaded
+template is never checked against its source file again. Both settings only
+apply to app.py; the async app compiles its templates for asyncio and keeps
+its own loader.
+"""
+
+import os
+
+from jinja2 import ChoiceLoader, FileSystemBytecodeCache, ModuleLoader
+
+
+def init_app(app):
+    """set up app's template loading from its TEMPLATE_* settings"""
+    cache_dir = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    precompiled = app.config['TEMPLATE_PRECOMPILED_DIR']
+    if precompiled:
+        if not os.path.isdir(precompiled):
+            raise RuntimeError(f"{precompiled} does not exist; run `flask compile-templates` first")
+        # templates that were not compiled, such as the debug toolbar's, still load from source
+        app.jinja_env.loader = ChoiceLoader([ModuleLoader(precompiled), app.jinja_env.loader])
+
+
+def compile_templates(app, target):
+    """compile every template app can load into modules in target
+
+    Compiles from the template sources even when app already loads
+    precompiled templates. Returns the names of the compiled templates."""
+    env = app.jinja_env.overlay(loader=app.create_global_jinja_loader())
+    names = env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    os.makedirs(target, exist_ok=True)
+    env.compile_templates(target, zip=None, ignore_errors=False,
+                          filter_func=lambda name: name in names)
+    return names
@@ -0,0 +1,121 @@
+import json
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from app import create_app
+from config import TestingConfig
+from models import db, User, Post, Tag, PostTag
+import api
+
+app = create_app(TestingConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class ApiTestCase(TestCase):
+    """Tests for the JSON API."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        PostTag.query.delete()
+        Post.query.delete()
+        Tag.query.delete()
+        User.query.delete()
+
+        user = User(first_name="Jane", last_name="Doe", post_count=30)
+        tags = [Tag(name="alpha"), Tag(name="beta")]
+        db.session.add_all([user, *tags])
+        db.session.flush()
+        posts = [Post(title=f"post {i}", content="content", user_id=user.id) for i in range(30)]
+        db.session.add_all(posts)
+        db.session.flush()
+        db.session.add_all([PostTag(post_id=posts[0].id, tag_id=tag.id) for tag in tags])
+        db.session.commit()
+        self.user_id = user.id
+        self.post_ids = [post.id for post in posts]
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Leave fresh tables, and id sequences, for the modules that run next."""
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+    def test_user_detail_fields(self):
+        with app.test_client() as client:
+            resp = client.get(f'/api/v1/users/{self.user_id}?fields=first_name,post_count')
+        self.assertEqual(resp.json, {'data': {'first_name': 'Jane', 'post_count': 30}})
+
+    def test_post_detail_with_tags(self):
+        with app.test_client() as client:
+            resp = client.get(f'/api/v1/posts/{self.post_ids[0]}?fields=title,tags')
+        self.assertEqual(resp.json, {'data': {'title': 'post 0', 'tags': ['alpha', 'beta']}})
+
+    def test_missing_and_bad_requests(self):
+        with app.test_client() as client:
+            resp = client.get('/api/v1/users/0')
+            self.assertEqual(resp.status_code, 404)
+            self.assertEqual(resp.json['status'], 404)
+            self.assertEqual(client.get('/api/v1/users?fields=password').status_code, 400)
+            self.assertEqual(client.get('/api/v1/posts?after=garbage').status_code, 400)
+            resp = client.get('/api/v1/nothing')
+            self.assertEqual((resp.status_code, resp.mimetype), (404, 'application/json'))
+            self.assertEqual(resp.json['error'], 'Not Found')
+            self.assertEqual(client.get('/nothing').mimetype, 'text/html')
+
+    def test_post_listing_pages(self):
+        seen = []
+        with app.test_client() as client:
+            url = '/api/v1/posts?fields=id&limit=12'
+            while url:
+                body = client.get(url).json
+                seen += [item['id'] for item in body['data']]
+                self.assertEqual(set(body['data'][0]), {'id'})
+                url = body['next_cursor'] and f"/api/v1/posts?fields=id&limit=12&after={body['next_cursor']}"
+        self.assertEqual(sorted(seen), sorted(self.post_ids))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_tag_listing(self):
+        with app.test_client() as client:
+            body = client.get('/api/v1/tags?fields=name').json
+        self.assertEqual(body['data'], [{'name': 'alpha'}, {'name': 'beta'}])
+        self.assertIsNone(body['next_cursor'])
+
+    def test_export_streams_ndjson(self):
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            with app.test_client() as client:
+                api.EXPORT_BATCH_SIZE, batch_size = 10, api.EXPORT_BATCH_SIZE
+                try:
+                    resp = client.get('/api/v1/posts/export?fields=id,title,created_at,tags')
+                    self.assertTrue(resp.is_streamed)
+                    lines = resp.get_data(as_text=True).splitlines()
+                finally:
+                    api.EXPORT_BATCH_SIZE = batch_size
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([r['id'] for r in records], sorted(self.post_ids))
+        self.assertEqual(records[0]['tags'], ['alpha', 'beta'])
+        self.assertEqual(records[1]['tags'], [])
+        self.assertIsInstance(records[0]['created_at'], str)
+        # one tag lookup per batch of 10 posts
+        self.assertEqual(sum('posts_tags' in s for s in statements), 3)
+
+    def test_export_resumes_after_id(self):
+        with app.test_client() as client:
+            resp = client.get(f'/api/v1/posts/export?fields=id&after={self.post_ids[-3]}')
+        self.assertEqual([json.loads(line)['id'] for line in resp.get_data(as_text=True).splitlines()],
+                         self.post_ids[-2:])
@@ -0,0 +1,108 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from app import create_app
+from async_app import create_async_app
+from config import TestingConfig, async_database_url, async_engine_options
+from models import db, User, Post, Tag, PostTag
+
+app = create_app(TestingConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class AsyncConfigTestCase(TestCase):
+    """Tests for the asyncio engine settings."""
+
+    def test_async_database_url(self):
+        self.assertEqual(async_database_url('postgresql:///blogly'), 'postgresql+asyncpg:///blogly')
+        self.assertEqual(async_database_url('postgresql+psycopg2://u:p@db/blogly'), 'postgresql+asyncpg://u:p@db/blogly')
+        self.assertEqual(async_database_url('sqlite:///blogly.db'), 'sqlite+aiosqlite:///blogly.db')
+
+    def test_async_engine_options(self):
+        options = async_engine_options('postgresql:///blogly', {'DB_STATEMENT_TIMEOUT_MS': '500'})
+        self.assertNotIn('poolclass', options)
+        self.assertEqual(options['connect_args'], {'server_settings': {'statement_timeout': '500'}})
+
+
+class AsyncViewsTestCase(IsolatedAsyncioTestCase):
+    """Tests for the async read routes, against data written by the sync app."""
+
+    def setUp(self):
+        with app.app_context():
+            PostTag.query.delete()
+            Post.query.delete()
+            Tag.query.delete()
+            User.query.delete()
+            user = User(first_name="Jane", last_name="Doe")
+            tag = Tag(name="testing")
+            db.session.add_all([user, tag])
+            db.session.flush()
+            posts = [Post(title=f"post {i}", content="async content", user_id=user.id) for i in range(25)]
+            db.session.add_all(posts)
+            db.session.flush()
+            db.session.add(PostTag(post_id=posts[0].id, tag_id=tag.id))
+            db.session.commit()
+            self.user_id, self.tag_id, self.post_id = user.id, tag.id, posts[0].id
+
+    @classmethod
+    def tearDownClass(cls):
+        """Leave fresh tables, and id sequences, for the modules that run next."""
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+    async def asyncSetUp(self):
+        self.app = create_async_app(TestingConfig)
+        self.client = self.app.test_client()
+
+    async def asyncTearDown(self):
+        await self.app.extensions['async_engine'].dispose()
+
+    async def get(self, path):
+        resp = await self.client.get(path)
+        return resp.status_code, await resp.get_data(as_text=True)
+
+    async def test_home_page(self):
+        status, html = await self.get('/')
+        self.assertEqual(status, 200)
+        self.assertIn('Blogly Recent Posts', html)
+        self.assertIn('Jane Doe', html)
+
+    async def test_show_posts_pages(self):
+        status, html = await self.get('/posts?limit=20')
+        self.assertEqual(status, 200)
+        self.assertIn('post 24', html)
+        self.assertNotIn('post 0<', html)
+        self.assertIn('Next', html)
+        self.assertEqual((await self.get('/posts?after=garbage'))[0], 400)
+
+    async def test_sees_sync_writes(self):
+        self.assertIn('post 0<', (await self.get('/posts?limit=50'))[1])
+        with app.test_client() as client:
+            client.post(f'/posts/{self.post_id}/edit', data={'title': 'edited by the sync app', 'content': 'c'})
+        status, html = await self.get('/posts?limit=50')
+        self.assertIn('edited by the sync app', html)
+        self.assertNotIn('post 0<', html)
+
+    async def test_show_post(self):
+        status, html = await self.get(f'/posts/{self.post_id}')
+        self.assertEqual(status, 200)
+        self.assertIn('post 0', html)
+        self.assertIn('testing', html)
+        self.assertEqual((await self.get('/posts/0'))[0], 404)
+
+    async def test_show_user(self):
+        status, html = await self.get(f'/users/{self.user_id}')
+        self.assertEqual(status, 200)
+        self.assertIn('Jane Doe', html)
+        self.assertIn('post 24', html)
+
+    async def test_show_tag(self):
+        status, html = await self.get(f'/tags/{self.tag_id}')
+        self.assertEqual(status, 200)
+        self.assertIn('testing', html)
+        self.assertIn('post 0', html)
+        self.assertNotIn('post 1<', html)
@@ -0,0 +1,206 @@
+from unittest import TestCase, mock
+import io
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from app import create_app
+from avatars import AvatarCache, avatar_url, check_host, fetch, AvatarError
+from config import TestingConfig
+from models import db, User
+
+app = create_app(TestingConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+def png(width, height, color):
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(out, 'PNG')
+    return out.getvalue()
+
+
+class ImageHost(BaseHTTPRequestHandler):
+    """Stands in for the remote hosts of User.image_url."""
+
+    images = {'/big.png': png(600, 400, 'red'), '/same.png': png(600, 400, 'red'),
+              '/other.png': png(300, 300, 'blue'), '/junk.png': b'not an image'}
+    redirects = {'/moved.png': '/big.png?from=moved', '/loop.png': '/loop.png', '/escape.png': 'file:///etc/passwd'}
+    hits = []
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.path in self.redirects:
+            self.send_response(302)
+            self.send_header('Location', self.redirects[self.path])
+            self.end_headers()
+            return
+        body = self.images.get(self.path.split('?')[0])
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AvatarTestCase(TestCase):
+    """Tests for the avatar proxy."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHost)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.host = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.app = self.make_app()
+        ImageHost.hits.clear()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        User.query.delete()
+        self.user = User(first_name="Jane", last_name="Doe", image_url=f"{self.host}/big.png")
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def make_app(self, **settings):
+        settings.setdefault('AVATAR_CACHE_DIR', self.dir)
+        return create_app(type('Config', (TestingConfig,), settings))
+
+    def get(self, path, app=None, **kwargs):
+        with (app or self.app).test_client() as client:
+            return client.get(path, **kwargs)
+
+    def test_fetches_once_and_caches(self):
+        resp = self.get(avatar_url(self.user))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'image/jpeg')
+        self.assertEqual(Image.open(io.BytesIO(resp.data)).size, (128, 128))
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        self.assertEqual(resp.cache_control.max_age, 365 * 24 * 3600)
+
+        again = self.get(avatar_url(self.user), headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.get(avatar_url(self.user, 48)).status_code, 200)
+        self.assertEqual(ImageHost.hits, ['/big.png'])
+
+    def test_stale_version_is_not_cached_for_long(self):
+        resp = self.get(f'/avatars/{self.user.id}?size=48&v=old')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.cache_control.max_age, 300)
+
+    def test_same_image_shares_files(self):
+        other = User(first_name="John", last_name="Roe", image_url=f"{self.host}/same.png")
+        db.session.add(other)
+        db.session.commit()
+        self.get(avatar_url(self.user))
+        self.get(avatar_url(other))
+        thumbnails = [name for _, _, names in os.walk(self.dir) for name in names if name.endswith('.jpg')]
+        self.assertEqual(len(thumbnails), 1)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get(f'/avatars/{self.user.id}?size=37').status_code, 400)
+        self.assertEqual(self.get('/avatars/0').status_code, 404)
+
+    def test_unusable_images_redirect(self):
+        self.user.image_url = f"{self.host}/junk.png"
+        db.session.commit()
+        resp = self.get(avatar_url(self.user))
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.location, f"{self.host}/junk.png")
+
+        strict = self.make_app(AVATAR_ALLOW_PRIVATE_HOSTS=False)
+        self.user.image_url = f"{self.host}/big.png"
+        db.session.commit()
+        self.assertEqual(self.get(avatar_url(self.user), app=strict).status_code, 302)
+        self.assertEqual(ImageHost.hits, ['/junk.png'])
+
+    def test_follows_checked_redirects(self):
+        self.user.image_url = f"{self.host}/moved.png"
+        db.session.commit()
+        self.assertEqual(self.get(avatar_url(self.user)).status_code, 200)
+        self.assertEqual(ImageHost.hits, ['/moved.png', '/big.png?from=moved'])
+
+        with self.assertRaisesRegex(AvatarError, 'not an http'):
+            fetch(f"{self.host}/escape.png", 5, 1000, allow_private=True)
+        with self.assertRaisesRegex(AvatarError, 'too many redirects'):
+            fetch(f"{self.host}/loop.png", 5, 1000, allow_private=True)
+        with self.assertRaisesRegex(AvatarError, 'not a public address'):
+            fetch(f"{self.host}/moved.png", 5, 1000)
+
+    def test_evicted_original_redirects(self):
+        self.get(avatar_url(self.user))
+        cache = self.app.extensions['avatars'].cache
+        digest = cache.digest_for(self.user.image_url)
+        os.remove(cache.path(digest))
+        # evicted by another request after digest_for() found it
+        with mock.patch.object(cache, 'digest_for', return_value=digest):
+            resp = self.get(avatar_url(self.user, 48))
+        self.assertEqual(resp.status_code, 302)
+
+    def test_resizes_in_process_pool(self):
+        pooled = self.make_app(AVATAR_PROCESSES=1)
+        self.addCleanup(pooled.extensions['avatars'].shutdown)
+        resp = self.get(avatar_url(self.user, 256), app=pooled)
+        self.assertEqual(Image.open(io.BytesIO(resp.data)).size, (256, 256))
+
+    def test_user_page_links_proxy(self):
+        html = self.get(f'/users/{self.user.id}').get_data(as_text=True)
+        self.assertIn(f'src="/avatars/{self.user.id}?size=128&amp;v=', html)
+        self.assertNotIn('big.png', html)
+
+
+class AvatarCacheTestCase(TestCase):
+    """Tests for the bounded on-disk cache."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_evicts_least_recently_used(self):
+        cache = AvatarCache(self.dir, max_bytes=2500)
+        paths = [cache.put(os.path.join(self.dir, 'ab', f'{i}.jpg'), b'x' * 1000) for i in range(2)]
+        os.utime(paths[0], (1, 1))
+        os.utime(paths[1], (2, 2))
+        self.assertIsNotNone(cache.get(paths[0]))
+        cache.put(os.path.join(self.dir, 'ab', '2.jpg'), b'x' * 1000)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir, 'ab'))), ['0.jpg', '2.jpg'])
+        self.assertEqual(cache.size, 2000)
+
+    def test_counts_size_without_scanning(self):
+        cache = AvatarCache(self.dir, max_bytes=10000)
+        with mock.patch.object(cache, 'files', wraps=cache.files) as files:
+            for i in range(5):
+                cache.put(os.path.join(self.dir, 'ab', f'{i}.jpg'), b'x' * 1000)
+            cache.put(os.path.join(self.dir, 'ab', '0.jpg'), b'x' * 500)
+        self.assertEqual(files.call_count, 1)
+        self.assertEqual(cache.size, 4500)
+
+    def test_check_host(self):
+        with self.assertRaises(AvatarError):
+            check_host('file:///etc/passwd')
+        with self.assertRaises(AvatarError):
+            check_host('http://127.0.0.1/avatar.png')
+        self.assertEqual(check_host('http://127.0.0.1/avatar.png', allow_private=True), '127.0.0.1')
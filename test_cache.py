@@ -0,0 +1,111 @@
+from unittest import TestCase
+import time
+
+from cache import LRUCache, RedisCache, make_cache
+
+
+class FakeRedis:
+    """Just enough of the redis-py client API for RedisCache."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode()
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in self.data if key.startswith(match.rstrip('*'))]
+
+
+class LRUCacheTestCase(TestCase):
+    """Tests for the in-process cache."""
+
+    def test_get_set_delete(self):
+        cache = LRUCache()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'one')
+        self.assertEqual(cache.get('a'), 'one')
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual(cache.get('a'), '1')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set('a', '1')
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+
+    def test_add(self):
+        cache = LRUCache()
+        self.assertTrue(cache.add('lock', '1', ttl=0.01))
+        self.assertFalse(cache.add('lock', '2', ttl=0.01))
+        self.assertEqual(cache.get('lock'), '1')
+        time.sleep(0.02)
+        self.assertTrue(cache.add('lock', '3'))
+
+    def test_stats(self):
+        cache = LRUCache()
+        cache.set('a', '1')
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(cache.stats.snapshot(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+
+class RedisCacheTestCase(TestCase):
+    """Tests for the Redis-backed cache."""
+
+    def test_prefix_and_decode(self):
+        client = FakeRedis()
+        cache = RedisCache(client, prefix='t:')
+        cache.set('a', 'one')
+        self.assertIn('t:a', client.data)
+        self.assertEqual(cache.get('a'), 'one')
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats.hits, 1)
+        self.assertEqual(cache.stats.misses, 1)
+
+    def test_add(self):
+        cache = RedisCache(FakeRedis(), prefix='t:')
+        self.assertTrue(cache.add('lock', '1', ttl=5))
+        self.assertFalse(cache.add('lock', '2', ttl=5))
+        self.assertEqual(cache.get('lock'), '1')
+
+    def test_clear_only_own_keys(self):
+        client = FakeRedis()
+        client.data['other'] = b'x'
+        cache = RedisCache(client, prefix='t:')
+        cache.set('a', '1')
+        cache.clear()
+        self.assertEqual(list(client.data), ['other'])
+
+
+class MakeCacheTestCase(TestCase):
+
+    def test_memory_url(self):
+        cache = make_cache('memory://', maxsize=5, ttl=10)
+        self.assertIsInstance(cache, LRUCache)
+        self.assertEqual(cache.maxsize, 5)
+
+    def test_unknown_url(self):
+        with self.assertRaises(ValueError):
+            make_cache('memcached://localhost')
@@ -0,0 +1,126 @@
+from unittest import TestCase, skipIf
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from app import create_app
+from compression import brotli, build_assets, fingerprint, BUILD_DIR, MANIFEST
+from config import TestingConfig
+from models import db, User
+
+app = create_app(TestingConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class CompressResponseTestCase(TestCase):
+    """Tests for compressing responses on the fly."""
+
+    @classmethod
+    def setUpClass(cls):
+        with app.app_context():
+            db.session.add_all([User(first_name=f"First{i}", last_name=f"Last{i}") for i in range(20)])
+            db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+    def get(self, path, encoding=None):
+        with app.test_client() as client:
+            return client.get(path, headers={'Accept-Encoding': encoding} if encoding else {})
+
+    def test_gzip(self):
+        plain = self.get('/users')
+        resp = self.get('/users', 'gzip')
+        self.assertIsNone(plain.content_encoding)
+        self.assertEqual(resp.content_encoding, 'gzip')
+        self.assertEqual(gzip.decompress(resp.data), plain.data)
+        self.assertEqual(resp.content_length, len(resp.data))
+        self.assertIn('Accept-Encoding', resp.vary)
+        self.assertIn('Accept-Encoding', plain.vary)
+
+    @skipIf(brotli is None, "brotli is not installed")
+    def test_brotli_preferred(self):
+        resp = self.get('/users', 'gzip, deflate, br')
+        self.assertEqual(resp.content_encoding, 'br')
+        self.assertEqual(brotli.decompress(resp.data), self.get('/users').data)
+
+    def test_small_and_error_responses_untouched(self):
+        small = create_app(type('Config', (TestingConfig,), {'COMPRESS_MIN_SIZE': 10 ** 6}))
+        with small.test_client() as client:
+            self.assertIsNone(client.get('/users', headers={'Accept-Encoding': 'gzip'}).content_encoding)
+        missing = self.get('/no/such/page', 'gzip')
+        self.assertEqual(missing.status_code, 404)
+        self.assertIsNone(missing.content_encoding)
+
+    def test_disabled(self):
+        off = create_app(type('Config', (TestingConfig,), {'COMPRESS_ENABLED': False}))
+        with off.test_client() as client:
+            self.assertIsNone(client.get('/users', headers={'Accept-Encoding': 'gzip'}).content_encoding)
+
+
+class StaticAssetsTestCase(TestCase):
+    """Tests for fingerprinted, precompressed static assets."""
+
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static)
+        os.makedirs(os.path.join(self.static, 'css'))
+        with open(os.path.join(self.static, 'app.css'), 'w') as f:
+            f.write('body { margin: 0; }\n' * 100)
+        with open(os.path.join(self.static, 'css', 'extra.css'), 'w') as f:
+            f.write('p { color: red; }\n')
+
+    def built_app(self):
+        self.manifest = build_assets(self.static)
+        built = create_app(TestingConfig)
+        built.static_folder = self.static
+        built.extensions['asset_manifest'].update(self.manifest)
+        return built
+
+    def test_build_assets(self):
+        manifest = build_assets(self.static)
+        with open(os.path.join(self.static, 'app.css'), 'rb') as f:
+            self.assertEqual(manifest['app.css'], fingerprint('app.css', f.read()))
+        self.assertRegex(manifest['css/extra.css'], r'^css/extra\.[0-9a-f]{12}\.css$')
+        build = os.path.join(self.static, BUILD_DIR)
+        with open(os.path.join(build, MANIFEST)) as f:
+            self.assertEqual(json.load(f), manifest)
+        with open(os.path.join(build, manifest['app.css'] + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), b'body { margin: 0; }\n' * 100)
+
+        with open(os.path.join(self.static, 'app.css'), 'a') as f:
+            f.write('h1 { margin: 0; }\n')
+        rebuilt = build_assets(self.static)
+        self.assertNotEqual(rebuilt['app.css'], manifest['app.css'])
+        self.assertFalse(os.path.exists(os.path.join(build, manifest['app.css'])))
+        self.assertTrue(os.path.exists(os.path.join(build, rebuilt['app.css'])))
+
+    def test_templates_link_fingerprinted_assets(self):
+        built = self.built_app()
+        with built.test_client() as client:
+            html = client.get('/users').get_data(as_text=True)
+        self.assertIn(f'href="/static/{BUILD_DIR}/{self.manifest["app.css"]}"', html)
+        with app.test_client() as client:
+            self.assertIn('href="/static/app.css"', client.get('/users').get_data(as_text=True))
+
+    def test_serves_precompressed_immutable(self):
+        built = self.built_app()
+        url = f'/static/{BUILD_DIR}/{self.manifest["app.css"]}'
+        with built.test_client() as client:
+            resp = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            plain = client.get(url)
+        self.assertEqual(resp.content_encoding, 'gzip')
+        self.assertEqual(resp.mimetype, 'text/css')
+        self.assertEqual(gzip.decompress(resp.data), plain.data)
+        self.assertEqual(resp.cache_control.max_age, 365 * 24 * 3600)
+        self.assertTrue(resp.cache_control.immutable)
+        self.assertIsNone(plain.content_encoding)
+        self.assertIn('Accept-Encoding', plain.vary)
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+from config import engine_options, env_bool, env_int, env_list, replica_options
+from pool import TimedQueuePool
+
+
+class ConfigTestCase(TestCase):
+    """Tests for environment-driven settings."""
+
+    def test_env_bool(self):
+        self.assertTrue(env_bool('ECHO', False, {'ECHO': 'true'}))
+        self.assertFalse(env_bool('ECHO', True, {'ECHO': '0'}))
+        self.assertTrue(env_bool('ECHO', True, {}))
+
+    def test_env_int(self):
+        self.assertEqual(env_int('SIZE', 5, {'SIZE': '12'}), 12)
+        self.assertEqual(env_int('SIZE', 5, {'SIZE': ''}), 5)
+
+    def test_postgres_defaults(self):
+        options = engine_options('postgresql:///blogly', {})
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['pool_size'], 10)
+        self.assertEqual(options['max_overflow'], 20)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=30000'})
+
+    def test_postgres_overrides(self):
+        options = engine_options('postgresql:///blogly', {
+            'DB_POOL_SIZE': '32', 'DB_MAX_OVERFLOW': '0', 'DB_POOL_PRE_PING': 'no',
+            'DB_POOL_RECYCLE': '60', 'DB_STATEMENT_TIMEOUT_MS': '0'})
+        self.assertEqual(options['pool_size'], 32)
+        self.assertEqual(options['max_overflow'], 0)
+        self.assertFalse(options['pool_pre_ping'])
+        self.assertEqual(options['pool_recycle'], 60)
+        self.assertNotIn('connect_args', options)
+
+    def test_sqlite_keeps_defaults(self):
+        self.assertEqual(engine_options('sqlite://', {}), {})
+
+    def test_replica_options(self):
+        urls = env_list('REPLICAS', {'REPLICAS': 'postgresql://r1/blogly, sqlite:///replica.db'})
+        replicas = replica_options(urls, {})
+        self.assertEqual(replicas[0]['url'], 'postgresql://r1/blogly')
+        self.assertEqual(replicas[0]['connect_args']['connect_timeout'], 2)
+        self.assertEqual(replicas[1], {'url': 'sqlite:///replica.db'})
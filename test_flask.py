@@ -1,15 +1,24 @@
 from unittest import TestCase
-
-from app import app
+import json
+import os
+import time
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from sqlalchemy import event, func
+from sqlalchemy.exc import DBAPIError
+
+from app import create_app
+from config import TestingConfig
 from models import db, User, Post, Tag, PostTag
+from queries import encode_cursor, recount_posts
+from conditional import as_utc
+import fragments
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///blogly_test'
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['TESTING'] = True
-app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+app = create_app(TestingConfig)
 
-db.drop_all()
-db.create_all()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
 
 class BloglyViewsTestCase(TestCase):
     """Tests for views for Blogly app."""
@@ -17,6 +26,9 @@ class BloglyViewsTestCase(TestCase):
     def setUp(self):
         """Add sample user and sample post."""
 
+        self.ctx = app.app_context()
+        self.ctx.push()
+
         PostTag.query.delete()
         Post.query.delete()
         Tag.query.delete()
@@ -45,6 +57,7 @@ class BloglyViewsTestCase(TestCase):
         """Clean up any fouled transactions."""
 
         db.session.rollback()
+        self.ctx.pop()
 
     def test_home_page(self):
         with app.test_client() as client:
@@ -120,6 +133,19 @@ class BloglyViewsTestCase(TestCase):
             self.assertEqual(resp.location, '/users')
             self.assertEqual(str(User.query.get(user_id)), f'<User {user_id} John Doe>')
     
+    def test_edit_user_touches_posts_only_when_renamed(self):
+        def post_stamps():
+            db.session.expire_all()
+            return db.session.execute(db.select(Post.updated_at).where(Post.user_id == self.user_id)).scalars().all()
+
+        before = post_stamps()
+        self.assertEqual(len(before), 1)
+        with app.test_client() as client:
+            client.post(f'/users/{self.user_id}/edit', data={'first-name': 'Jane', 'last-name': 'Doe', 'image-url': '/new.png'})
+            self.assertEqual(post_stamps(), before)
+            client.post(f'/users/{self.user_id}/edit', data={'first-name': 'Janet', 'last-name': 'Doe', 'image-url': '/new.png'})
+            self.assertTrue(all(after > stamp for after, stamp in zip(post_stamps(), before)))
+
     def test_edit_user_redirect(self):
         with app.test_client() as client:
             test_user = db.session.execute(db.select(User).where(User.first_name == 'Jane')).scalar()
@@ -433,13 +459,23 @@ class BloglyViewsTestCase(TestCase):
     def test_add_tag_redirect(self):
         with app.test_client() as client:
             test_post = db.session.execute(db.select(Post).where(Post.title == "test post test")).scalar()
-            resp = client.post('/tags/new', data={'name': 'moretesting', 'post': ["test post test"]}, follow_redirects=True)
+            resp = client.post('/tags/new', data={'name': 'moretesting', 'post': [test_post.id]}, follow_redirects=True)
             html = resp.get_data(as_text=True)
 
             self.assertEqual(resp.status_code, 200)
             self.assertIn('moretesting', html)
             self.assertIn('moretesting', str(test_post.tags))
     
+    def test_tag_names_reject_control_characters(self):
+        test_tag = db.session.execute(db.select(Tag).where(Tag.name == "testing")).scalar()
+        with app.test_client() as client:
+            resp = client.post('/tags/new', data={'name': 'bad\x1fname'})
+            self.assertEqual(resp.location, '/tags/new')
+            resp = client.post(f'/tags/{test_tag.id}/edit', data={'name': 'bad\x1ename'})
+            self.assertEqual(resp.location, f'/tags/{test_tag.id}/edit')
+        db.session.expire_all()
+        self.assertEqual(db.session.execute(db.select(Tag.name)).scalars().all(), ['testing'])
+
     def test_show_tag_edit_form(self):
         with app.test_client() as client:
             test_tag = db.session.execute(db.select(Tag).where(Tag.name == "testing")).scalar()
@@ -485,4 +521,370 @@ class BloglyViewsTestCase(TestCase):
             html = resp.get_data(as_text=True)
 
             self.assertEqual(resp.status_code, 200)
-            self.assertNotIn('testing', html)
\ No newline at end of file
+            self.assertNotIn('testing', html)
+
+    @contextmanager
+    def capture_statements(self):
+        """Collect the SQL statements issued inside the with block."""
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+    def count_queries(self, url):
+        """Return the number of SQL statements issued while fetching url."""
+        db.session.expunge_all()
+        with self.capture_statements() as statements:
+            with app.test_client() as client:
+                resp = client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(statements)
+
+    def add_posts(self, count):
+        """Add count posts, each with its own author and tag."""
+        for i in range(count):
+            user = User(first_name=f"Author{i}", last_name="Doe")
+            tag = Tag(name=f"tag{i}")
+            post = Post(title=f"post {i}", content="content", user=user, tags=[tag])
+            db.session.add(post)
+        db.session.commit()
+
+    def test_feed_query_count_is_bounded(self):
+        user_id = self.user_id
+        urls = ['/', '/posts', f'/users/{user_id}']
+        before = {url: self.count_queries(url) for url in urls}
+        self.add_posts(10)
+        db.session.add_all([Post(title=f"jane {i}", content="content", user_id=user_id, tags=[Tag(name=f"jane{i}")]) for i in range(10)])
+        db.session.commit()
+        after = {url: self.count_queries(url) for url in urls}
+
+        self.assertEqual(before, after)
+
+    def test_posts_pagination(self):
+        self.add_posts(5)
+        with app.test_client() as client:
+            resp = client.get('/posts?limit=2')
+            html = resp.get_data(as_text=True)
+            self.assertIn('post 4', html)
+            self.assertIn('post 3', html)
+            self.assertNotIn('post 2', html)
+            self.assertIn('Next', html)
+            self.assertNotIn('Previous', html)
+
+            seen = []
+            resp = client.get('/posts?limit=2')
+            while True:
+                html = resp.get_data(as_text=True)
+                seen.extend(t for t in ['post 4', 'post 3', 'post 2', 'post 1', 'post 0', 'test post test'] if f'>{t}<' in html)
+                if 'after=' not in html:
+                    break
+                after = html.split('after=')[1].split('&')[0]
+                resp = client.get(f'/posts?after={after}&limit=2')
+
+            self.assertEqual(seen, ['post 4', 'post 3', 'post 2', 'post 1', 'post 0', 'test post test'])
+            before = html.split('before=')[1].split('&')[0]
+            resp = client.get(f'/posts?before={before}&limit=2')
+            html = resp.get_data(as_text=True)
+            self.assertIn('>post 2<', html)
+            self.assertIn('>post 1<', html)
+            self.assertNotIn('>post 0<', html)
+            self.assertIn('Previous', html)
+
+    def test_pagination_limit_is_capped(self):
+        with app.test_client() as client:
+            resp = client.get('/users?limit=100000')
+            self.assertEqual(resp.status_code, 200)
+
+    def test_pagination_bad_cursor(self):
+        with app.test_client() as client:
+            resp = client.get('/posts?after=not-a-cursor')
+            self.assertEqual(resp.status_code, 400)
+            for values in ([1, 2], [None, 1], ['2024-01-01T00:00:00', 'x'], ['2024-01-01T00:00:00', [1]]):
+                resp = client.get(f'/posts?after={encode_cursor(values)}')
+                self.assertEqual(resp.status_code, 400, values)
+
+    def test_edit_post_tags_diff(self):
+        db.session.add_all([Tag(name="alpha"), Tag(name="beta")])
+        db.session.commit()
+        test_post = db.session.execute(db.select(Post).where(Post.title == 'test post test')).scalar()
+        post_id = test_post.id
+        with app.test_client() as client:
+            with self.capture_statements() as statements:
+                client.post(f'/posts/{post_id}/edit', data={'title': 'test post test', 'content': 'test post content', 'tag': ['testing', 'alpha', 'beta']})
+            self.assertFalse([s for s in statements if s.startswith('DELETE')])
+            self.assertEqual(len([s for s in statements if s.startswith('INSERT INTO posts_tags')]), 1)
+
+            with self.capture_statements() as statements:
+                client.post(f'/posts/{post_id}/edit', data={'title': 'test post test', 'content': 'test post content', 'tag': ['testing', 'alpha', 'beta']})
+            self.assertFalse([s for s in statements if s.startswith(('DELETE', 'INSERT'))])
+
+            client.post(f'/posts/{post_id}/edit', data={'title': 'test post test', 'content': 'test post content', 'tag': ['beta']})
+        tag_ids = db.session.execute(db.select(PostTag.tag_id).where(PostTag.post_id == post_id)).scalars().all()
+        beta = db.session.execute(db.select(Tag).where(Tag.name == 'beta')).scalar()
+        self.assertEqual(tag_ids, [beta.id])
+
+    def test_add_post_single_commit(self):
+        db.session.add_all([Tag(name="alpha"), Tag(name="beta")])
+        db.session.commit()
+        with app.test_client() as client:
+            with self.capture_statements() as statements:
+                client.post(f'/users/{self.user_id}/posts/new', data={'title': 'tagged', 'content': 'content', 'tag': ['testing', 'alpha', 'beta']})
+        self.assertEqual(len(statements), 5)
+        post = db.session.execute(db.select(Post).where(Post.title == 'tagged')).scalar()
+        self.assertEqual(sorted(t.name for t in post.tags), ['alpha', 'beta', 'testing'])
+
+    def post_counts(self):
+        db.session.expire_all()
+        users = dict(db.session.execute(db.select(User.first_name, User.post_count)).all())
+        tags = dict(db.session.execute(db.select(Tag.name, Tag.post_count)).all())
+        return users, tags
+
+    def test_post_counts_maintained(self):
+        db.session.add(Tag(name="alpha"))
+        recount_posts(db.session)
+        db.session.commit()
+        self.assertEqual(self.post_counts(), ({'Jane': 1}, {'testing': 1, 'alpha': 0}))
+        with app.test_client() as client:
+            client.post(f'/users/{self.user_id}/posts/new', data={'title': 'one', 'content': 'c', 'tag': ['testing', 'alpha']})
+            client.post(f'/users/{self.user_id}/posts/new', data={'title': 'two', 'content': 'c', 'tag': ['alpha']})
+            self.assertEqual(self.post_counts(), ({'Jane': 3}, {'testing': 2, 'alpha': 2}))
+
+            one = db.session.execute(db.select(Post).where(Post.title == 'one')).scalar()
+            client.post(f'/posts/{one.id}/edit', data={'title': 'one', 'content': 'c', 'tag': ['testing']})
+            self.assertEqual(self.post_counts(), ({'Jane': 3}, {'testing': 2, 'alpha': 1}))
+
+            alpha = db.session.execute(db.select(Tag).where(Tag.name == 'alpha')).scalar()
+            two = db.session.execute(db.select(Post).where(Post.title == 'two')).scalar()
+            client.post(f'/tags/{alpha.id}/edit', data={'name': 'alpha', 'post': [one.id, two.id]})
+            self.assertEqual(self.post_counts(), ({'Jane': 3}, {'testing': 2, 'alpha': 2}))
+
+            client.post('/tags/new', data={'name': 'gamma', 'post': [one.id]})
+            self.assertEqual(self.post_counts()[1]['gamma'], 1)
+
+            client.post(f'/posts/{one.id}/delete')
+            self.assertEqual(self.post_counts(), ({'Jane': 2}, {'testing': 1, 'alpha': 1, 'gamma': 0}))
+
+            client.post(f'/users/{self.user_id}/delete')
+            self.assertEqual(self.post_counts(), ({}, {'testing': 0, 'alpha': 0, 'gamma': 0}))
+
+    def test_reconcile_counts(self):
+        db.session.execute(db.update(User).values(post_count=7))
+        db.session.execute(db.update(Tag).values(post_count=0))
+        db.session.commit()
+        result = app.test_cli_runner().invoke(args=['reconcile-counts'])
+        self.assertIn('Fixed 2 post counts', result.output)
+        self.assertEqual(self.post_counts(), ({'Jane': 1}, {'testing': 1}))
+
+    def test_bulk_delete_users(self):
+        recount_posts(db.session)
+        other = User(first_name="Bob", last_name="Roe")
+        keep = User(first_name="Kim", last_name="Poe")
+        testing = db.session.execute(db.select(Tag).where(Tag.name == 'testing')).scalar()
+        db.session.add_all([other, keep])
+        db.session.flush()
+        db.session.add_all([Post(title=f"bob {i}", content="c", user_id=other.id, tags=[testing]) for i in range(3)])
+        db.session.add(Post(title="kim", content="c", user_id=keep.id, tags=[testing]))
+        db.session.commit()
+        recount_posts(db.session)
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['delete-users', str(self.user_id), str(other.id), '999999'])
+
+        self.assertIn('Deleted 2 users and 4 posts in', result.output)
+        self.assertEqual(self.post_counts(), ({'Kim': 1}, {'testing': 1}))
+        self.assertEqual(db.session.execute(db.select(func.count()).select_from(PostTag)).scalar(), 1)
+
+    def test_bulk_delete_tags(self):
+        db.session.add(Tag(name="spare"))
+        db.session.commit()
+        ids = db.session.execute(db.select(Tag.id)).scalars().all()
+        result = app.test_cli_runner().invoke(args=['delete-tags', '--ids-file', '-'],
+                                              input='\n'.join(map(str, ids)) + '\n')
+        self.assertIn('Deleted 2 tags from 1 posts in', result.output)
+        self.assertEqual(db.session.execute(db.select(func.count()).select_from(PostTag)).scalar(), 0)
+        self.assertEqual(app.test_cli_runner().invoke(args=['delete-tags']).exit_code, 2)
+
+    def test_sort_by_popularity(self):
+        busy = User(first_name="Busy", last_name="Zed", post_count=5)
+        db.session.add_all([busy, Tag(name="aardvark", post_count=0)])
+        db.session.execute(db.update(Tag).where(Tag.name == 'testing').values(post_count=1))
+        db.session.commit()
+        with app.test_client() as client:
+            html = client.get('/users?sort=popular').get_data(as_text=True)
+            self.assertLess(html.index('Busy Zed'), html.index('Jane Doe'))
+            self.assertIn('(5 posts)', html)
+            html = client.get('/users').get_data(as_text=True)
+            self.assertLess(html.index('Jane Doe'), html.index('Busy Zed'))
+            html = client.get('/tags?sort=popular').get_data(as_text=True)
+            self.assertLess(html.index('testing'), html.index('aardvark'))
+            self.assertEqual(client.get('/users?sort=bogus').status_code, 400)
+
+    def test_pool_wait_reported(self):
+        with app.test_client() as client:
+            resp = client.get('/posts')
+            self.assertIn('db-pool;dur=', resp.headers.get('Server-Timing', ''))
+
+    def test_sql_timing_reported(self):
+        with app.test_client() as client:
+            with self.assertLogs('blogly.request', level='INFO') as logs:
+                resp = client.get('/posts')
+        timing = resp.headers.get_all('Server-Timing')
+        self.assertTrue(any(t.startswith('db;dur=') and 'queries' in t for t in timing))
+        self.assertTrue(any(t.startswith('app;dur=') for t in timing))
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['route'], 'blogly.show_posts')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['rows'], 0)
+
+    def test_failed_statements_leave_no_timing_state(self):
+        with app.app_context(), db.engine.connect() as conn:
+            for _ in range(5):
+                with self.assertRaises(DBAPIError):
+                    conn.exec_driver_sql('SELECT * FROM no_such_table')
+                conn.rollback()
+            self.assertEqual(conn.exec_driver_sql('SELECT 1').scalar(), 1)
+            self.assertNotIn('query_start', conn.info)
+
+    def test_metrics_endpoint(self):
+        with app.test_client() as client:
+            client.get('/posts')
+            client.get('/posts')
+            client.get('/no-such-page')
+            resp = client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain'))
+        text = resp.get_data(as_text=True)
+        self.assertIn('blogly_http_request_duration_seconds_bucket{le="0.005",method="GET",route="blogly.show_posts"}', text)
+        self.assertIn('blogly_http_requests_total{method="GET",route="unmatched",status="404"}', text)
+        self.assertIn('blogly_sql_statements_total{route="blogly.show_posts"}', text)
+        self.assertIn('blogly_db_pool_checked_out{engine="primary"}', text)
+        self.assertIn('blogly_template_render_seconds_count{template="posts.html"}', text)
+        self.assertIn('blogly_cache_requests_total{cache="fragment",result="hit"}', text)
+
+    def test_slow_query_logged(self):
+        class SlowConfig(TestingConfig):
+            SQL_SLOW_QUERY_MS = 0.001
+
+        slow_app = create_app(SlowConfig)
+        with slow_app.test_client() as client:
+            with self.assertLogs('blogly.sql.slow', level='WARNING') as logs:
+                client.get(f'/users/{self.user_id}')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], 'blogly.show_user')
+        self.assertIn('SELECT', record['statement'])
+        self.assertIn(str(self.user_id), record['parameters'])
+
+    def test_create_app_does_not_connect(self):
+        class UnreachableConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'postgresql://nobody@127.0.0.1:1/nowhere'
+            SQLALCHEMY_ENGINE_OPTIONS = {}
+
+        unreachable = create_app(UnreachableConfig)
+        self.assertIn('blogly.home_page', unreachable.view_functions)
+
+    def test_cli_init_db_and_migrate(self):
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['init-db'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Created tables', result.output)
+        result = runner.invoke(args=['migrate'])
+        self.assertIn('Schema is up to date', result.output)
+
+    def test_post_fragments_cached_by_version(self):
+        cache = app.extensions['fragment_cache']
+        cache.clear()
+        other = Post(title="other post", content="content", user=User(first_name="Other", last_name="Author"))
+        db.session.add(other)
+        db.session.commit()
+        other_key = fragments.fragment_key(other, 'card')
+        # another worker process, with its own memory:// cache
+        worker = create_app(TestingConfig)
+        worker.test_client().get('/posts')
+        with app.test_client() as client:
+            client.get('/posts')
+            hits = cache.stats.hits
+            client.get('/posts')
+            self.assertEqual(cache.stats.hits, hits + 2)
+
+            client.post(f'/users/{self.user_id}/edit', data={'first-name': 'Janet', 'last-name': 'Doe', 'image-url': ''})
+            self.assertIsNotNone(cache.get(other_key))
+            html = client.get('/posts').get_data(as_text=True)
+            self.assertIn('Janet Doe', html)
+
+            tag = db.session.execute(db.select(Tag).where(Tag.name == 'testing')).scalar()
+            client.post(f'/tags/{tag.id}/edit', data={'name': 'renamed', 'post': [p.id for p in tag.posts]})
+            self.assertIsNotNone(cache.get(other_key))
+            html = client.get('/posts').get_data(as_text=True)
+            self.assertIn('renamed', html)
+
+            test_post = db.session.execute(db.select(Post).where(Post.title == 'test post test')).scalar()
+            client.post(f'/posts/{test_post.id}/edit', data={'title': 'retitled', 'content': 'content'})
+            self.assertIsNotNone(cache.get(other_key))
+            html = client.get('/posts').get_data(as_text=True)
+            self.assertIn('retitled', html)
+        html = worker.test_client().get('/posts').get_data(as_text=True)
+        self.assertIn('retitled', html)
+        self.assertIn('Janet Doe', html)
+
+    def test_conditional_get(self):
+        test_post = db.session.execute(db.select(Post).where(Post.title == 'test post test')).scalar()
+        urls = ['/', '/posts', '/users', f'/users/{self.user_id}', f'/posts/{test_post.id}', '/tags']
+        with app.test_client() as client:
+            for url in urls:
+                resp = client.get(url)
+                etag = resp.headers['ETag']
+                self.assertTrue(etag.startswith('W/'), url)
+                self.assertIn('Last-Modified', resp.headers)
+                resp = client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(resp.status_code, 304, url)
+                self.assertEqual(resp.get_data(), b'')
+
+    def test_conditional_get_skips_queries(self):
+        test_post = db.session.execute(db.select(Post).where(Post.title == 'test post test')).scalar()
+        with app.test_client() as client:
+            etag = client.get(f'/posts/{test_post.id}').headers['ETag']
+            with self.capture_statements() as statements:
+                resp = client.get(f'/posts/{test_post.id}', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(len(statements), 1)
+
+    def test_conditional_get_changes_after_write(self):
+        test_post = db.session.execute(db.select(Post).where(Post.title == 'test post test')).scalar()
+        tag = db.session.execute(db.select(Tag).where(Tag.name == 'testing')).scalar()
+        post_url, tag_url = f'/posts/{test_post.id}', f'/tags/{tag.id}'
+        with app.test_client() as client:
+            post_etag = client.get(post_url).headers['ETag']
+            tag_etag = client.get(tag_url).headers['ETag']
+            client.post(f'{post_url}/edit', data={'title': 'test post test', 'content': 'test post content', 'tag': []})
+            # consume the flashed message
+            client.get(post_url)
+            resp = client.get(post_url, headers={'If-None-Match': post_etag})
+            self.assertEqual(resp.status_code, 200)
+            resp = client.get(tag_url, headers={'If-None-Match': tag_etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotIn('test post test', resp.get_data(as_text=True))
+
+    def test_if_modified_since(self):
+        with app.test_client() as client:
+            last_modified = client.get('/users').headers['Last-Modified']
+            resp = client.get('/users', headers={'If-Modified-Since': last_modified})
+            self.assertEqual(resp.status_code, 304)
+
+    def test_last_modified_converts_local_time(self):
+        tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'America/New_York'
+        time.tzset()
+        try:
+            self.assertEqual(as_utc(datetime(2024, 1, 15, 12, 30, 5, 900)),
+                             datetime(2024, 1, 15, 17, 30, 5, tzinfo=timezone.utc))
+        finally:
+            if tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = tz
+            time.tzset()
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+# Each worker counts requests in its own process; the last one renders the
+# aggregated view the way /metrics does.
+WORKER = """
+import sys
+import metrics
+metrics.REQUESTS.labels('blogly.show_posts', 'GET', '200').inc(int(sys.argv[1]))
+if len(sys.argv) > 2:
+    from prometheus_client import generate_latest
+    sys.stdout.write(generate_latest(metrics.registry()).decode())
+"""
+
+
+class MultiprocessMetricsTestCase(TestCase):
+    """Tests for metrics aggregated across worker processes."""
+
+    def run_worker(self, directory, *args):
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+        return subprocess.run([sys.executable, '-c', WORKER, *args], env=env, check=True,
+                              capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+
+    def test_counters_are_summed_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.run_worker(directory, '2')
+            self.run_worker(directory, '3')
+            output = self.run_worker(directory, '0', 'render')
+        self.assertIn('blogly_http_requests_total{method="GET",route="blogly.show_posts",status="200"} 5.0', output)
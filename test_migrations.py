@@ -0,0 +1,239 @@
+from unittest import TestCase
+from datetime import datetime
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.schema import CreateTable
+
+from app import create_app
+from config import TestingConfig
+from models import db, User, Post, Tag, PostTag
+from queries import page_statement
+import migrations
+import read_models
+
+app = create_app(TestingConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+def index_names():
+    inspector = inspect(db.engine)
+    return {index['name'] for table in ('users', 'posts', 'posts_tags', 'tags') for index in inspector.get_indexes(table)}
+
+
+class MigrationTestCase(TestCase):
+    """Tests for schema migrations."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        """Clean up any fouled transactions."""
+
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_upgrade_adds_missing_indexes(self):
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP INDEX ix_posts_created_at_id')
+            conn.exec_driver_sql('DROP INDEX ix_posts_tags_tag_id')
+            conn.execute(migrations.schema_migrations.delete())
+        self.assertNotIn('ix_posts_created_at_id', index_names())
+
+        applied = migrations.upgrade(db.engine)
+
+        self.assertIn(1, applied)
+        self.assertTrue({'ix_posts_created_at_id', 'ix_posts_user_id_created_at_id',
+                         'ix_users_last_name_first_name_id', 'ix_posts_tags_tag_id'} <= index_names())
+
+    def test_upgrade_adds_updated_at(self):
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ALTER TABLE tags DROP COLUMN updated_at')
+            conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 2))
+
+        self.assertEqual(migrations.upgrade(db.engine), [2])
+
+        columns = {c['name'] for c in inspect(db.engine).get_columns('tags')}
+        self.assertIn('updated_at', columns)
+
+    def test_upgrade_adds_search_vector(self):
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ALTER TABLE posts DROP COLUMN search_vector')
+            conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 3))
+
+        self.assertEqual(migrations.upgrade(db.engine), [3])
+
+        self.assertIn('search_vector', {c['name'] for c in inspect(db.engine).get_columns('posts')})
+        self.assertIn('ix_posts_search_vector', index_names())
+
+    def test_upgrade_adds_post_counts(self):
+        PostTag.query.delete()
+        Post.query.delete()
+        Tag.query.delete()
+        User.query.delete()
+        db.session.commit()
+        with db.engine.begin() as conn:
+            for table in ('users', 'tags'):
+                conn.exec_driver_sql(f'ALTER TABLE {table} DROP COLUMN post_count')
+            conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 4))
+            user_id = conn.exec_driver_sql("INSERT INTO users (first_name, last_name, image_url, updated_at) "
+                                           "VALUES ('Jane', 'Doe', '', now()) RETURNING id").scalar()
+            tag_id = conn.exec_driver_sql("INSERT INTO tags (name, updated_at) VALUES ('backfill', now()) RETURNING id").scalar()
+            for i in range(3):
+                post_id = conn.exec_driver_sql(
+                    "INSERT INTO posts (title, content, created_at, updated_at, user_id) "
+                    f"VALUES ('p', 'c', now(), now(), {user_id}) RETURNING id").scalar()
+                if i:
+                    conn.exec_driver_sql(f"INSERT INTO posts_tags (post_id, tag_id) VALUES ({post_id}, {tag_id})")
+
+        self.assertEqual(migrations.upgrade(db.engine), [4])
+
+        self.assertEqual(db.session.get(User, user_id).post_count, 3)
+        self.assertEqual(db.session.get(Tag, tag_id).post_count, 2)
+        self.assertTrue({'ix_users_post_count_id', 'ix_tags_post_count_id'} <= index_names())
+
+    def test_upgrade_cascades_deletes(self):
+        with db.engine.begin() as conn:
+            for table, column, referred in migrations.CASCADING_FOREIGN_KEYS:
+                conn.exec_driver_sql(f'ALTER TABLE {table} DROP CONSTRAINT {table}_{column}_fkey, '
+                                     f'ADD CONSTRAINT {table}_{column}_fkey FOREIGN KEY ({column}) REFERENCES {referred} (id)')
+            conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 5))
+
+        self.assertEqual(migrations.upgrade(db.engine), [5])
+
+        inspector = inspect(db.engine)
+        for table, column, referred in migrations.CASCADING_FOREIGN_KEYS:
+            [fk] = [fk for fk in inspector.get_foreign_keys(table) if fk['constrained_columns'] == [column]]
+            self.assertEqual(fk['options'].get('ondelete'), 'CASCADE', column)
+
+    def test_upgrade_cascades_deletes_on_sqlite(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'blogly.db')}")
+        self.addCleanup(engine.dispose)
+        with engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+                conn.exec_driver_sql(ddl.replace(' ON DELETE CASCADE', ''))
+            now = datetime.now()
+            conn.execute(User.__table__.insert().values(id=1, first_name='Jane', last_name='Doe', updated_at=now))
+            conn.execute(Post.__table__.insert().values(id=1, title='t', content='c', user_id=1,
+                                                        created_at=now, updated_at=now))
+            conn.execute(Tag.__table__.insert().values(id=1, name='tag', updated_at=now))
+            conn.execute(PostTag.__table__.insert().values(post_id=1, tag_id=1))
+        migrations.stamp(engine)
+        with engine.begin() as conn:
+            conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 5))
+
+        self.assertEqual(migrations.upgrade(engine), [5])
+
+        inspector = inspect(engine)
+        self.assertIn('ix_posts_created_at_id', {index['name'] for index in inspector.get_indexes('posts')})
+        for table, column, _ in migrations.CASCADING_FOREIGN_KEYS:
+            [fk] = [fk for fk in inspector.get_foreign_keys(table) if fk['constrained_columns'] == [column]]
+            self.assertEqual(fk['options'].get('ondelete'), 'CASCADE', column)
+        with engine.begin() as conn:
+            self.assertEqual(conn.exec_driver_sql('SELECT title FROM posts').scalar(), 't')
+            conn.exec_driver_sql('DELETE FROM users')
+            self.assertEqual(conn.exec_driver_sql('SELECT count(*) FROM posts').scalar(), 0)
+            self.assertEqual(conn.exec_driver_sql('SELECT count(*) FROM posts_tags').scalar(), 0)
+
+    def test_upgrade_adds_jobs(self):
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP TABLE jobs')
+            conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 6))
+
+        self.assertEqual(migrations.upgrade(db.engine), [6])
+
+        self.assertIn('ix_jobs_status_run_at', {index['name'] for index in inspect(db.engine).get_indexes('jobs')})
+
+    def test_upgrade_is_idempotent(self):
+        migrations.upgrade(db.engine)
+        self.assertEqual(migrations.upgrade(db.engine), [])
+
+
+class IndexUsageTestCase(TestCase):
+    """EXPLAIN the hot listing queries and check that they use the indexes."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        PostTag.query.delete()
+        Post.query.delete()
+        Tag.query.delete()
+        User.query.delete()
+        db.session.commit()
+
+        users = [User(first_name=f"First{i}", last_name=f"Last{i}") for i in range(20)]
+        tags = [Tag(name=f"tag{i}") for i in range(10)]
+        db.session.add_all(users + tags)
+        db.session.flush()
+        posts = [{'title': f"post {i}", 'content': "content", 'user_id': users[i % 20].id}
+                 for i in range(2000)]
+        db.session.execute(db.insert(Post), posts)
+        post_ids = db.session.execute(db.select(Post.id)).scalars().all()
+        db.session.execute(db.insert(PostTag), [{'post_id': post_id, 'tag_id': tags[post_id % 10].id}
+                                                for post_id in post_ids])
+        db.session.commit()
+        self.user_id = users[0].id
+        self.tag_id = tags[0].id
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def plan(self, stmt):
+        """Return the EXPLAIN output for stmt with sequential scans discouraged.
+
+        The test tables are small enough that the planner may rightly prefer
+        a sequential scan; turning that off shows which index it would pick
+        on a real table."""
+        compiled = stmt.compile(dialect=db.engine.dialect)
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            rows = conn.exec_driver_sql(f'EXPLAIN {compiled}', compiled.params).scalars()
+            return '\n'.join(rows)
+
+    def test_feed_uses_created_at_index(self):
+        stmt, _ = page_statement(read_models.feed_select(), (Post.created_at, Post.id), descending=True)
+        plan = self.plan(stmt)
+        self.assertIn('ix_posts_created_at_id', plan)
+        # the correlated subquery aggregating each post's tags
+        self.assertIn('posts_tags_pkey', plan)
+        self.assertNotIn('Seq Scan', plan)
+        self.assertIn('ix_posts_created_at_id', self.plan(read_models.feed_select().limit(5)))
+
+    def test_user_posts_use_user_id_index(self):
+        stmt = read_models.feed_select().where(Post.user_id == self.user_id)
+        self.assertIn('ix_posts_user_id_created_at_id', self.plan(stmt))
+
+    def test_users_list_uses_name_index(self):
+        stmt, _ = page_statement(read_models.user_select(), (User.last_name, User.first_name, User.id))
+        self.assertIn('ix_users_last_name_first_name_id', self.plan(stmt))
+
+    def test_popular_sorts_use_post_count_indexes(self):
+        stmt, _ = page_statement(read_models.user_select(), (User.post_count, User.id), descending=True)
+        self.assertIn('ix_users_post_count_id', self.plan(stmt))
+        stmt = read_models.tag_select().order_by(Tag.post_count.desc(), Tag.id.desc())
+        self.assertIn('ix_tags_post_count_id', self.plan(stmt))
+
+    def test_tag_posts_use_tag_id_index(self):
+        stmt = db.select(PostTag.post_id).where(PostTag.tag_id == self.tag_id)
+        self.assertIn('ix_posts_tags_tag_id', self.plan(stmt))
+
+    def test_tag_page_walks_created_at_index(self):
+        stmt, _ = page_statement(read_models.feed_select().join(PostTag, PostTag.post_id == Post.id)
+                                 .where(PostTag.tag_id == self.tag_id),
+                                 (Post.created_at, Post.id), descending=True)
+        plan = self.plan(stmt)
+        self.assertIn('ix_posts_created_at_id', plan)
+        self.assertNotIn('Seq Scan', plan)
@@ -1,15 +1,20 @@
 from unittest import TestCase
 
-from app import app
-from models import db, User, Post
+from app import create_app
+from config import TestingConfig
+from display import post_views
+import read_models
+from models import db, User, Post, Tag
 from datetime import datetime, date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
 
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///blogly_test'
-app.config['SQLALCHEMY_ECHO'] = False
+app = create_app(TestingConfig)
 
-db.drop_all()
-db.create_all()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
 
 class UserModelTestCase(TestCase):
     """Tests for user model."""
@@ -17,12 +22,16 @@ class UserModelTestCase(TestCase):
     def setUp(self):
         """Clean up any existing users."""
 
+        self.ctx = app.app_context()
+        self.ctx.push()
+
         # User.query.delete()
 
     def tearDown(self):
         """Clean up any fouled transactions."""
 
         db.session.rollback()
+        self.ctx.pop()
 
     def test_full_name(self):
         user = User(first_name="Camden", last_name="Tadhg")
@@ -35,4 +44,65 @@ class UserModelTestCase(TestCase):
         test_user = db.session.execute(db.select(User).where(User.first_name == 'Camden')).scalar()
         user_id=test_user.id
         post = Post(title="test", content="test", created_at=datetime.now(), user_id=user_id)
-        self.assertEqual(post.nice_date, "Thr 02 15 2024, 08:55 AM")
\ No newline at end of file
+        self.assertEqual(post.nice_date, "Thr 02 15 2024, 08:55 AM")
+
+class DisplayViewsTestCase(TestCase):
+    """Tests for the display views of posts."""
+
+    def test_post_views(self):
+        author = User(id=1, first_name="Camden", last_name="Tadhg")
+        tag = Tag(id=1, name="news")
+        created = datetime(2024, 2, 15, 8, 55)
+        posts = [Post(id=i, title=f"post {i}", content="text", created_at=created, user=author, tags=[tag])
+                 for i in (1, 2)]
+        views = post_views(posts)
+        self.assertEqual(views[0].nice_date, posts[0].nice_date)
+        self.assertEqual(views[0].user.full_name, "Camden Tadhg")
+        self.assertEqual([t.name for t in views[1].tags], ["news"])
+        self.assertIs(views[0].user, views[1].user)
+        self.assertIs(views[0].tags[0], views[1].tags[0])
+        with self.assertRaises(AttributeError):
+            views[0].extra = 1
+
+
+class ReadModelsTestCase(TestCase):
+    """Tests for the column-only listing queries."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_feed_rows(self):
+        author = User(first_name="Camden", last_name="Tadhg")
+        tagged = Post(title="tagged", content="text", created_at=datetime(2024, 2, 15, 8, 55), user=author,
+                      tags=[Tag(name="zebra"), Tag(name="apple")])
+        plain = Post(title="plain", content="text", created_at=datetime(2024, 2, 14), user=author)
+        db.session.add_all([tagged, plain])
+        db.session.flush()
+
+        stmt = read_models.feed_select().where(Post.user_id == author.id)
+        views = read_models.post_views(db.session.execute(stmt))
+        self.assertEqual([v.title for v in views], ["tagged", "plain"])
+        self.assertEqual([(t.id, t.name) for t in views[0].tags],
+                         sorted(((t.id, t.name) for t in tagged.tags), key=lambda t: t[1]))
+        self.assertEqual(views[1].tags, [])
+        self.assertIs(views[0].user, views[1].user)
+        self.assertEqual(views[0].nice_date, tagged.nice_date)
+
+    def test_feed_rows_group_concat(self):
+        engine = create_engine('sqlite://')
+        db.metadata.create_all(engine)
+        with Session(engine) as session:
+            names = ["mango", "apple", "zebra", "kiwi", "banana"]
+            post = Post(title="tagged", content="text", created_at=datetime(2024, 2, 15),
+                        user=User(first_name="Camden", last_name="Tadhg"),
+                        tags=[Tag(name=name) for name in names])
+            session.add(post)
+            session.flush()
+            views = read_models.post_views(session.execute(read_models.feed_select()))
+            self.assertEqual([(t.id, t.name) for t in views[0].tags],
+                             sorted(((t.id, t.name) for t in post.tags), key=lambda t: t[1]))
@@ -0,0 +1,162 @@
+from unittest import TestCase
+import threading
+import time
+
+from flask import before_render_template
+
+from app import create_app
+from conditional import make_etag
+from config import TestingConfig
+from models import db, User, Post, Tag
+from queries import feed_version
+
+app = create_app(TestingConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class PageCacheConfig(TestingConfig):
+    PAGE_CACHE_TTL = 60
+
+
+class PageCacheTestCase(TestCase):
+    """Tests for the whole-page cache of the home page and tag list."""
+
+    def setUp(self):
+        self.app = create_app(PageCacheConfig)
+        self.pages = self.app.extensions['page_cache']
+        self.renders = []
+        before_render_template.connect(self.rendering, self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        self.user = User(first_name="Jane", last_name="Doe")
+        db.session.add(self.user)
+        db.session.commit()
+        self.add_post("First post")
+
+    def tearDown(self):
+        db.session.rollback()
+        db.drop_all()
+        db.create_all()
+        self.ctx.pop()
+
+    def rendering(self, sender, template, context, **extra):
+        if not template.name.startswith('post_'):
+            self.renders.append(template.name)
+
+    def add_post(self, title):
+        db.session.add(Post(title=title, content="content", user_id=self.user.id))
+        db.session.commit()
+
+    def retitle_unversioned(self, title):
+        """change the posts without changing the feed's version"""
+        db.session.execute(db.update(Post).values(title=title, updated_at=Post.updated_at))
+        db.session.commit()
+
+    def get(self, path, **kwargs):
+        with self.app.test_client() as client:
+            return client.get(path, **kwargs)
+
+    def test_serves_cached_page(self):
+        first = self.get('/')
+        self.retitle_unversioned("Retitled behind the cache's back")
+        again = self.get('/')
+        self.assertEqual(again.data, first.data)
+        self.assertNotIn("behind the cache", again.get_data(as_text=True))
+        self.assertEqual(self.renders, ['home.html'])
+        self.assertEqual(again.headers['ETag'], first.headers['ETag'])
+
+        revalidated = self.get('/', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.pages.stats.snapshot()['hits'], 2)
+
+    def test_writes_by_other_processes_change_the_key(self):
+        other = create_app(PageCacheConfig)
+        self.get('/')
+        self.get('/tags')
+        with other.test_client() as client:
+            client.post(f'/users/{self.user.id}/posts/new', data={'title': 'Elsewhere', 'content': 'c'})
+            client.post('/tags/new', data={'name': 'remote'})
+        self.assertIn('Elsewhere', self.get('/').get_data(as_text=True))
+        self.assertIn('remote', self.get('/tags').get_data(as_text=True))
+        self.assertEqual(self.renders, ['home.html', 'tags.html', 'home.html', 'tags.html'])
+
+    def test_write_routes_purge(self):
+        self.get('/')
+        self.get('/tags')
+        with self.app.test_client() as client:
+            client.post(f'/users/{self.user.id}/posts/new', data={'title': 'Purged', 'content': 'c'})
+            client.post('/tags/new', data={'name': 'fresh'})
+        self.assertIn('Purged', self.get('/').get_data(as_text=True))
+        self.assertIn('fresh', self.get('/tags').get_data(as_text=True))
+
+    def test_query_strings_cached_separately_and_purged_together(self):
+        db.session.add(Tag(name='alpha'))
+        db.session.commit()
+        self.get('/tags')
+        self.get('/tags?sort=popular')
+        self.assertEqual(self.renders, ['tags.html', 'tags.html'])
+        db.session.execute(db.update(Tag).values(name='beta', updated_at=Tag.updated_at))
+        db.session.commit()
+        self.assertNotIn('beta', self.get('/tags?sort=popular').get_data(as_text=True))
+        self.pages.purge('tags')
+        self.assertIn('beta', self.get('/tags').get_data(as_text=True))
+        self.assertIn('beta', self.get('/tags?sort=popular').get_data(as_text=True))
+
+    def test_stale_page_served_while_another_request_renders(self):
+        self.pages.ttl = 0.01
+        first = self.get('/')
+        time.sleep(0.02)
+        with self.app.test_request_context('/'):
+            key = self.pages.key('feed', make_etag(feed_version()))
+        self.assertTrue(self.pages.lock(key))
+        self.assertEqual(self.get('/').data, first.data)
+        self.assertEqual(self.renders, ['home.html'])
+
+        self.pages.unlock(key)
+        self.get('/')
+        self.assertEqual(self.renders, ['home.html', 'home.html'])
+
+    def test_concurrent_misses_render_once(self):
+        before_render_template.connect(lambda *args, **kwargs: time.sleep(0.2), self.app, weak=False)
+        responses = []
+
+        def fetch():
+            responses.append(self.get('/'))
+
+        threads = [threading.Thread(target=fetch) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.renders, ['home.html'])
+        self.assertEqual([resp.status_code for resp in responses], [200] * 5)
+        self.assertEqual(len({resp.data for resp in responses}), 1)
+
+    def test_flashed_pages_bypass_cache(self):
+        self.get('/')
+        with self.app.test_client() as client:
+            with client.session_transaction() as session:
+                session['_flashes'] = [('success', 'Saved')]
+            self.assertIn('Saved', client.get('/').get_data(as_text=True))
+        self.assertNotIn('Saved', self.get('/').get_data(as_text=True))
+        self.assertEqual(self.renders, ['home.html', 'home.html'])
+
+    def test_commands_change_the_key(self):
+        db.session.add(Tag(name='gone'))
+        db.session.commit()
+        self.assertIn('gone', self.get('/tags').get_data(as_text=True))
+        tag_id = db.session.execute(db.select(Tag.id)).scalar()
+        result = self.app.test_cli_runner().invoke(args=['delete-tags', str(tag_id)])
+        self.assertIn('Deleted 1 tags', result.output)
+        self.assertNotIn('gone', self.get('/tags').get_data(as_text=True))
+
+    def test_disabled_by_zero_ttl(self):
+        with app.test_client() as client:
+            client.get('/')
+            client.get('/')
+        self.assertEqual(app.extensions['page_cache'].stats.snapshot()['hits'], 0)
@@ -0,0 +1,120 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+import sqlite3
+
+from sqlalchemy import create_engine, event
+
+from app import create_app
+from config import TestingConfig, replica_options
+from models import db, User, Post, Tag, PostTag
+from replicas import ReplicaSet, STICKY_COOKIE
+
+REPLICA_PATH = os.path.join(tempfile.gettempdir(), 'blogly_test_replica.db')
+
+
+class ReplicaConfig(TestingConfig):
+    DATABASE_REPLICAS = replica_options([f'sqlite:///{REPLICA_PATH}'])
+    REPLICA_STICKY_SECONDS = 5
+
+
+app = create_app(ReplicaConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    replica_engine = app.extensions['replicas'].replicas[0].engine
+    db.metadata.drop_all(replica_engine)
+    db.metadata.create_all(replica_engine)
+
+
+class ReplicaRoutingTestCase(TestCase):
+    """Tests for sending reads to a replica, with a SQLite file standing in for one."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        PostTag.query.delete()
+        Post.query.delete()
+        Tag.query.delete()
+        User.query.delete()
+        user = User(first_name="Jane", last_name="Primary")
+        db.session.add(user)
+        db.session.commit()
+        with replica_engine.begin() as conn:
+            conn.execute(User.__table__.delete())
+            conn.execute(User.__table__.insert(), {'id': user.id, 'first_name': 'Jane', 'last_name': 'Replica',
+                                                   'image_url': '', 'updated_at': datetime.now(), 'post_count': 0})
+        app.extensions['replicas'].replicas[0].checked_at = None
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_get_reads_from_replica(self):
+        with app.test_client() as client:
+            html = client.get('/users').get_data(as_text=True)
+        self.assertIn('Jane Replica', html)
+        self.assertNotIn('Jane Primary', html)
+
+    def test_pool_gauges_labelled_by_engine(self):
+        with app.test_client() as client:
+            client.get('/users')
+            text = client.get('/metrics').get_data(as_text=True)
+        self.assertIn('blogly_db_pool_checked_out{engine="primary"}', text)
+        self.assertIn('blogly_db_pool_checked_out{engine="replica-0"}', text)
+
+    def test_writes_go_to_primary_and_stick(self):
+        with app.test_client() as client:
+            resp = client.post('/users/new', data={'first-name': 'New', 'last-name': 'Writer', 'image-url': ''})
+            self.assertIn(STICKY_COOKIE, resp.headers['Set-Cookie'])
+            self.assertIn('Max-Age=5', resp.headers['Set-Cookie'])
+            html = client.get('/users').get_data(as_text=True)
+            self.assertIn('New Writer', html)
+            self.assertIn('Jane Primary', html)
+        self.assertIsNotNone(db.session.execute(db.select(User).where(User.last_name == 'Writer')).scalar())
+
+    def test_replica_failing_mid_request_retries_on_primary(self):
+        def fail_once(cursor, statement, parameters, context):
+            event.remove(replica_engine, 'do_execute', fail_once)
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+
+        replicas = app.extensions['replicas']
+        self.assertTrue(replicas.is_healthy(replicas.replicas[0]))
+        event.listen(replica_engine, 'do_execute', fail_once)
+        with app.test_client() as client:
+            with self.assertLogs('blogly.replicas', level='WARNING'):
+                resp = client.get('/users')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('Jane Primary', resp.get_data(as_text=True))
+        self.assertFalse(replicas.is_up(replica_engine))
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        replicas = app.extensions['replicas']
+        replicas.mark_down(replica_engine)
+        with app.test_client() as client:
+            html = client.get('/users').get_data(as_text=True)
+        self.assertIn('Jane Primary', html)
+
+
+class ReplicaSetTestCase(TestCase):
+    """Tests for replica health checks."""
+
+    def test_unreachable_replica_is_skipped(self):
+        down = create_engine('postgresql://nobody@127.0.0.1:1/nowhere', connect_args={'connect_timeout': 1})
+        up = create_engine('sqlite://')
+        replicas = ReplicaSet([down, up], check_interval=60)
+        self.assertEqual({replicas.choose() for _ in range(4)}, {up})
+        self.assertIsNone(ReplicaSet([down]).choose())
+
+    def test_marked_down_until_next_check(self):
+        up = create_engine('sqlite://')
+        replicas = ReplicaSet([up], check_interval=60)
+        self.assertIs(replicas.choose(), up)
+        replicas.mark_down(up)
+        self.assertIsNone(replicas.choose())
+        replicas.check_interval = 0
+        self.assertIs(replicas.choose(), up)
@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from app import create_app
+from config import TestingConfig
+from models import db, User, Post, Tag, PostTag
+from search import search_posts, python_search, highlight
+
+app = create_app(TestingConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class SearchTestCase(TestCase):
+    """Tests for post search."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        PostTag.query.delete()
+        Post.query.delete()
+        Tag.query.delete()
+        User.query.delete()
+
+        user = User(first_name="Jane", last_name="Doe")
+        db.session.add(user)
+        db.session.add_all([
+            Post(title="Accessible gardens", content="Raised beds make gardening accessible.", user=user),
+            Post(title="Night shifts", content="Working nights with chronic pain <b>hurts</b>.", user=user),
+            Post(title="Holiday noise", content="Sensory overload at holiday parties.", user=user),
+        ] + [Post(title=f"Garden diary {i}", content="Notes from the garden.", user=user) for i in range(5)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_search_ranks_title_matches_first(self):
+        results = search_posts('accessible')
+        self.assertEqual([r.title for r in results], ["Accessible gardens"])
+        self.assertIn('<mark>', results.items[0].snippet)
+
+    def test_search_escapes_content(self):
+        results = search_posts('chronic pain')
+        self.assertEqual(len(results), 1)
+        self.assertNotIn('<b>', results.items[0].snippet)
+
+    def test_search_pages(self):
+        seen = []
+        page = search_posts('garden', limit=2)
+        while True:
+            seen.extend(r.id for r in page)
+            if not page.next_cursor:
+                break
+            page = search_posts('garden', after=page.next_cursor, limit=2)
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+        back = search_posts('garden', before=page.prev_cursor, limit=2)
+        self.assertEqual([r.id for r in back], seen[-4:-2])
+
+    def test_empty_query(self):
+        self.assertEqual(len(search_posts('  ')), 0)
+
+    def test_python_fallback(self):
+        rows, has_more = python_search('holiday', None, None, 10)
+        self.assertEqual([r.title for r in rows], ["Holiday noise"])
+        self.assertFalse(has_more)
+        self.assertIn('<mark>holiday</mark>', rows[0].snippet)
+
+    def test_highlight(self):
+        self.assertEqual(highlight('a \x02<b>\x03'), 'a <mark>&lt;b&gt;</mark>')
+
+    def test_search_route(self):
+        with app.test_client() as client:
+            resp = client.get('/search?q=holiday')
+            html = resp.get_data(as_text=True)
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('Holiday noise', html)
+            self.assertEqual(client.get('/search?q=holiday&after=bad').status_code, 400)
@@ -0,0 +1,54 @@
+from unittest import TestCase
+
+from app import create_app
+from config import TestingConfig
+from models import db, User, Post, Tag, PostTag
+from seed import batched
+
+app = create_app(TestingConfig)
+
+
+class SeedTestCase(TestCase):
+    """Tests for the seed command."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def count(self, model):
+        return db.session.execute(db.select(db.func.count()).select_from(model)).scalar()
+
+    def test_batched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_seed_synthetic(self):
+        result = app.test_cli_runner().invoke(args=['seed', '--users', '5', '--posts', '50', '--tags', '3', '--batch-size', '7'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('posts: 50 rows', result.output)
+        self.assertIn('rows/s', result.output)
+        self.assertEqual(self.count(User), 5)
+        self.assertEqual(self.count(Post), 50)
+        self.assertEqual(self.count(Tag), 3)
+        self.assertGreater(self.count(PostTag), 0)
+
+        user = User(first_name="After", last_name="Seed")
+        db.session.add(user)
+        db.session.commit()
+        self.assertEqual(user.id, 6)
+
+    def test_seed_sample(self):
+        result = app.test_cli_runner().invoke(args=['seed'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.count(User), 10)
+        self.assertEqual(self.count(PostTag), 20)
+        self.assertEqual(db.session.get(Post, 3).user.full_name, "Neacel Saraid")
+
+    def test_posts_need_users(self):
+        result = app.test_cli_runner().invoke(args=['seed', '--posts', '5'])
+        self.assertNotEqual(result.exit_code, 0)
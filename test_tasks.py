@@ -0,0 +1,171 @@
+from unittest import TestCase, mock
+from datetime import datetime, timedelta
+
+from app import create_app
+from config import TestingConfig
+from models import db, Job, User
+import tasks
+
+
+class DatabaseQueueConfig(TestingConfig):
+    TASK_QUEUE = 'database'
+    TASK_MAX_ATTEMPTS = 2
+    TASK_RETRY_DELAY = 0
+
+
+app = create_app(DatabaseQueueConfig)
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+calls = []
+
+
+@tasks.task
+def record(value):
+    calls.append(value)
+
+
+@tasks.task
+def flaky(value):
+    """fail the first time for each value"""
+    calls.append(value)
+    if calls.count(value) == 1:
+        raise RuntimeError('flaky')
+
+
+@tasks.task
+def broken():
+    raise RuntimeError('broken')
+
+
+class EagerQueueTestCase(TestCase):
+    """Tests for running tasks inline."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_inline_once_per_key(self):
+        with create_app(TestingConfig).app_context():
+            tasks.enqueue(record, 1, key='one')
+            tasks.enqueue(record, 1, key='one')
+            tasks.enqueue(record, 2)
+        self.assertEqual(calls, [1, 2])
+
+    def test_database_queue_needs_the_caches_of_tasks_shared(self):
+        config = type('Config', (TestingConfig,), {'TASK_QUEUE': 'database'})
+        self.assertIsInstance(create_app(config).extensions['tasks'], tasks.TableQueue)
+        with mock.patch.dict(tasks.TASKS):
+            @tasks.task(caches=('PAGE_CACHE_URL',))
+            def purge_pages():
+                pass
+
+            with self.assertRaisesRegex(RuntimeError, 'set PAGE_CACHE_URL to a redis://'):
+                create_app(config)
+
+    def test_worker_needs_database_queue(self):
+        result = create_app(TestingConfig).test_cli_runner().invoke(args=['worker', '--burst'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('TASK_QUEUE=database', result.output)
+
+
+class ThreadQueueTestCase(TestCase):
+    """Tests for the in-process thread pool."""
+
+    def setUp(self):
+        calls.clear()
+        self.queue = tasks.ThreadQueue(app, workers=2, max_attempts=3, delay=0)
+
+    def test_runs_and_retries(self):
+        self.queue.enqueue(record.task_name, ['a'])
+        self.queue.enqueue(flaky.task_name, ['b'])
+        self.queue.shutdown()
+        self.assertEqual(sorted(calls), ['a', 'b', 'b'])
+
+    def test_gives_up_after_max_attempts(self):
+        with self.assertLogs('blogly.tasks', 'ERROR') as logs:
+            self.queue.enqueue(broken.task_name, [])
+            self.queue.shutdown()
+        self.assertEqual(len(logs.records), 3)
+
+
+class TableQueueTestCase(TestCase):
+    """Tests for the durable queue in the jobs table and its worker."""
+
+    def setUp(self):
+        calls.clear()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        Job.query.delete()
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def work(self):
+        return app.test_cli_runner().invoke(args=['worker', '--burst']).output
+
+    def jobs(self):
+        db.session.expire_all()
+        return {job.name.rsplit('.', 1)[1]: job for job in Job.query.all()}
+
+    def test_enqueue_and_work(self):
+        tasks.enqueue(record, 'x', key='x')
+        tasks.enqueue(record, 'x', key='x')
+        self.assertEqual(Job.query.count(), 1)
+        self.assertEqual(calls, [])
+
+        self.assertIn('Ran 1 jobs: 1 succeeded, 0 failed', self.work())
+        self.assertEqual(calls, ['x'])
+        job = self.jobs()['record']
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+
+        tasks.enqueue(record, 'x', key='x')
+        self.assertIn('Ran 0 jobs', self.work())
+
+    def test_retries_then_fails(self):
+        tasks.enqueue(flaky, 'y')
+        tasks.enqueue(broken)
+        # with no retry delay the failed jobs are runnable again straight away
+        self.assertIn('Ran 4 jobs: 1 succeeded, 3 failed', self.work())
+        jobs = self.jobs()
+        self.assertEqual((jobs['flaky'].status, jobs['flaky'].attempts), ('done', 2))
+        self.assertEqual((jobs['broken'].status, jobs['broken'].attempts), ('failed', 2))
+        self.assertIn('RuntimeError: broken', jobs['broken'].last_error)
+
+    def test_purges_old_done_jobs(self):
+        tasks.enqueue(record, 'old')
+        tasks.enqueue(broken)
+        self.work()
+        db.session.execute(db.update(Job).values(finished_at=datetime.now() - timedelta(days=30)))
+        db.session.commit()
+        tasks.enqueue(record, 'new')
+        self.work()
+        app.extensions['tasks'].purge()
+        self.assertEqual([job.args for job in Job.query.order_by(Job.id)], [[], ['new']])
+
+    def test_deletes_queue_a_recount(self):
+        User.query.delete()
+        doomed, kept = User(first_name="Doomed", last_name="User"), User(first_name="Kept", last_name="User")
+        db.session.add_all([doomed, kept])
+        db.session.commit()
+        db.session.execute(db.update(User).where(User.id == kept.id).values(post_count=3))
+        db.session.commit()
+        with app.test_client() as client:
+            client.post(f'/users/{doomed.id}/delete')
+        self.assertEqual(self.jobs()['reconcile_post_counts'].status, 'queued')
+        self.assertIn('Ran 1 jobs: 1 succeeded', self.work())
+        self.assertEqual(db.session.get(User, kept.id).post_count, 0)
+
+    def test_reclaims_lost_jobs(self):
+        tasks.enqueue(record, 'z')
+        queue = app.extensions['tasks']
+        self.assertEqual(len(queue.claim()), 1)
+        self.assertEqual(queue.claim(), [])
+
+        db.session.execute(db.update(Job).values(locked_at=datetime.now() - timedelta(hours=1)))
+        db.session.commit()
+        self.assertIn('Ran 1 jobs: 1 succeeded', self.work())
+        self.assertEqual(self.jobs()['record'].attempts, 2)
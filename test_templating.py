@@ -0,0 +1,44 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+from app import create_app
+from config import TestingConfig
+import templating
+
+
+class TemplatingTestCase(TestCase):
+    """Tests for precompiled templates and the bytecode cache."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def make_app(self, **settings):
+        config = type('Config', (TestingConfig,), settings)
+        return create_app(config)
+
+    def test_auto_reload_off(self):
+        self.assertFalse(create_app(TestingConfig).jinja_env.auto_reload)
+
+    def test_precompiled_templates(self):
+        names = templating.compile_templates(create_app(TestingConfig), self.dir)
+        self.assertIn('base.html', names)
+        self.assertEqual(len(os.listdir(self.dir)), len(names))
+
+        app = self.make_app(TEMPLATE_PRECOMPILED_DIR=self.dir)
+        template = app.jinja_env.get_template('404.html')
+        self.assertTrue(template.filename.startswith(self.dir))
+        resp = app.test_client().get('/no-such-page')
+        self.assertEqual(resp.status_code, 404)
+        self.assertIn('<!DOCTYPE html>', resp.get_data(as_text=True))
+
+    def test_precompiled_dir_missing(self):
+        with self.assertRaises(RuntimeError):
+            self.make_app(TEMPLATE_PRECOMPILED_DIR=os.path.join(self.dir, 'missing'))
+
+    def test_bytecode_cache(self):
+        app = self.make_app(TEMPLATE_BYTECODE_CACHE_DIR=self.dir)
+        self.assertEqual(app.test_client().get('/no-such-page').status_code, 404)
+        self.assertTrue(os.listdir(self.dir))